@@ -0,0 +1,236 @@
+import os
+import math
+import time
+import heapq
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pipeline stages guarded by the controller
+STAGE_QUERY = "query"  # a whole process_query call
+STAGE_SQL = "sql"      # SQL generation
+STAGE_DB = "db"        # SQL execution
+STAGE_LLM = "llm"      # natural language answer
+
+# Lower value is admitted first
+PRIORITY_FAST = 0         # cached and fast-path answers
+PRIORITY_INTERACTIVE = 1  # a user waiting on /api/query
+PRIORITY_BACKGROUND = 2   # jobs and precomputation
+
+# Seconds a request may wait for admission before it is refused
+ADMISSION_DEADLINE = float(os.getenv("ADMISSION_DEADLINE", "10"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+# Size of the threadpool blocking pipeline calls and sync endpoints share, applied at startup
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+# Threads that may block waiting for a slot at once, across all stages; with the
+# query and LLM slots it must stay well below THREADPOOL_SIZE, waiters hold a thread
+ADMISSION_MAX_BLOCKED = int(os.getenv("ADMISSION_MAX_BLOCKED", "8"))
+
+DEFAULT_LIMITS = {
+    STAGE_QUERY: int(os.getenv("ADMISSION_MAX_INFLIGHT_QUERY", "16")),
+    STAGE_SQL: int(os.getenv("ADMISSION_MAX_INFLIGHT_SQL", "8")),
+    # Sized to a target's connection pool, see targets.py
+    STAGE_DB: int(os.getenv("ADMISSION_MAX_INFLIGHT_DB", os.getenv("TARGET_POOL_SIZE", "8"))),
+    STAGE_LLM: int(os.getenv("ADMISSION_MAX_INFLIGHT_LLM", "8")),
+}
+
+
+class OverloadedError(Exception):
+    """Raised when a stage refuses work; carries the suggested Retry-After"""
+    def __init__(self, stage: str, retry_after: float, reason: str):
+        super().__init__(f"Stage '{stage}' is overloaded: {reason}")
+        self.stage = stage
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class WaitBudget:
+    """Number of threads allowed to block in admission waits, shared by all stages"""
+    def __init__(self, limit: int = ADMISSION_MAX_BLOCKED):
+        self.limit = limit
+        self.waiting = 0
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.waiting >= self.limit
+
+    def take(self) -> bool:
+        """Count a thread about to block, False when the budget is used up"""
+        with self._lock:
+            if self.waiting >= self.limit:
+                return False
+            self.waiting += 1
+            return True
+
+    def give(self):
+        with self._lock:
+            self.waiting -= 1
+
+
+class Stage:
+    """
+    Concurrency limit for one pipeline stage with a bounded priority wait queue
+
+    Waiters are admitted in priority order. A waiter is refused right away
+    when the queue is full, when `budget` allows no more blocked threads,
+    or when the expected wait, estimated from the moving average service
+    time, would overrun its deadline.
+    """
+    def __init__(self, name: str, max_inflight: int, max_queue: int = ADMISSION_MAX_QUEUE,
+                 budget: Optional[WaitBudget] = None):
+        self.name = name
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.budget = budget
+        self.inflight = 0
+        self.avg_service_time = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def _expected_wait(self, priority: int) -> float:
+        """Expected time until a new waiter with `priority` gets a slot"""
+        ahead = sum(1 for waiter in self._waiters if waiter[0] <= priority)
+        return (ahead // self.max_inflight + 1) * self.avg_service_time
+
+    def _refuse(self, priority: int, deadline: Optional[float]):
+        """Raise OverloadedError if a new waiter cannot be admitted in time"""
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise OverloadedError(self.name, self._expected_wait(priority), "wait queue is full")
+        if self.budget is not None and self.budget.exhausted:
+            self.rejected += 1
+            raise OverloadedError(self.name, self._expected_wait(priority), "too many requests waiting")
+        expected = self._expected_wait(priority)
+        if deadline is not None and time.monotonic() + expected > deadline:
+            self.rejected += 1
+            raise OverloadedError(self.name, expected, "deadline would be missed")
+
+    def check(self, priority: int = PRIORITY_INTERACTIVE, deadline: Optional[float] = None):
+        """Non-blocking admission check, used before committing to a request"""
+        with self._cond:
+            if self.inflight < self.max_inflight and not self._waiters:
+                return
+            self._refuse(priority, deadline)
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, deadline: Optional[float] = None):
+        """
+        Take a slot, waiting in priority order if the stage is saturated
+
+        Raises:
+            OverloadedError: If no slot can be had before the deadline
+        """
+        with self._cond:
+            if self.inflight < self.max_inflight and not self._waiters:
+                self.inflight += 1
+                self.admitted += 1
+                return
+            self._refuse(priority, deadline)
+            if self.budget is not None and not self.budget.take():
+                self.rejected += 1
+                raise OverloadedError(self.name, self._expected_wait(priority), "too many requests waiting")
+
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while not (self._waiters[0] == ticket and self.inflight < self.max_inflight):
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        self.rejected += 1
+                        raise OverloadedError(self.name, self.avg_service_time, "timed out waiting")
+                    self._cond.wait(timeout)
+                heapq.heappop(self._waiters)
+                self.inflight += 1
+                self.admitted += 1
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                raise
+            finally:
+                if self.budget is not None:
+                    self.budget.give()
+                # The next waiter may be admissible as well
+                self._cond.notify_all()
+
+    def release(self, service_time: float):
+        """Give a slot back and fold its duration into the service time average"""
+        with self._cond:
+            self.inflight -= 1
+            self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * service_time
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, float]:
+        """Current counters, for the metrics endpoint"""
+        with self._cond:
+            return {
+                "inflight": self.inflight,
+                "max_inflight": self.max_inflight,
+                "queued": len(self._waiters),
+                "avg_service_time": round(self.avg_service_time, 4),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+class AdmissionController:
+    """
+    Per-stage admission control for the query pipeline
+
+    Waits block a threadpool thread, so the threads that may wait at once
+    are capped across all stages by `max_blocked`.
+    """
+    def __init__(self, limits: Dict[str, int] = None, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_blocked: int = ADMISSION_MAX_BLOCKED):
+        limits = limits or DEFAULT_LIMITS
+        self.budget = WaitBudget(max_blocked)
+        self.stages = {name: Stage(name, limit, max_queue, self.budget) for name, limit in limits.items()}
+        threads = limits.get(STAGE_QUERY, 0) + limits.get(STAGE_LLM, 0) + max_blocked
+        if threads >= THREADPOOL_SIZE:
+            logger.warning(f"Admission limits allow {threads} pipeline threads, "
+                           f"the threadpool only has {THREADPOOL_SIZE}")
+
+    def check(self, stage: str, priority: int = PRIORITY_INTERACTIVE,
+              deadline: Optional[float] = None):
+        """Raise OverloadedError if `stage` would refuse new work right now"""
+        self.stages[stage].check(priority, deadline)
+
+    @contextmanager
+    def admit(self, stage: str, priority: int = PRIORITY_INTERACTIVE,
+              deadline: Optional[float] = None):
+        """
+        Hold a slot of `stage` for the duration of the block
+
+        Raises:
+            OverloadedError: If no slot can be had before the deadline
+        """
+        guarded = self.stages[stage]
+        guarded.acquire(priority, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            guarded.release(time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Counters of every stage, and the threads blocked waiting"""
+        counters = {name: stage.snapshot() for name, stage in self.stages.items()}
+        counters["blocked_threads"] = {"waiting": self.budget.waiting, "max_waiting": self.budget.limit}
+        return counters
+
+
+def request_deadline(timeout: float = ADMISSION_DEADLINE) -> float:
+    """Absolute monotonic deadline for a request arriving now"""
+    return time.monotonic() + timeout
+
+
+# Shared by the HTTP handlers and the pipeline threads
+admission = AdmissionController()
@@ -0,0 +1,135 @@
+import os
+from decimal import Decimal
+from typing import Any, Optional
+
+# Results of up to this many rows and columns are answered with a template
+ANSWER_TEMPLATE_MAX_ROWS = int(os.getenv("ANSWER_TEMPLATE_MAX_ROWS", "5"))
+ANSWER_TEMPLATE_MAX_COLUMNS = int(os.getenv("ANSWER_TEMPLATE_MAX_COLUMNS", "3"))
+# Results of up to this many rows and columns get a short LLM answer, larger ones a full one
+ANSWER_SHORT_MAX_ROWS = int(os.getenv("ANSWER_SHORT_MAX_ROWS", "30"))
+ANSWER_SHORT_MAX_COLUMNS = int(os.getenv("ANSWER_SHORT_MAX_COLUMNS", "6"))
+# Longest text value a templated answer spells out
+TEMPLATE_MAX_VALUE_CHARS = 80
+
+TIER_TEMPLATE = "template"
+TIER_SHORT = "short"
+TIER_FULL = "full"
+
+
+def format_value(value: Any) -> str:
+    """Human readable form of a single result value"""
+    if value is None:
+        return "not set"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float):
+        return f"{value:,.2f}".rstrip("0").rstrip(".")
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+def column_label(column: str) -> str:
+    """Turn a column name such as total_users into 'total users'"""
+    return column.replace("_", " ").strip()
+
+
+def templated_answer(query: str, results: list) -> Optional[str]:
+    """
+    Deterministic answer for results too simple to need an LLM
+
+    Args:
+        query: The user's question
+        results: Result rows of the generated SQL
+
+    Returns:
+        str: The answer, or None if the results need a real explanation
+    """
+    if not results:
+        return "No data was found matching your question."
+    if len(results) == 1:
+        row = dict(results[0])
+        if len(row) == 1:
+            column, value = next(iter(row.items()))
+            return f"The {column_label(column)} is {format_value(value)}."
+        if all(_short(value) for value in row.values()):
+            parts = [f"{column_label(column)} {format_value(value)}" for column, value in row.items()]
+            return "The result is: " + ", ".join(parts) + "."
+    return tiny_table_answer(results)
+
+
+def _short(value: Any) -> bool:
+    return not isinstance(value, str) or len(value) <= TEMPLATE_MAX_VALUE_CHARS
+
+
+def tiny_table_answer(results: list) -> Optional[str]:
+    """
+    Deterministic answer for a handful of short rows, such as the vote
+    counts of a few candidates: each row is named by its first text
+    column and described by the others
+    """
+    if len(results) > ANSWER_TEMPLATE_MAX_ROWS:
+        return None
+    rows = [dict(row) for row in results]
+    columns = list(rows[0])
+    if len(columns) > ANSWER_TEMPLATE_MAX_COLUMNS or not all(_short(value) for row in rows for value in row.values()):
+        return None
+    label = next((column for column in columns if all(isinstance(row.get(column), str) for row in rows)), None)
+
+    def describe(row: dict) -> str:
+        details = ", ".join(
+            f"{column_label(column)} {format_value(row.get(column))}" for column in columns if column != label
+        )
+        if label is None:
+            return details
+        return f"{row[label]} ({details})" if details else row[label]
+
+    return f"There are {len(rows)} results: " + "; ".join(describe(row) for row in rows) + "."
+
+
+def answer_tier(results: list) -> str:
+    """
+    How much generation a result needs. Results templated_answer handles
+    need none; of the others, medium results get a short completion and
+    only large or wide ones the full completion.
+    """
+    if templated_answer("", results) is not None:
+        return TIER_TEMPLATE
+    width = max(len(dict(row)) for row in results[:ANSWER_SHORT_MAX_ROWS + 1])
+    if len(results) <= ANSWER_SHORT_MAX_ROWS and width <= ANSWER_SHORT_MAX_COLUMNS:
+        return TIER_SHORT
+    return TIER_FULL
+
+
+def compact_table(results: list, max_chars: int = 200) -> str:
+    """Results as a header line and one pipe separated line per row, for short prompts"""
+    columns = list(dict(results[0]))
+    lines = [" | ".join(columns)]
+    for row in results:
+        row = dict(row)
+        lines.append(" | ".join(format_value(row.get(column))[:max_chars] for column in columns))
+    return "\n".join(lines)
+
+
+def summarize_results(query: str, results: list, max_rows: int = 10) -> str:
+    """
+    Plain listing of the results, used when the LLM is unavailable
+
+    Args:
+        query: The user's question
+        results: Result rows of the generated SQL
+        max_rows: Number of rows spelled out before the rest are counted
+    """
+    answer = templated_answer(query, results)
+    if answer is not None:
+        return answer
+    lines = [f"I found {len(results):,} results for '{query}':"]
+    for row in results[:max_rows]:
+        lines.append("- " + ", ".join(
+            f"{column_label(column)}: {format_value(value)}" for column, value in dict(row).items()
+        ))
+    if len(results) > max_rows:
+        lines.append(f"...and {len(results) - max_rows:,} more.")
+    return "\n".join(lines)
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark of the JSON serializers on result rows shaped like the
+candidates table: Decimal budgets, timestamps, JSONB documents and long text.
+
+Usage:
+    python benchmark_serialization.py [rows] [repeat]
+"""
+import sys
+import json
+import timeit
+import datetime
+from decimal import Decimal
+
+from serialization import SERIALIZERS, column_header
+
+
+def sample_rows(count: int) -> list:
+    """Rows resembling a `SELECT * FROM candidates` result"""
+    created = datetime.datetime(2024, 1, 1, 9, 30)
+    return [
+        {
+            "id": i,
+            "name": f"Candidate {i}",
+            "party_affiliation": ["Progressive", "Conservative", "Green"][i % 3],
+            "campaign_budget": Decimal("1250000.50") + i,
+            "date_of_birth": datetime.date(1970, 1, 1) + datetime.timedelta(days=i),
+            "biography": "Long serving public official. " * 20,
+            "policy_positions": {"economy": "growth", "health": ["access", "cost"], "rank": i},
+            "social_media": {"twitter": f"@candidate{i}", "followers": i * 100},
+            "created_at": created + datetime.timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+
+
+def rows_payload(results: list) -> dict:
+    """Column-oriented payload, as built before pre-encoded headers"""
+    columns = list(results[0].keys()) if results else []
+    return {"count": len(results), "columns": columns,
+            "rows": [[row[column] for column in columns] for row in results]}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rows = sample_rows(count)
+    columns = list(rows[0].keys())
+
+    cases = {
+        "json.dumps(default=str), previous path": lambda: json.dumps(
+            rows_payload(rows), default=str, separators=(",", ":")
+        ),
+    }
+    for name, serializer_class in SERIALIZERS.items():
+        try:
+            serializer = serializer_class()
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+            continue
+        cases[f"{name}, payload dict"] = lambda s=serializer: s.dumps_str(rows_payload(rows))
+        cases[f"{name}, pre-encoded header"] = lambda s=serializer: (
+            f'{{"count":{len(rows)},{column_header(columns)},"rows":'
+            f'{s.dumps_str([list(row.values()) for row in rows])}}}'
+        )
+
+    print(f"{count} rows, best of {repeat} runs")
+    baseline = None
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=repeat))
+        baseline = baseline or best
+        print(f"  {name:<40} {best * 1000:8.2f} ms  {baseline / best:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
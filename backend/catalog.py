@@ -0,0 +1,212 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from cache import normalize_question
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between scheduled refreshes of every catalog answer
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "300"))
+# Minimum seconds between two refreshes, however often the data changes
+CATALOG_MIN_REFRESH_INTERVAL = float(os.getenv("CATALOG_MIN_REFRESH_INTERVAL", "10"))
+# Answers older than this are no longer served, even while a refresh runs
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", "1800"))
+# Extra catalog questions on top of the training examples, separated by "|"
+CATALOG_EXTRA_QUESTIONS = [
+    question.strip() for question in os.getenv("CATALOG_QUESTIONS", "").split("|") if question.strip()
+]
+
+_TABLE_REFERENCE = re.compile(r"\b(?:from|join)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+
+def tables_read(sql_query: str) -> FrozenSet[str]:
+    """Names of the tables a query reads from"""
+    return frozenset(name.lower() for name in _TABLE_REFERENCE.findall(sql_query or ""))
+
+
+class CatalogEntry:
+    """Precomputed answer of one catalog question"""
+    def __init__(self, question: str):
+        self.question = question
+        self.response: Optional[Dict[str, Any]] = None
+        # When the data of the answer was read, not when it was ready
+        self.computed_at = 0.0
+        self.tables: FrozenSet[str] = frozenset()
+        self.refreshing = False
+        self.error: Optional[str] = None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.computed_at
+
+    def store(self, response: Dict[str, Any], computed_at: float):
+        self.response = response
+        self.computed_at = computed_at
+        self.tables = tables_read(response.get("sql_query"))
+
+
+class QuestionCatalog:
+    """
+    Curated questions whose answers are computed ahead of time
+
+    A background task recomputes every answer each `refresh_interval`
+    seconds. A change to a table, reported through invalidate(table), only
+    records when the table last changed. An answer reading the table from
+    before that is rebuilt by `recount` on its next lookup; when `recount`
+    cannot, the stored answer is still served and recomputed in the
+    background, at most once per `min_refresh_interval`. Lookups also
+    schedule a refresh of answers older than `refresh_interval`.
+
+    Args:
+        compute: Blocking function producing the process_query response of a question
+        recount: Function rebuilding the response of a question from in-memory
+            data without the LLM, or returning None when it cannot
+        refresh_interval: Seconds after which an answer is refreshed
+        max_age: Seconds after which an answer is no longer served
+        min_refresh_interval: Seconds to wait after a refresh before the next one
+    """
+    def __init__(self, compute: Callable[[str], Dict[str, Any]],
+                 recount: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+                 refresh_interval: float = CATALOG_REFRESH_INTERVAL,
+                 max_age: float = CATALOG_MAX_AGE,
+                 min_refresh_interval: float = CATALOG_MIN_REFRESH_INTERVAL):
+        self.compute = compute
+        self.recount = recount
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.hits = 0
+        self.recounts = 0
+        # Monotonic time of the last change of each table, see invalidate
+        self.changed_at: Dict[str, float] = {}
+        self.entries: Dict[str, CatalogEntry] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def add_questions(self, questions: List[str]):
+        """Register questions; new ones are computed on the next refresh"""
+        for question in questions:
+            key = normalize_question(question)
+            if key not in self.entries:
+                self.entries[key] = CatalogEntry(question)
+        self._wakeup.set()
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Stored answer of a catalog question
+
+        Returns:
+            The process_query response, or None if the question is not in the
+            catalog or has no usable answer yet
+        """
+        entry = self.entries.get(normalize_question(question))
+        if entry is None or entry.response is None or entry.age > self.max_age:
+            return None
+        if self.is_stale(entry) and not self._recount(entry):
+            if entry.age > self.min_refresh_interval and not entry.refreshing:
+                asyncio.create_task(self.refresh(entry))
+        elif entry.age > self.refresh_interval and not entry.refreshing:
+            asyncio.create_task(self.refresh(entry))
+        self.hits += 1
+        return entry.response
+
+    def is_stale(self, entry: CatalogEntry) -> bool:
+        """Whether a table the answer reads changed after its data was read"""
+        return any(self.changed_at.get(table, 0.0) > entry.computed_at for table in entry.tables)
+
+    def _recount(self, entry: CatalogEntry) -> bool:
+        """Rebuild a stale answer with `recount`, True when it is current again"""
+        if self.recount is None:
+            return False
+        started = time.monotonic()
+        try:
+            response = self.recount(entry.question)
+        except Exception as e:
+            logger.error(f"Error recounting catalog question '{entry.question}': {str(e)}")
+            return False
+        if response is None:
+            return False
+        entry.store(response, started)
+        self.recounts += 1
+        return True
+
+    async def refresh(self, entry: CatalogEntry):
+        """Recompute one answer in the threadpool"""
+        if entry.refreshing:
+            return
+        entry.refreshing = True
+        started = time.monotonic()
+        try:
+            entry.store(await run_in_threadpool(self.compute, entry.question), started)
+            entry.error = None
+        except Exception as e:
+            logger.error(f"Error precomputing catalog question '{entry.question}': {str(e)}")
+            entry.error = str(e)
+        finally:
+            entry.refreshing = False
+
+    async def refresh_all(self):
+        """Recompute every answer, one at a time to keep the load low"""
+        for entry in list(self.entries.values()):
+            await self.refresh(entry)
+        logger.info(f"Refreshed {len(self.entries)} catalog answers")
+
+    def invalidate(self, table: Optional[str] = None):
+        """
+        Signal that the underlying data changed
+
+        With a table, only its change time is recorded, which is cheap
+        enough for every single change and safe from any thread; answers
+        reading it are checked on lookup. Without one, every answer is
+        recomputed as soon as min_refresh_interval allows, which must be
+        requested from the event loop thread.
+        """
+        if table is not None:
+            self.changed_at[table.lower()] = time.monotonic()
+            return
+        self._wakeup.set()
+
+    async def _run(self):
+        """Refresh on schedule or on invalidation until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            started = loop.time()
+            await self.refresh_all()
+            # Coalesce bursts of invalidations into one refresh
+            await asyncio.sleep(self.min_refresh_interval)
+            remaining = self.refresh_interval - (loop.time() - started)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Start the refresh task, must be called from the running event loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the refresh task"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Catalog counters, for the metrics endpoint"""
+        ready = [entry for entry in self.entries.values() if entry.response is not None]
+        return {
+            "questions": len(self.entries),
+            "ready": len(ready),
+            "hits": self.hits,
+            "stale": sum(self.is_stale(entry) for entry in ready),
+            "recounts": self.recounts,
+            "oldest_age": round(max((entry.age for entry in ready), default=0), 2),
+        }
@@ -0,0 +1,326 @@
+import os
+import zlib
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Compress responses at all
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+# Complete responses smaller than this are sent as is, compressing them costs more than it saves
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# Encodings offered, most preferred first; zstd and br need the zstandard and brotli packages
+COMPRESS_ENCODINGS = [name.strip() for name in os.getenv("COMPRESS_ENCODINGS", "zstd,br,gzip").split(",") if name.strip()]
+# Levels favouring speed, the data is compressed while the client waits
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("COMPRESS_ZSTD_LEVEL", "3"))
+# Complete responses larger than this are compressed off the event loop
+COMPRESS_THREAD_BYTES = int(os.getenv("COMPRESS_THREAD_BYTES", "262144"))
+
+# Media types that are already compressed
+INCOMPRESSIBLE_TYPES = (
+    "application/vnd.apache.parquet", "application/gzip", "application/zip",
+    "application/zstd", "image/", "video/", "audio/",
+)
+
+
+class Encoder(ABC):
+    """
+    Incremental compressor of one response body
+
+    flush() ends the current block so that everything passed to compress()
+    so far can be decoded by the client, which keeps streamed events from
+    waiting in the compressor for more data.
+    """
+    name = ""
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        """Compressed output of `data` ready so far"""
+
+    @abstractmethod
+    def flush(self) -> bytes:
+        """End the current block, making all input so far decodable"""
+
+    @abstractmethod
+    def finish(self) -> bytes:
+        """End the stream"""
+
+
+class GzipEncoder(Encoder):
+    """gzip through zlib, always available"""
+    name = "gzip"
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(Encoder):
+    """Brotli, smaller than gzip for JSON and text at similar speed"""
+    name = "br"
+
+    def __init__(self):
+        import brotli
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder(Encoder):
+    """Zstandard, the fastest of the three at a ratio close to Brotli"""
+    name = "zstd"
+
+    def __init__(self):
+        import zstandard
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+ENCODERS: Dict[str, Type[Encoder]] = {
+    "zstd": ZstdEncoder,
+    "br": BrotliEncoder,
+    "gzip": GzipEncoder,
+}
+
+
+def available_encodings(names: List[str] = COMPRESS_ENCODINGS) -> List[str]:
+    """The configured encodings whose library is installed, in order of preference"""
+    available = []
+    for name in names:
+        if name not in ENCODERS:
+            logger.warning(f"Ignoring unknown response encoding '{name}'")
+            continue
+        try:
+            ENCODERS[name]()
+        except ImportError:
+            continue
+        available.append(name)
+    return available
+
+
+def negotiate(accept_encoding: str, offered: List[str]) -> Optional[str]:
+    """
+    Encoding to use for a request's Accept-Encoding header
+
+    The client's quality values decide, ties go to the server's order of
+    preference; None when the client accepts none of the offered ones.
+    """
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    best, best_quality = None, 0.0
+    for name in offered:
+        quality = qualities.get(name, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+class CompressionStats:
+    """Bytes before and after compression per encoding, for the metrics endpoint"""
+    def __init__(self):
+        self.encodings: Dict[str, Dict[str, int]] = {}
+        self.skipped_small = 0
+        self._lock = threading.Lock()
+
+    def record(self, encoding: str, raw_bytes: int, sent_bytes: int, streamed: bool):
+        with self._lock:
+            stats = self.encodings.setdefault(
+                encoding, {"responses": 0, "streamed": 0, "raw_bytes": 0, "sent_bytes": 0}
+            )
+            stats["responses"] += 1
+            stats["streamed"] += streamed
+            stats["raw_bytes"] += raw_bytes
+            stats["sent_bytes"] += sent_bytes
+
+    def skip(self):
+        with self._lock:
+            self.skipped_small += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": COMPRESSION_ENABLED,
+                "skipped_small": self.skipped_small,
+                "encodings": {
+                    name: {**stats, "ratio": round(stats["sent_bytes"] / stats["raw_bytes"], 4) if stats["raw_bytes"] else None}
+                    for name, stats in self.encodings.items()
+                },
+            }
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies in the encoding a client
+    negotiates through Accept-Encoding
+
+    A response sent in one piece, such as a JSON result, is compressed
+    whole when it reaches `minimum_size` bytes. A streamed response, such
+    as an SSE stream or an export, is compressed write by write, each write
+    ending on a flush boundary so the client decodes every event as soon
+    as it is sent. Responses that are already encoded, already compressed
+    media or marked no-transform pass through untouched.
+    """
+    def __init__(self, app: Callable[..., Awaitable[None]], minimum_size: int = COMPRESS_MIN_BYTES,
+                 encodings: Optional[List[str]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings(COMPRESS_ENCODINGS if encodings is None else encodings)
+        self.stats = compression_stats
+        logger.info(f"Compressing responses with: {', '.join(self.encodings) or 'nothing'}")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(_header(scope.get("headers", []), b"accept-encoding") or "", self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(send, encoding, self.minimum_size, self.stats)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    """The send side of one compressed response"""
+    def __init__(self, send, encoding: str, minimum_size: int, stats: CompressionStats):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.stats = stats
+        self.start: Optional[dict] = None
+        self.encoder: Optional[Encoder] = None
+        self.passthrough = False
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+
+    async def send(self, message: dict):
+        if self.passthrough:
+            await self._send(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.passthrough = not self._compressible(message.get("headers", []))
+            if self.passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            if not more_body:
+                await self._send_whole(body)
+                return
+            await self._start_stream()
+        self.raw_bytes += len(body)
+        data = self.encoder.compress(body) if body else b""
+        if more_body:
+            data += self.encoder.flush() if body else b""
+            if not data:
+                return
+        else:
+            data += self.encoder.finish()
+            self.stats.record(self.encoding, self.raw_bytes, self.sent_bytes + len(data), streamed=True)
+        self.sent_bytes += len(data)
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _compressible(self, headers: List[Tuple[bytes, bytes]]) -> bool:
+        if _header(headers, b"content-encoding") is not None:
+            return False
+        if "no-transform" in (_header(headers, b"cache-control") or "").lower():
+            return False
+        content_type = (_header(headers, b"content-type") or "").lower()
+        if content_type.startswith(INCOMPRESSIBLE_TYPES):
+            return False
+        length = _header(headers, b"content-length")
+        return length is None or int(length) >= self.minimum_size
+
+    def _headers(self, content_length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        headers = [(key, value) for key, value in self.start.get("headers", [])
+                   if key.lower() not in (b"content-length", b"content-encoding")]
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        vary = _header(headers, b"vary")
+        if vary is None:
+            headers.append((b"vary", b"Accept-Encoding"))
+        elif "accept-encoding" not in vary.lower():
+            headers = [(key, value) for key, value in headers if key.lower() != b"vary"]
+            headers.append((b"vary", f"{vary}, Accept-Encoding".encode("latin-1")))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return headers
+
+    async def _send_whole(self, body: bytes):
+        if len(body) < self.minimum_size:
+            self.stats.skip()
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": body, "more_body": False})
+            return
+        encoder = ENCODERS[self.encoding]()
+        compress = lambda: encoder.compress(body) + encoder.finish()
+        if len(body) > COMPRESS_THREAD_BYTES:
+            data = await asyncio.get_running_loop().run_in_executor(None, compress)
+        else:
+            data = compress()
+        self.stats.record(self.encoding, len(body), len(data), streamed=False)
+        await self._send({**self.start, "headers": self._headers(len(data))})
+        await self._send({"type": "http.response.body", "body": data, "more_body": False})
+
+    async def _start_stream(self):
+        self.encoder = ENCODERS[self.encoding]()
+        await self._send({**self.start, "headers": self._headers(None)})
@@ -1,9 +1,7 @@
 import os
 import logging
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_exponential
+from resilience import retry_call, db_breaker, DB_RETRY_POLICY, DB_CONNECT_TIMEOUT
 
 # Load environment variables
 load_dotenv()
@@ -21,32 +19,71 @@ DB_PARAMS = {
     'port': os.getenv('DB_PORT', '5432')
 }
 
+# Schema used when the database cannot be introspected
+FALLBACK_SCHEMA_DDL = """
+CREATE TABLE users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE candidates (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    constituency VARCHAR(100) NOT NULL,
+    state VARCHAR(100) NOT NULL,
+    party_affiliation VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE votes (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    candidate_id INTEGER REFERENCES candidates(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(user_id)
+);
+"""
+
 
 def get_connection_string():
     """Get PostgreSQL connection string"""
     return f"postgresql://{DB_PARAMS['user']}:{DB_PARAMS['password']}@{DB_PARAMS['host']}:{DB_PARAMS['port']}/{DB_PARAMS['dbname']}"
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 def get_db_connection():
-    """Get a database connection with retry logic"""
+    """Get a database connection, retrying briefly and failing fast while Postgres is down"""
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
     try:
-        return psycopg2.connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+        return retry_call(
+            psycopg2.connect, DB_RETRY_POLICY, db_breaker(),
+            **DB_PARAMS, cursor_factory=RealDictCursor, connect_timeout=DB_CONNECT_TIMEOUT
+        )
     except Exception as e:
         logger.error(f"Error connecting to database: {str(e)}")
         raise
 
 
-def get_db_schema():
-    """Get the database schema"""
+def get_db_schema(connect=None):
+    """
+    Get the database schema
+
+    Args:
+        connect: Callable returning a connection context, the default
+            database when omitted (see targets.py for other databases)
+    """
     try:
-        with get_db_connection() as conn:
+        with (connect or get_db_connection)() as conn:
             with conn.cursor() as cur:
-                # Get list of tables
+                # Get list of tables; partitions are reached through their parent table
                 cur.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public'
+                    SELECT t.table_name
+                    FROM information_schema.tables t
+                    JOIN pg_class c ON c.relname = t.table_name
+                    JOIN pg_namespace n ON n.oid = c.relnamespace AND n.nspname = t.table_schema
+                    WHERE t.table_schema = 'public' AND NOT c.relispartition
                 """)
                 tables = [row['table_name'] for row in cur.fetchall()]
                 
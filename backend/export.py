@@ -0,0 +1,280 @@
+import os
+import json
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from db_utils import get_db_connection
+from admission import admission, STAGE_DB, PRIORITY_BACKGROUND
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bytes collected before a chunk is handed to the response
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", "65536"))
+# Chunks buffered ahead of a slow client before the database read pauses
+EXPORT_QUEUE_CHUNKS = int(os.getenv("EXPORT_QUEUE_CHUNKS", "16"))
+# Rows per Arrow record batch / Parquet row group
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+
+# Media type and file extension of every format
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+# Arrow type names of the Postgres builtin type OIDs; any other type is exported as text
+ARROW_TYPES = {
+    16: "bool", 20: "int64", 21: "int16", 23: "int32", 26: "int64",
+    700: "float32", 701: "float64",
+    # numeric precision and scale vary from row to row
+    1700: "float64",
+    1082: "date32", 1083: "time64", 1114: "timestamp", 1184: "timestamptz",
+    17: "binary", 114: "json", 3802: "json",
+}
+
+
+class ExportCancelled(Exception):
+    """Raised inside the database read when the client went away"""
+
+
+class ChunkWriter:
+    """
+    File-like sink handing written data to the response in large chunks
+
+    Writes block while the client is EXPORT_QUEUE_CHUNKS behind, so the
+    database read proceeds at the pace of the client.
+    """
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event,
+                 chunk_bytes: int = EXPORT_CHUNK_BYTES):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.chunk_bytes = chunk_bytes
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self.closed = False
+
+    def put(self, item):
+        """Hand one item to the response, raising ExportCancelled if it went away"""
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise ExportCancelled()
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer += data
+        self.bytes_written += len(data)
+        if len(self._buffer) >= self.chunk_bytes:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self.put(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    # pyarrow.PythonFile probes these
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def close(self):
+        self.closed = True
+
+
+def _subquery(sql_query: str) -> str:
+    """Generated SQL without the trailing semicolon, usable as a subquery"""
+    return sql_query.strip().rstrip(";").strip()
+
+
+def copy_csv(sql_query: str, sink: ChunkWriter, connect: Callable = get_db_connection):
+    """CSV with a header row, produced entirely by Postgres COPY"""
+    with connect() as conn:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY ({_subquery(sql_query)}) TO STDOUT WITH (FORMAT csv, HEADER true)", sink
+            )
+
+
+def copy_ndjson(sql_query: str, sink: ChunkWriter, connect: Callable = get_db_connection):
+    """
+    One JSON object per line, produced entirely by Postgres COPY
+
+    row_to_json escapes every control character, so using \\x01 and \\x02 as
+    the CSV quote and delimiter makes COPY emit the JSON text untouched.
+    """
+    with connect() as conn:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY (SELECT row_to_json(t) FROM ({_subquery(sql_query)}) t) "
+                "TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')", sink
+            )
+
+
+def _arrow_column(type_code: int) -> Tuple[Any, Optional[Callable[[Any], Any]]]:
+    """Arrow type of a result column by its Postgres type OID, and the conversion its values need"""
+    import pyarrow as pa
+
+    name = ARROW_TYPES.get(type_code)
+    if name == "float64":
+        return pa.float64(), float
+    if name == "time64":
+        return pa.time64("us"), None
+    if name == "timestamp":
+        return pa.timestamp("us"), None
+    if name == "timestamptz":
+        return pa.timestamp("us", tz="UTC"), None
+    if name == "binary":
+        return pa.binary(), bytes
+    if name == "json":
+        return pa.string(), json.dumps
+    if name is None:
+        return pa.string(), str
+    return getattr(pa, name)(), None
+
+
+def _record_batches(sql_query: str, connect: Callable = get_db_connection,
+                    batch_rows: int = EXPORT_BATCH_ROWS):
+    """
+    Arrow record batches of the results, read through a server-side cursor
+
+    COPY has no Arrow output, so rows are fetched as plain tuples in
+    batches and converted column by column. The schema comes from the
+    column types Postgres reports, so every batch has the same one however
+    its values look, such as a column that starts out all NULL.
+    """
+    import pyarrow as pa
+    import psycopg2.extensions
+
+    with connect() as conn:
+        with conn.cursor(name="votebank_export", cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.itersize = batch_rows
+            cur.execute(sql_query)
+            rows = cur.fetchmany(batch_rows)
+            columns = [_arrow_column(column.type_code) for column in cur.description]
+            schema = pa.schema([(column.name, arrow_type) for column, (arrow_type, _) in zip(cur.description, columns)])
+            while True:
+                values = list(zip(*rows)) if rows else [[] for _ in columns]
+                arrays = []
+                for column, (arrow_type, convert) in zip(values, columns):
+                    if convert is not None:
+                        column = [None if value is None else convert(value) for value in column]
+                    arrays.append(pa.array(column, type=arrow_type))
+                batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+                yield batch
+                if len(rows) < batch_rows:
+                    return
+                rows = cur.fetchmany(batch_rows)
+
+
+def write_arrow(sql_query: str, sink: ChunkWriter, connect: Callable = get_db_connection):
+    """Arrow IPC stream, one record batch per EXPORT_BATCH_ROWS rows"""
+    import pyarrow as pa
+
+    writer = None
+    for batch in _record_batches(sql_query, connect):
+        if writer is None:
+            writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), batch.schema)
+        if batch.num_rows:
+            writer.write_batch(batch)
+    writer.close()
+
+
+def write_parquet(sql_query: str, sink: ChunkWriter, connect: Callable = get_db_connection):
+    """Parquet file, one row group per EXPORT_BATCH_ROWS rows"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    for batch in _record_batches(sql_query, connect):
+        if writer is None:
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), batch.schema)
+        if batch.num_rows:
+            writer.write_batch(batch)
+    writer.close()
+
+
+EXPORTERS: Dict[str, Callable[[str, ChunkWriter, Callable], None]] = {
+    "csv": copy_csv,
+    "ndjson": copy_ndjson,
+    "arrow": write_arrow,
+    "parquet": write_parquet,
+}
+
+
+def available_formats() -> List[str]:
+    """Export formats usable with the installed packages"""
+    try:
+        import pyarrow  # noqa: F401
+        return list(FORMATS)
+    except ImportError:
+        return ["csv", "ndjson"]
+
+
+def stream_export(sql_query: str, fmt: str, priority: int = PRIORITY_BACKGROUND,
+                  deadline: Optional[float] = None,
+                  connect: Callable = get_db_connection) -> Iterator[bytes]:
+    """
+    Run `sql_query` and iterate over its results encoded as `fmt`
+
+    The database read runs on its own thread under a DB admission slot and
+    pushes chunks through a bounded queue. Closing the iterator early, as
+    Starlette does when the client disconnects, aborts the read. `connect`
+    opens the connection, the default database unless a target's is given.
+
+    Raises:
+        ValueError: If the format is unknown or its packages are not installed
+    """
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format '{fmt}', use one of: {', '.join(available_formats())}")
+    return _export_chunks(sql_query, fmt, priority, deadline, connect)
+
+
+def _export_chunks(sql_query: str, fmt: str, priority: int,
+                   deadline: Optional[float], connect: Callable) -> Iterator[bytes]:
+    """Generator behind stream_export, the read starts on the first chunk requested"""
+    chunks = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    done = object()
+
+    def produce():
+        sink = ChunkWriter(chunks, cancelled)
+        try:
+            with admission.admit(STAGE_DB, priority, deadline):
+                EXPORTERS[fmt](sql_query, sink, connect)
+                sink.flush()
+            logger.info(f"Exported {sink.bytes_written} bytes as {fmt}")
+            sink.put(done)
+        except ExportCancelled:
+            logger.info(f"Export as {fmt} cancelled after {sink.bytes_written} bytes")
+        except Exception as e:
+            logger.error(f"Error exporting results as {fmt}: {str(e)}")
+            try:
+                sink.put(e)
+            except ExportCancelled:
+                pass
+
+    thread = threading.Thread(target=produce, name=f"export-{fmt}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
@@ -0,0 +1,395 @@
+import os
+import re
+import logging
+import threading
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import TTLCache
+from schema_pruning import stem
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Answer follow-up questions from the previous result of the same session
+FOLLOWUPS_ENABLED = os.getenv("FOLLOWUPS_ENABLED", "1") == "1"
+# Results larger than this are not retained
+FOLLOWUP_MAX_ROWS = int(os.getenv("FOLLOWUP_MAX_ROWS", "10000"))
+FOLLOWUP_MAX_SESSIONS = int(os.getenv("FOLLOWUP_MAX_SESSIONS", "1024"))
+# Seconds a session's last result is kept
+FOLLOWUP_SESSION_TTL = float(os.getenv("FOLLOWUP_SESSION_TTL", "1800"))
+# Longer questions are treated as new questions
+FOLLOWUP_MAX_WORDS = int(os.getenv("FOLLOWUP_MAX_WORDS", "12"))
+
+# A follow-up starts with one of these words or refers back to the result
+FOLLOWUP_LEADS = {
+    "only", "just", "now", "and", "but", "sort", "order", "group", "filter", "exclude", "except",
+    "without", "top", "bottom", "first", "last", "limit", "ascending", "descending", "reverse", "per",
+}
+FOLLOWUP_REFERENCES = ("those", "them", "these", "the results", "that list", "this list", "the same")
+
+_DESCENDING = {"descending", "desc", "highest", "most", "largest", "biggest", "top", "decreasing"}
+_ASCENDING = {"ascending", "asc", "lowest", "least", "smallest", "fewest", "bottom", "increasing", "alphabetically"}
+_NEGATIONS = ("exclude", "excluding", "except", "without", "not", "other than", "apart from")
+_COMPARISONS = [
+    (r"(?:more|greater) than|over|above|exceeding", ">"),
+    (r"at least|no less than|minimum of", ">="),
+    (r"(?:less|fewer) than|under|below", "<"),
+    (r"at most|no more than|maximum of", "<="),
+]
+# Words of the follow-up language itself; every other word must name a column or value
+FOLLOWUP_WORDS = FOLLOWUP_LEADS | _DESCENDING | _ASCENDING | {
+    "excluding", "not", "other", "than", "apart", "from", "more", "greater", "over", "above", "exceeding",
+    "at", "least", "no", "less", "fewer", "under", "below", "maximum", "minimum", "of", "sorted", "ordered",
+    "rank", "ranked", "by", "grouped", "for", "each", "break", "breakdown", "total", "totals", "to",
+    "them", "it", "those", "these", "results", "result", "rows", "ones", "that", "this", "list", "the",
+    "same", "show", "me", "in", "with", "a", "an", "is", "are", "please", "instead", "then", "give",
+}
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_BY = re.compile(r"\bby\s+([a-z0-9_]+)")
+_GROUP = re.compile(r"\b(?:group(?:ed)?\s+by|per|for\s+each|break(?:down)?\s+by|totals?\s+by)\s+([a-z0-9_]+)")
+_LIMIT = re.compile(r"\b(top|first|bottom|last|limit(?:\s+to)?)\s+(\d+)\b")
+_SORT = re.compile(r"\b(?:sort|sorted|order|ordered|rank|ranked)\b(?:\s+(?:them|it|those|these|results))?(?:\s+by\s+([a-z0-9_]+))?")
+
+
+class ResultFrame:
+    """
+    A result set held column by column
+
+    Numeric columns become int64 or float64 arrays (Decimals as floats,
+    NULLs as NaN), everything else an object array, so follow-ups filter,
+    sort and aggregate with array operations instead of per row Python.
+    """
+    def __init__(self, columns: List[str], arrays: Dict[str, np.ndarray], question: str,
+                 sql: str, target_id: Optional[str] = None):
+        self.columns = columns
+        self.arrays = arrays
+        self.question = question
+        self.sql = sql
+        self.target_id = target_id
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], question: str, sql: str,
+                  target_id: Optional[str] = None) -> "ResultFrame":
+        columns = list(rows[0].keys()) if rows else []
+        arrays = {column: column_array([row[column] for row in rows]) for column in columns}
+        return cls(columns, arrays, question, sql, target_id)
+
+    def __len__(self) -> int:
+        return len(self.arrays[self.columns[0]]) if self.columns else 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def is_numeric(self, column: str) -> bool:
+        return self.arrays[column].dtype.kind in "if"
+
+    def take(self, index: np.ndarray) -> "ResultFrame":
+        """Frame of the rows at `index` (positions or a boolean mask)"""
+        arrays = {column: array[index] for column, array in self.arrays.items()}
+        return ResultFrame(self.columns, arrays, self.question, self.sql, self.target_id)
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """Rows as dicts of plain Python values, NaN back to None"""
+        values = {}
+        for column, array in self.arrays.items():
+            items = array.tolist()
+            if array.dtype.kind == "f":
+                items = [None if item != item else item for item in items]
+            values[column] = items
+        return [{column: values[column][i] for column in self.columns} for i in range(len(self))]
+
+
+def column_array(values: List[Any]) -> np.ndarray:
+    """Compact array of one column's values"""
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        if len(present) == len(values):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    if present and all(isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) for value in present):
+        return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _quote_literal(value: Any) -> str:
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def looks_like_followup(question: str) -> bool:
+    """Whether a question reads as a refinement of the previous one"""
+    q = question.lower().strip()
+    words = re.findall(r"[a-z0-9_]+", q)
+    if not words or len(words) > FOLLOWUP_MAX_WORDS:
+        return False
+    return words[0] in FOLLOWUP_LEADS or any(reference in q for reference in FOLLOWUP_REFERENCES)
+
+
+def _column_for(frame: ResultFrame, word: str, numeric: Optional[bool] = None) -> Optional[str]:
+    """Column named by a question word, 'votes' naming vote_count"""
+    target = stem(word)
+    for column in frame.columns:
+        if numeric is not None and frame.is_numeric(column) != numeric:
+            continue
+        parts = [stem(part) for part in column.lower().split("_") if part and part != "id"]
+        if target in parts or target == stem(column.lower()):
+            return column
+    return None
+
+
+def _mentioned_column(frame: ResultFrame, words: List[str], numeric: Optional[bool] = None) -> Optional[str]:
+    for word in words:
+        column = _column_for(frame, word, numeric)
+        if column is not None:
+            return column
+    return None
+
+
+def _measure(frame: ResultFrame, words: List[str]) -> Optional[str]:
+    """Numeric column a question refers to, or the only non-id numeric column"""
+    column = _mentioned_column(frame, words, numeric=True)
+    if column is not None:
+        return column
+    measures = [c for c in frame.columns if frame.is_numeric(c) and c != "id" and not c.endswith("_id")]
+    return measures[0] if measures else None
+
+
+def _lowered(array: np.ndarray) -> np.ndarray:
+    return np.char.lower(array.astype(str))
+
+
+class FollowUpPlan:
+    """Operations a follow-up applies to the previous result, in SQL order"""
+    def __init__(self):
+        self.filters: List[Tuple[str, str, Any]] = []
+        self.group: Optional[str] = None
+        self.sort: Optional[Tuple[str, bool]] = None
+        self.limit: Optional[int] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.filters or self.group or self.sort or self.limit)
+
+    def apply(self, frame: ResultFrame) -> ResultFrame:
+        """Run the plan on a frame with NumPy"""
+        mask = np.ones(len(frame), dtype=bool)
+        for column, op, value in self.filters:
+            array = frame.arrays[column]
+            if op in ("in", "not in"):
+                hit = np.isin(_lowered(array), value)
+                mask &= hit if op == "in" else ~hit
+            else:
+                with np.errstate(invalid="ignore"):
+                    mask &= {">": np.greater, ">=": np.greater_equal,
+                             "<": np.less, "<=": np.less_equal}[op](array, value)
+        frame = frame.take(mask)
+
+        if self.group is not None:
+            keys = _lowered(frame.arrays[self.group])
+            _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            arrays = {self.group: frame.arrays[self.group][first], "count": np.bincount(inverse)}
+            for column in self._sums(frame):
+                sums = np.bincount(inverse, weights=np.nan_to_num(frame.arrays[column]), minlength=len(first))
+                arrays[column] = sums.astype(frame.arrays[column].dtype)
+            frame = ResultFrame(list(arrays), arrays, frame.question, frame.sql, frame.target_id)
+
+        if self.sort is not None:
+            column, descending = self.sort
+            array = frame.arrays[column]
+            if frame.is_numeric(column):
+                order = np.argsort(-array if descending else array, kind="stable")
+            else:
+                order = np.argsort(_lowered(array), kind="stable")
+                order = order[::-1] if descending else order
+            frame = frame.take(order)
+
+        if self.limit is not None:
+            frame = frame.take(np.arange(min(self.limit, len(frame))))
+        return frame
+
+    def _sums(self, frame: ResultFrame) -> List[str]:
+        return [column for column in frame.columns if column != self.group and frame.is_numeric(column)
+                and column != "id" and not column.endswith("_id") and column != "count"]
+
+    def to_sql(self, frame: ResultFrame) -> str:
+        """SQL computing the same rows from the previous query"""
+        conditions = []
+        for column, op, value in self.filters:
+            if op in ("in", "not in"):
+                values = ", ".join(_quote_literal(v) for v in value)
+                conditions.append(f"lower({_quote_identifier(column)}::text) {op.upper()} ({values})")
+            else:
+                conditions.append(f"{_quote_identifier(column)} {op} {_quote_literal(value)}")
+        select = "*"
+        if self.group is not None:
+            group = _quote_identifier(self.group)
+            sums = [f"SUM({_quote_identifier(c)}) AS {_quote_identifier(c)}" for c in self._sums(frame)]
+            select = ", ".join([group, "COUNT(*) AS count"] + sums)
+        sql = f"SELECT {select}\nFROM (\n{frame.sql.strip()}\n) AS previous"
+        if conditions:
+            sql += "\nWHERE " + " AND ".join(conditions)
+        if self.group is not None:
+            sql += f"\nGROUP BY {_quote_identifier(self.group)}"
+        if self.sort is not None:
+            sql += f"\nORDER BY {_quote_identifier(self.sort[0])} {'DESC' if self.sort[1] else 'ASC'}"
+        if self.limit is not None:
+            sql += f"\nLIMIT {self.limit}"
+        return sql
+
+
+def plan_followup(question: str, frame: ResultFrame) -> Optional[FollowUpPlan]:
+    """
+    Operations a follow-up question asks for on the previous result
+
+    Returns:
+        FollowUpPlan, or None when the question is not a follow-up or needs
+        data the previous result does not have
+    """
+    if not frame.columns or not looks_like_followup(question):
+        return None
+    q = question.lower()
+    words = re.findall(r"[a-z0-9_]+", q)
+    plan = FollowUpPlan()
+
+    # Rows whose text values the question names: "only for Progressive"
+    negated = any(re.search(rf"\b{negation}\b", q) for negation in _NEGATIONS)
+    for column in frame.columns:
+        if frame.is_numeric(column):
+            continue
+        values = [value for value in np.unique(_lowered(frame.arrays[column]))
+                  if len(value) > 1 and value != "none" and re.search(rf"\b{re.escape(value)}\b", q)]
+        if values:
+            plan.filters.append((column, "not in" if negated else "in", values))
+
+    for pattern, op in _COMPARISONS:
+        match = re.search(rf"\b(?:{pattern})\s+(\d+(?:\.\d+)?)", q)
+        if match:
+            column = _measure(frame, words)
+            if column is None:
+                return None
+            number = float(match.group(1))
+            plan.filters.append((column, op, int(number) if number.is_integer() else number))
+
+    group = _GROUP.search(q)
+    if group:
+        column = _column_for(frame, group.group(1), numeric=False)
+        if column is None:
+            return None
+        plan.group = column
+
+    # Sorting applies to the grouped columns, taken from a run of the plan on no rows
+    result_columns = frame if plan.group is None else plan.apply(frame.take(np.arange(0)))
+    if not _accounted_for(words, frame, result_columns, plan):
+        return None
+    sort = _SORT.search(q)
+    direction = {w for w in words if w in _DESCENDING | _ASCENDING}
+    limit = _LIMIT.search(q)
+    if sort or direction or limit:
+        if sort and sort.group(1):
+            column = _column_for(result_columns, sort.group(1))
+            if column is None:
+                # Sorting by something the result does not have needs new data
+                return None
+        else:
+            column = _mentioned_column(result_columns, words) if sort else None
+            column = column or _measure(result_columns, words)
+        if column is not None:
+            # "lowest" outweighs the "top" of "top 3 lowest"
+            explicit = direction - {"top", "bottom"} or direction
+            if explicit:
+                descending = bool(explicit & _DESCENDING)
+            else:
+                descending = result_columns.is_numeric(column) and not (limit and limit.group(1) == "last")
+            plan.sort = (column, descending)
+    if limit:
+        plan.limit = int(limit.group(2))
+    return plan or None
+
+
+def _accounted_for(words: List[str], frame: ResultFrame, result_columns: ResultFrame,
+                   plan: FollowUpPlan) -> bool:
+    """
+    Whether every word of a follow-up is an operation word, a word of the
+    previous question, a column, or part of a value the plan filters on
+
+    Anything else, such as "Maharashtra" after a Delhi leaderboard or a
+    "by criminal record" the result has no column for, needs new data.
+    """
+    columns = lambda word: _column_for(frame, word) or _column_for(result_columns, word)
+    for match in _BY.finditer(" ".join(words)):
+        if match.group(1) not in ("the", "a") and columns(match.group(1)) is None:
+            return False
+    known = set(re.findall(r"[a-z0-9_]+", frame.question.lower()))
+    for _, op, value in plan.filters:
+        if op in ("in", "not in"):
+            for text in value:
+                known.update(re.findall(r"[a-z0-9_]+", text))
+    return all(
+        word in FOLLOWUP_WORDS or word in known or _NUMBER.fullmatch(word) or columns(word) is not None
+        for word in words
+    )
+
+
+class SessionResults:
+    """
+    The last result of each session, for answering follow-ups locally
+
+    Results are kept as ResultFrames for FOLLOWUP_SESSION_TTL seconds,
+    least recently used sessions going first beyond `max_sessions`.
+    """
+    def __init__(self, max_sessions: int = FOLLOWUP_MAX_SESSIONS, ttl: float = FOLLOWUP_SESSION_TTL,
+                 max_rows: int = FOLLOWUP_MAX_ROWS):
+        self.frames = TTLCache(max_entries=max_sessions, ttl=ttl)
+        self.max_rows = max_rows
+        self.answered = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def remember(self, session_id: str, question: str, sql: str, rows: List[Dict[str, Any]],
+                 target_id: Optional[str] = None):
+        """Keep a session's latest result, forgetting the previous one"""
+        if not rows or len(rows) > self.max_rows:
+            self.frames.pop(session_id)
+            return
+        self.frames.set(session_id, ResultFrame.from_rows(rows, question, sql, target_id))
+
+    def answer(self, session_id: str, question: str,
+               target_id: Optional[str] = None) -> Optional[Tuple[str, str, List[Dict[str, Any]]]]:
+        """
+        Answer a follow-up from the session's last result
+
+        Returns:
+            tuple: Question in context, equivalent SQL and result rows, or
+            None when the question needs a full pipeline run
+        """
+        frame = self.frames.get(session_id)
+        if frame is None or frame.target_id != target_id or not looks_like_followup(question):
+            return None
+        try:
+            plan = plan_followup(question, frame)
+        except Exception as e:
+            logger.warning(f"Could not interpret follow-up, running it as a new question: {str(e)}")
+            plan = None
+        with self._lock:
+            if plan is None:
+                self.fallbacks += 1
+                return None
+            self.answered += 1
+        result = plan.apply(frame)
+        return f"{frame.question} ({question})", plan.to_sql(frame), result.to_rows()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Follow-up counters, for the metrics endpoint"""
+        with self._lock:
+            return {**self.frames.snapshot(), "answered": self.answered, "fallbacks": self.fallbacks}
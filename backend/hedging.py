@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Hedging configuration
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+# Fixed delay in seconds, or "p90" style to follow observed latency
+HEDGE_DELAY = os.getenv("HEDGE_DELAY", "p90")
+# Extra calls allowed, as a fraction of primary calls
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Hedged calls whose loser may still be running at once; losers cannot be
+# stopped, so this keeps them from filling the executor
+HEDGE_MAX_INFLIGHT = int(os.getenv("HEDGE_MAX_INFLIGHT", "4"))
+
+
+class LatencyTracker:
+    """Rolling window of call latencies"""
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Latency at the given percentile, None without enough samples"""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+class Hedger:
+    """
+    Issues a duplicate call when the first one is slower than the hedge delay
+
+    Whichever call finishes first wins. The loser cannot be interrupted
+    mid-request, so it is abandoned and its result discarded. Hedges are
+    capped at `budget` times the number of primary calls, and at
+    `max_inflight` hedged calls whose two attempts have not both finished.
+    The hedge delay counts from the moment the first attempt starts
+    running, so time spent queued for a worker does not trigger a hedge.
+    Use one hedger per kind of call, the delay follows its latencies.
+    """
+    def __init__(self, name: str, enabled: bool = HEDGE_ENABLED, delay: str = HEDGE_DELAY,
+                 budget: float = HEDGE_BUDGET, max_inflight: int = HEDGE_MAX_INFLIGHT,
+                 max_workers: int = 16):
+        self.name = name
+        self.enabled = enabled
+        self.delay = delay
+        self.budget = budget
+        self.max_inflight = max_inflight
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hedge-{name}")
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, None while latency is still unknown"""
+        if self.delay.startswith("p"):
+            return self.latency.percentile(float(self.delay[1:]))
+        return float(self.delay)
+
+    def _take_budget(self) -> bool:
+        """Reserve one hedge if the budget and the in-flight cap allow it"""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls or self.inflight >= self.max_inflight:
+                return False
+            self.hedges += 1
+            self.inflight += 1
+            return True
+
+    def _timed(self, fn: Callable, *args, **kwargs) -> Any:
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    def _attempt(self, running: threading.Event, fn: Callable, *args, **kwargs) -> Any:
+        running.set()
+        return self._timed(fn, *args, **kwargs)
+
+    def _settle(self, attempts: list):
+        """Count a hedged call as finished once both of its attempts are"""
+        remaining = [len(attempts)]
+
+        def finished(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    self.inflight -= 1
+        for attempt in attempts:
+            attempt.add_done_callback(finished)
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Call `fn`, hedging it if the first attempt is slow"""
+        with self._lock:
+            self.calls += 1
+        delay = self.hedge_delay() if self.enabled else None
+        if delay is None:
+            return self._timed(fn, *args, **kwargs)
+
+        running = threading.Event()
+        primary = self._executor.submit(self._attempt, running, fn, *args, **kwargs)
+        running.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            return primary.result()
+
+        logger.info(f"Hedging '{self.name}' call after {delay:.2f}s")
+        hedge = self._executor.submit(self._timed, fn, *args, **kwargs)
+        self._settle([primary, hedge])
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return future.result()
+        raise error
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Hedge counters, for the metrics endpoint"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "inflight": self.inflight,
+                "hedge_win_rate": round(self.hedge_wins / self.hedges, 4) if self.hedges else None,
+                "hedge_delay": self.hedge_delay(),
+            }
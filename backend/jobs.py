@@ -0,0 +1,149 @@
+import os
+import time
+import uuid
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Worker pool configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "900"))
+
+# Lower value runs first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    """A question submitted for background processing"""
+    def __init__(self, question: str, priority: str = "normal"):
+        self.id = uuid.uuid4().hex
+        self.question = question
+        self.priority = priority
+        self.status = STATUS_QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public representation returned by the job endpoints"""
+        return {
+            "job_id": self.id,
+            "question": self.question,
+            "priority": self.priority,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Bounded pool of background workers consuming a priority queue of jobs
+
+    Args:
+        handler: Coroutine function run for each job, returning its result
+        workers: Number of concurrent workers
+        queue_size: Maximum number of queued jobs before submissions are refused
+        result_ttl: Seconds a finished job is kept around
+    """
+    def __init__(self, handler: Callable[[Job], Awaitable[Dict[str, Any]]],
+                 workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE,
+                 result_ttl: float = JOB_RESULT_TTL):
+        self.handler = handler
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue = asyncio.PriorityQueue(maxsize=queue_size)
+        self._counter = itertools.count()
+        self._jobs = OrderedDict()
+        self._tasks = []
+
+    def start(self):
+        """Start the worker tasks, must be called from the running event loop"""
+        for number in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(number)))
+        logger.info(f"Started {self.workers} job workers")
+
+    async def stop(self):
+        """Cancel the worker tasks"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, question: str, priority: str = "normal") -> Job:
+        """
+        Queue a question for processing
+
+        Raises:
+            ValueError: If the priority is unknown
+            QueueFullError: If the queue is at capacity
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.evict_expired()
+        job = Job(question, priority)
+        try:
+            self._queue.put_nowait((PRIORITIES[priority], next(self._counter), job))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self._queue.maxsize} jobs)")
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job that has not expired yet"""
+        self.evict_expired()
+        return self._jobs.get(job_id)
+
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def evict_expired(self):
+        """Drop finished jobs older than the result TTL"""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self, number: int):
+        """Process jobs until cancelled"""
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                job.status = STATUS_RUNNING
+                job.started_at = time.time()
+                job.result = await self.handler(job)
+                job.status = STATUS_SUCCEEDED
+            except asyncio.CancelledError:
+                job.status = STATUS_FAILED
+                job.error = "Job cancelled"
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} failed in worker {number}: {str(e)}")
+                job.status = STATUS_FAILED
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
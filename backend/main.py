@@ -1,25 +1,51 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 # Import from the query processor
-from query_processor import process_query, stream_response
-import uvicorn
+from query_processor import (
+    process_query, explain_results, lookup_answer, stream_response, warm_up, get_training_questions,
+    sql_for_question, get_local_index, get_schema_graph, LOCAL_SQL_GENERATION, sql_cache, answer_cache, answer_tiers_snapshot, llm_hedgers, STREAM_TOKEN_DELAY
+)
+from sse import (
+    SSEStream, EVENT_SQL, EVENT_ROWS, EVENT_TOKEN, EVENT_METRICS,
+    EVENT_DONE, EVENT_ERROR
+)
+from stream_buffer import StreamBuffer, StreamRegistry, parse_event_id
+from jobs import Job, JobManager, QueueFullError
+from catalog import QuestionCatalog, CATALOG_EXTRA_QUESTIONS
+from tally import TallyEngine, TALLY_ENABLED
+from tally_push import TallyBroadcaster
+from export import stream_export, FORMATS
+from serialization import SerializedJSONResponse, encode_rows
+from structured_logging import configure_logging, log_event, logging_snapshot
+from sql_rewrite import rewrite_snapshot
+from followups import SessionResults, FOLLOWUPS_ENABLED
+from compression import CompressionMiddleware, compression_stats, COMPRESSION_ENABLED
+from profiling import profiler, PROFILE_ADMIN_TOKEN, PROFILE_CONTINUOUS
+from targets import targets, DatabaseTarget, UnknownTargetError, DEFAULT_TARGET, TARGET_API_TOKEN
+from resilience import breakers_snapshot, CircuitOpenError
+from admission import (
+    admission, OverloadedError, request_deadline, STAGE_QUERY, STAGE_DB, THREADPOOL_SIZE,
+    PRIORITY_FAST, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+)
+import anyio.to_thread
+import asyncio
+import hmac
+import time
 import os
 from dotenv import load_dotenv
 import logging
-import json
 import traceback
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional, Tuple
+from contextlib import asynccontextmanager
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging: records are written by a background thread, see LOG_* settings
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Debug environment variables
@@ -29,8 +55,82 @@ logger.info(f"VANNA_API_KEY is set: {bool(os.getenv('VANNA_API_KEY'))}")
 # Application configuration
 # Add any app-wide configuration here
 
+# Answers are buffered so dropped clients can resume them
+stream_registry = StreamRegistry()
+
+# Background workers for the job API, run_job is defined below
+job_manager = JobManager(lambda job: run_job(job))
+
+# Live vote counts kept in memory, fed by Postgres notifications
+tally_engine = TallyEngine() if TALLY_ENABLED else None
+
+
+def recount_answer(question: str) -> Optional[Dict[str, Any]]:
+    """Catalog answer rebuilt from the tally after a vote, None when that takes the LLM"""
+    tally_answer = tally_engine.try_answer(question) if tally_engine else None
+    if tally_answer is None:
+        return None
+    sql_query, rows = tally_answer
+    natural_response = lookup_answer(question, sql_query, rows)
+    if natural_response is None:
+        return None
+    return {"sql_query": sql_query, "results": rows, "natural_response": natural_response, "timings": {"llm_ms": 0.0}}
 
-app = FastAPI()
+
+# Precomputed answers to the most common questions
+catalog = QuestionCatalog(lambda question: process_query(question, PRIORITY_BACKGROUND), recount_answer)
+
+# Batched pushes of vote count changes to live result watchers
+tally_broadcaster = TallyBroadcaster(tally_engine) if tally_engine else None
+
+# Last result of each conversation, kept to answer follow-ups without the pipeline
+session_results = SessionResults() if FOLLOWUPS_ENABLED else None
+
+# Filled in by the warm-up task, see /api/ready
+readiness = {"ready": False, "dependencies": {}, "warm_up_ms": None}
+
+
+async def warm_up_dependencies():
+    """Initialize Vanna and OpenAI in the background once the port is bound"""
+    started = time.perf_counter()
+    try:
+        readiness["dependencies"] = await run_in_threadpool(warm_up)
+        readiness["ready"] = True
+        catalog.add_questions(get_training_questions() + CATALOG_EXTRA_QUESTIONS)
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+        readiness["error"] = str(e)
+    readiness["warm_up_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info(f"Warm-up finished in {readiness['warm_up_ms']} ms")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the background workers with the server"""
+    # Admission limits are sized against this many threads, see admission.py
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    job_manager.start()
+    catalog.start()
+    if PROFILE_CONTINUOUS:
+        profiler.start_continuous()
+    if tally_engine is not None:
+        # Vote changes make the precomputed answers counting votes stale
+        tally_engine.add_listener(lambda candidate_id, delta: catalog.invalidate("votes"))
+        tally_engine.start()
+        tally_broadcaster.start()
+    warm_up_task = asyncio.create_task(warm_up_dependencies())
+    yield
+    warm_up_task.cancel()
+    profiler.stop_continuous()
+    if tally_engine is not None:
+        await tally_broadcaster.stop()
+        await run_in_threadpool(tally_engine.stop)
+    await catalog.stop()
+    await job_manager.stop()
+
+
+# Every JSON body goes through the configured serializer, see serialization.py
+app = FastAPI(lifespan=lifespan, default_response_class=SerializedJSONResponse)
 
 # Configure CORS for Flutter app
 app.add_middleware(
@@ -41,57 +141,542 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated gzip/br/zstd for JSON, exports and SSE streams, see compression.py
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    """Refuse overloaded requests fast, telling the client when to come back"""
+    logger.warning(str(exc))
+    return SerializedJSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "error_type": "OverloadedError", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Fail fast while a dependency's breaker is open"""
+    return SerializedJSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "error_type": "CircuitOpenError", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 class QueryRequest(BaseModel):
     question: str
+    # Registered database target, see /api/targets; the default database when omitted
+    target: Optional[str] = None
+    # Conversation the question belongs to; follow-ups refine its previous result
+    session: Optional[str] = None
+
+class JobRequest(BaseModel):
+    question: str
+    priority: str = "normal"
+
+class ExportRequest(BaseModel):
+    question: str
+    format: str = "csv"
+    target: Optional[str] = None
+
+class TargetRequest(BaseModel):
+    # Fields of the Flutter DatabaseConfigScreen
+    type: str = "postgresql"
+    url: str
+    username: str
+    password: str
+    database: str
+
+class ProfileArmRequest(BaseModel):
+    mode: str = "sample"
+    requests: int = 1
+
+class ContinuousProfileRequest(BaseModel):
+    enabled: bool
+    reset: bool = False
 
 class ErrorResponse(BaseModel):
     detail: str
     error_type: str
     debug_info: dict
 
-@app.post("/api/query")
-async def handle_query(request: QueryRequest):
+def rows_payload(results: list) -> Dict[str, Any]:
+    """Column-oriented rows payload of job results, the decoded form of encode_rows"""
+    columns = list(results[0].keys()) if results else []
+    return {
+        "count": len(results),
+        "columns": columns,
+        "rows": [[row[column] for column in columns] for row in results]
+    }
+
+async def run_query_stream(buffer: StreamBuffer, question: str,
+                           priority: int = PRIORITY_INTERACTIVE,
+                           deadline: Optional[float] = None,
+                           precomputed: Optional[Dict[str, Any]] = None,
+                           compute: Optional[Callable[[], Dict[str, Any]]] = None,
+                           source: str = "pipeline",
+                           profile: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
-    Process user query and stream the response
+    Run the query pipeline and record every event in the stream buffer
+
+    Runs as a background task so the answer keeps being produced, and stays
+    available for resumption, when the client connection drops. A
+    `precomputed` response, such as a catalog answer, is streamed as is,
+    and `compute` replaces process_query as the blocking producer. With a
+    `profile` mode the producer runs under the profiler, see profiling.py.
+    The result of a stream with a session is kept for follow-ups.
+
+    Returns:
+        The process_query response, or None if the pipeline failed
     """
     try:
-        logger.info(f"Received query request: {request.question}")
-        
-        # Process the query and get the response
-        try:
-            response = process_query(request.question)
+        if precomputed is not None:
+            response, delay = precomputed, 0
+        else:
+            if compute is None:
+                compute = lambda: process_query(question, priority, deadline)
+            if profile is not None:
+                response, profile_path = await run_in_threadpool(profiler.run, profile, buffer.stream_id, compute)
+                response = {**response, "profile": profile_path}
+            else:
+                response = await run_in_threadpool(compute)
+            delay = STREAM_TOKEN_DELAY
             logger.info("Successfully processed user query")
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Error processing query: {error_msg}")
-            raise HTTPException(status_code=500, detail=error_msg)
-        
-        # Stream the response back to the client
-        async def generate():
+        buffer.append(EVENT_SQL, {"sql": response["sql_query"].strip()})
+        buffer.append(EVENT_ROWS, encode_rows(response["results"]))
+        async for word in stream_response(response, delay):
+            buffer.append(EVENT_TOKEN, word)
+        metrics = {"timings": response.get("timings", {}), "source": source}
+        if "profile" in response:
+            metrics["profile"] = response["profile"]
+        buffer.append(EVENT_METRICS, metrics)
+        if buffer.session_id is not None and session_results is not None:
+            # Kept before the done event so an immediate follow-up finds it
             try:
-                async for word in stream_response(response):
-                    yield f"data: {word}\n\n"
-                logger.info("Successfully streamed response")
+                await run_in_threadpool(
+                    session_results.remember, buffer.session_id, question,
+                    response["sql_query"], response["results"], buffer.target_id
+                )
             except Exception as e:
-                error_msg = f"Error streaming response: {str(e)}"
-                logger.error(error_msg)
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
-        
-        return StreamingResponse(
-            generate(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            }
-        )
-    except HTTPException as he:
-        raise he
+                logger.warning(f"Could not keep the result for follow-ups: {str(e)}")
+        buffer.append(EVENT_DONE, {})
+        return response
+    except asyncio.CancelledError:
+        # Subscribers would otherwise wait for the end of the stream forever
+        if not buffer.finished:
+            buffer.append(EVENT_ERROR, {"message": "The answer was cancelled", "error_type": "CancelledError"})
+        raise
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Error processing query: {error_msg}")
+        error = {"message": error_msg, "error_type": type(e).__name__}
+        if getattr(e, "retry_after", None) is not None:
+            error["retry_after"] = e.retry_after
+        buffer.append(EVENT_ERROR, error)
+        return None
+
+def start_query_stream(question: str, priority: int = PRIORITY_INTERACTIVE,
+                       deadline: Optional[float] = None, target_id: Optional[str] = None,
+                       session: Optional[str] = None, **kwargs) -> StreamBuffer:
+    """Register a new stream and start producing its events, see run_query_stream"""
+    buffer = stream_registry.create()
+    buffer.target_id = target_id
+    buffer.session_id = session
+    buffer.task = asyncio.create_task(
+        run_query_stream(buffer, question, priority, deadline, **kwargs)
+    )
+    return buffer
+
+def resumable_buffer(last_event_id: Optional[str]) -> Tuple[Optional[StreamBuffer], int]:
+    """Find the buffered stream a reconnecting client wants to resume"""
+    if not last_event_id:
+        return None, 0
+    try:
+        stream_id, after_seq = parse_event_id(last_event_id)
+    except ValueError:
+        logger.warning(f"Ignoring malformed Last-Event-ID: {last_event_id}")
+        return None, 0
+    buffer = stream_registry.get(stream_id)
+    if buffer is None:
+        logger.info(f"Stream {stream_id} expired, starting a new one")
+        return None, 0
+    if not buffer.can_resume(after_seq):
+        logger.warning(f"Stream {stream_id} cannot resume after event {after_seq}, starting a new one")
+        return None, 0
+    return buffer, after_seq
+
+def sse_response(buffer: StreamBuffer, after_seq: int = 0) -> StreamingResponse:
+    """Stream the events of a buffer, starting after `after_seq`"""
+    sse_stream = SSEStream()
+
+    async def generate():
+        async for chunk in sse_stream.frames(buffer.subscribe(after_seq)):
+            yield chunk
+        logger.info(f"Streamed {sse_stream.events_written} events in {sse_stream.frames_written} frames")
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Stream-ID": buffer.stream_id,
+        }
+    )
+
+@app.post("/api/query")
+async def handle_query(request: QueryRequest, last_event_id: Optional[str] = Header(None),
+                       x_profile: Optional[str] = Header(None)):
+    """
+    Process user query and stream the response
+
+    A client reconnecting with a Last-Event-ID header resumes the buffered
+    stream instead of running the pipeline again. New questions are refused
+    with 429 when the pipeline cannot take them before their deadline. An
+    X-Profile header of "cprofile" or "sample" profiles the request when
+    profiling is enabled; the profile path is reported in the metrics event.
+    """
+    try:
+        buffer, after_seq = resumable_buffer(last_event_id)
+        if buffer is not None:
+            logger.info(f"Resuming stream {buffer.stream_id} after event {after_seq}")
+            return sse_response(buffer, after_seq)
+
+        log_event(logger, "question", "Received query request", question=request.question)
+        deadline = request_deadline()
+
+        target = resolve_target(request.target)
+        target_id = None if target.id == DEFAULT_TARGET else target.id
+        session = request.session
+
+        followup = None
+        if session and session_results is not None:
+            followup = await run_in_threadpool(session_results.answer, session, request.question, target_id)
+        if followup is not None:
+            logger.info("Answering follow-up from the session's last result")
+            question, sql_query, rows = followup
+            compute = lambda: explain_results(question, sql_query, rows, PRIORITY_FAST, deadline)
+            return sse_response(start_query_stream(
+                question, compute=compute, source="followup", target_id=target_id, session=session,
+                profile=profiler.request_mode(x_profile)
+            ))
+
+        if target_id is not None:
+            # Tally and catalog answers only exist for the default database
+            admission.check(STAGE_QUERY, PRIORITY_INTERACTIVE, deadline)
+            compute = lambda: process_query(request.question, PRIORITY_INTERACTIVE, deadline, target)
+            return sse_response(start_query_stream(
+                request.question, compute=compute, target_id=target_id, session=session,
+                profile=profiler.request_mode(x_profile)
+            ))
+
+        tally_answer = tally_engine.try_answer(request.question) if tally_engine else None
+        if tally_answer is not None:
+            logger.info("Serving tally question from memory")
+            sql_query, rows = tally_answer
+            compute = lambda: explain_results(request.question, sql_query, rows, PRIORITY_FAST, deadline)
+            return sse_response(start_query_stream(
+                request.question, compute=compute, source="tally", session=session,
+                profile=profiler.request_mode(x_profile)
+            ))
+
+        precomputed = catalog.lookup(request.question)
+        if precomputed is not None:
+            logger.info("Serving precomputed catalog answer")
+            return sse_response(start_query_stream(
+                request.question, precomputed=precomputed, source="catalog", session=session
+            ))
+
+        admission.check(STAGE_QUERY, PRIORITY_INTERACTIVE, deadline)
+        return sse_response(start_query_stream(
+            request.question, PRIORITY_INTERACTIVE, deadline, session=session,
+            profile=profiler.request_mode(x_profile)
+        ))
+    except (OverloadedError, HTTPException):
+        raise
     except Exception as e:
         logger.error(f"Unexpected error in process_query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/query/{stream_id}/events")
+async def resume_query(stream_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Re-attach to a buffered stream, for EventSource style reconnects
+    """
+    buffer = stream_registry.get(stream_id)
+    if buffer is None:
+        raise HTTPException(status_code=404, detail=f"Stream {stream_id} not found or expired")
+    after_seq = 0
+    if last_event_id:
+        try:
+            last_stream_id, after_seq = parse_event_id(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Malformed Last-Event-ID: {last_event_id}")
+        if last_stream_id != stream_id:
+            raise HTTPException(status_code=400, detail="Last-Event-ID belongs to another stream")
+    if not buffer.can_resume(after_seq):
+        raise HTTPException(status_code=410, detail=f"Stream {stream_id} no longer holds events after {after_seq}")
+    return sse_response(buffer, after_seq)
+
+def resolve_target(target_id: Optional[str]) -> DatabaseTarget:
+    """Registered database target of a request, 404 when unknown or forgotten"""
+    try:
+        return targets.get(target_id)
+    except UnknownTargetError:
+        raise HTTPException(status_code=404, detail=f"Database target {target_id} is not registered")
+
+def export_response(sql_query: str, fmt: str, deadline: Optional[float] = None,
+                    target: Optional[DatabaseTarget] = None) -> StreamingResponse:
+    """Stream the results of `sql_query` as a file download in format `fmt`"""
+    connect = {} if target is None or target.id == DEFAULT_TARGET else {"connect": target.connection}
+    try:
+        chunks = stream_export(sql_query, fmt, PRIORITY_BACKGROUND, deadline, **connect)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    admission.check(STAGE_DB, PRIORITY_BACKGROUND, deadline)
+    media_type, extension = FORMATS[fmt]
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="votebank-results.{extension}"',
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+@app.post("/api/export")
+async def export_query(request: ExportRequest):
+    """
+    Answer a question with its raw results as CSV, NDJSON, Arrow or Parquet
+    instead of a natural language answer
+    """
+    if request.format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format '{request.format}'")
+    target = resolve_target(request.target)
+    deadline = request_deadline()
+    sql_query = await run_in_threadpool(sql_for_question, request.question, PRIORITY_BACKGROUND, deadline, target)
+    return export_response(sql_query, request.format, deadline, target)
+
+@app.get("/api/query/{stream_id}/export")
+async def export_stream(stream_id: str, format: str = "csv"):
+    """
+    Export the full results of an answered query, by the X-Stream-ID of its stream
+    """
+    buffer = stream_registry.get(stream_id)
+    if buffer is None:
+        raise HTTPException(status_code=404, detail=f"Stream {stream_id} not found or expired")
+    sql_event = buffer.pinned_event(EVENT_SQL)
+    if sql_event is None:
+        raise HTTPException(status_code=409, detail=f"Stream {stream_id} has no SQL query yet")
+    return export_response(sql_event.data["sql"], format, request_deadline(), resolve_target(buffer.target_id))
+
+async def run_job(job: Job) -> Dict[str, Any]:
+    """Job handler: run the pipeline into the job's stream and keep the result"""
+    buffer = stream_registry.get(job.id) or stream_registry.create(job.id)
+    response = await run_query_stream(buffer, job.question, PRIORITY_BACKGROUND)
+    if response is None:
+        raise RuntimeError(buffer.last_event.data["message"])
+    return {
+        "sql_query": response["sql_query"].strip(),
+        "rows": rows_payload(response["results"]),
+        "natural_response": response["natural_response"],
+        "timings": response.get("timings", {}),
+    }
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queue a question for background processing and return its job id
+    """
+    try:
+        job = job_manager.submit(request.question, request.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    # Created up front so clients can subscribe before a worker picks it up
+    stream_registry.create(job.id)
+    logger.info(f"Queued job {job.id} with priority {job.priority}")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "result_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events",
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Fetch the status, and once finished the result, of a job
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found or expired")
+    # Returned as a response so result rows skip FastAPI's jsonable_encoder
+    return SerializedJSONResponse(job.to_dict())
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Subscribe to the event stream of a job
+    """
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found or expired")
+    return await resume_query(job_id, last_event_id)
+
+@app.get("/api/jobs/{job_id}/export")
+async def export_job(job_id: str, format: str = "csv"):
+    """
+    Export the full results of a finished job
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found or expired")
+    if job.result is None:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} has no results ({job.status})")
+    return export_response(job.result["sql_query"], format, request_deadline())
+
+@app.get("/api/tally/stream")
+async def tally_stream():
+    """
+    Live vote counts: a snapshot event, then a tally event with the changed
+    candidates and parties once per TALLY_PUSH_WINDOW while votes arrive
+    """
+    if tally_broadcaster is None:
+        raise HTTPException(status_code=404, detail="Live tally is disabled")
+    if not tally_engine.ready:
+        raise HTTPException(status_code=503, detail="Live tally is still loading")
+    return StreamingResponse(
+        tally_broadcaster.watch(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Guard of the profiling endpoints"""
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if PROFILE_ADMIN_TOKEN and x_admin_token != PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/api/admin/profile/arm", dependencies=[Depends(require_admin)])
+async def arm_profiling(request: ProfileArmRequest):
+    """
+    Profile the next query requests, without them sending X-Profile
+    """
+    try:
+        profiler.arm(request.mode, request.requests)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiler.snapshot()
+
+@app.post("/api/admin/profile/continuous", dependencies=[Depends(require_admin)])
+async def continuous_profiling(request: ContinuousProfileRequest):
+    """
+    Start or stop sampling the stacks of all busy threads
+    """
+    if request.reset:
+        profiler.continuous.reset()
+    if request.enabled:
+        profiler.start_continuous()
+    else:
+        profiler.stop_continuous()
+    return profiler.snapshot()
+
+@app.get("/api/admin/profile/hot", dependencies=[Depends(require_admin)])
+async def hot_functions(limit: int = 20):
+    """
+    Functions most often on the stack in the continuous samples
+    """
+    return {
+        "samples": profiler.continuous.samples,
+        "functions": profiler.continuous.hot_functions(limit),
+    }
+
+@app.get("/api/admin/profile/folded", dependencies=[Depends(require_admin)])
+async def folded_stacks():
+    """
+    Continuous samples as collapsed stacks, the input of flamegraph tools
+    """
+    return PlainTextResponse(
+        profiler.continuous.folded(),
+        headers={"Content-Disposition": 'attachment; filename="votebank-stacks.folded"'}
+    )
+
+def require_targets_token(x_targets_token: Optional[str] = Header(None)):
+    """Guard of the database target endpoints"""
+    if not TARGET_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Database targets are disabled")
+    if not hmac.compare_digest((x_targets_token or "").encode("utf-8"), TARGET_API_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid targets token")
+
+@app.post("/api/targets", status_code=201, dependencies=[Depends(require_targets_token)])
+async def register_target(request: TargetRequest):
+    """
+    Register a database to query, as configured in the app's DatabaseConfigScreen
+
+    The returned target id is unguessable and is what grants queries on the
+    database, so it is only ever returned to the client registering it.
+    Registering the same credentials again returns the same target id. Its
+    connection pool, schema and trained model are created on first use.
+    """
+    try:
+        target = targets.register(request.type, request.url, request.username, request.password, request.database)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return target.to_dict()
+
+@app.get("/api/targets", dependencies=[Depends(require_targets_token)])
+async def list_targets():
+    """
+    Registered database targets, least recently used first, for operators
+    """
+    return {"targets": targets.list()}
+
+@app.delete("/api/targets/{target_id}", status_code=204, dependencies=[Depends(require_targets_token)])
+async def remove_target(target_id: str):
+    """
+    Forget a database target and close its connections
+    """
+    try:
+        await run_in_threadpool(targets.remove, target_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UnknownTargetError:
+        raise HTTPException(status_code=404, detail=f"Database target {target_id} is not registered")
+
+@app.get("/api/metrics")
+async def metrics():
+    """
+    Runtime counters of the serving subsystems
+    """
+    return {
+        "admission": admission.snapshot(),
+        "jobs": {"queued": job_manager.queue_depth()},
+        "streams": {"buffered": len(stream_registry)},
+        "breakers": breakers_snapshot(),
+        "caches": {"sql": sql_cache.snapshot(), "answer": answer_cache.snapshot()},
+        "hedging": {hedger.name: hedger.snapshot() for hedger in llm_hedgers.values()},
+        "answers": answer_tiers_snapshot(),
+        "catalog": catalog.snapshot(),
+        "tally": tally_engine.snapshot() if tally_engine else {"enabled": False},
+        "tally_push": tally_broadcaster.snapshot() if tally_broadcaster else {"enabled": False},
+        "logging": logging_snapshot(),
+        "profiling": profiler.snapshot(),
+        "targets": targets.snapshot(),
+        "vector_index": get_local_index().snapshot() if LOCAL_SQL_GENERATION and readiness["ready"] else None,
+        "schema_pruning": get_schema_graph().snapshot() if LOCAL_SQL_GENERATION and readiness["ready"] else None,
+        "sql_rewrite": rewrite_snapshot(),
+        "compression": compression_stats.snapshot(),
+        "followups": session_results.snapshot() if session_results else {"enabled": False},
+    }
+
 @app.get("/api/health")
 async def health_check():
     """
@@ -99,5 +684,15 @@ async def health_check():
     """
     return {"status": "healthy"}
 
+@app.get("/api/ready")
+async def readiness_check():
+    """
+    Readiness endpoint, 503 until the Vanna and OpenAI clients are initialized
+    """
+    status_code = 200 if readiness["ready"] else 503
+    content = {"status": "ready" if readiness["ready"] else "starting", **readiness}
+    return SerializedJSONResponse(status_code=status_code, content=content)
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
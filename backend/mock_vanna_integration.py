@@ -1,3 +1,5 @@
+import re
+import json
 import logging
 import random
 
@@ -5,6 +7,86 @@ import random
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Returned by generate_sql when no pattern matches
+DEFAULT_SQL = "SELECT * FROM users ORDER BY id LIMIT 10"
+
+# Platforms looked up as keys of candidates.social_media_handles
+SOCIAL_PLATFORMS = ("twitter", "instagram", "facebook", "youtube", "linkedin")
+
+# Words that scope a search to a place, party or other column, which the search rules leave to Vanna
+SEARCH_QUALIFIERS = {"in", "from", "of", "by", "at", "party", "state", "constituency", "district"}
+
+# Exact profile search phrasings by kind; the captured group holds the search terms
+_CANDIDATES = r"(?:(?:which|list|show|find)(?: me)?(?: all)?(?: the)? )?candidates "
+SEARCH_RULES = [
+    ("social", _CANDIDATES + r"(?:who are |that are |are )?on ((?:{0})(?: (?:and|or) (?:{0}))*)".format("|".join(SOCIAL_PLATFORMS))),
+    ("promises", _CANDIDATES + r"(?:who |that )?(?:promised|promise|promising) ([a-z0-9 ]+)"),
+    ("education", _CANDIDATES + r"(?:who |that )?(?:studied|(?:with|who have|that have) (?:a )?degree in) ([a-z0-9 ]+)"),
+    ("profile", _CANDIDATES + r"(?:whose profiles? mentions?|(?:with profiles? )?mentioning) ([a-z0-9 ]+)"),
+    ("target", _CANDIDATES + r"(?:who |that )?(?:target|targeting) ([a-z0-9 ]+?)(?: voters)?"),
+]
+
+
+# Exact question phrasings and their SQL; a group captured by the pattern fills {0}
+_LEADERBOARD = """
+    SELECT c.id, c.name, c.party_affiliation AS party, COUNT(v.id) as vote_count
+    FROM candidates c
+    LEFT JOIN votes v ON c.id = v.candidate_id
+    GROUP BY c.id, c.name, c.party_affiliation
+    ORDER BY vote_count DESC
+"""
+QUESTION_RULES = [
+    (r"(?:list|show)(?: me)?(?: all)?(?: the)? candidates|all candidates",
+     "SELECT id, name, party_affiliation AS party, constituency, state FROM candidates ORDER BY id"),
+    (r"(?:list|show)(?: me)?(?: all)?(?: the)? (?:users|voters)|all (?:users|voters)",
+     "SELECT id, username, email FROM users ORDER BY id"),
+    (r"how many (?:users|voters)(?: are there)?|(?:total|number of|count)(?: the)? (?:users|voters)",
+     "SELECT COUNT(*) as total_users FROM users"),
+    (r"how many candidates(?: are there)?|(?:total|number of|count)(?: the)? candidates",
+     "SELECT COUNT(*) as total_candidates FROM candidates"),
+    (r"how many votes(?: are there| have been cast| were cast)?|(?:total|number of|count)(?: the)?(?: number of)? votes",
+     "SELECT COUNT(*) as total_votes FROM votes"),
+    (r"how many votes does each candidate have|(?:show |list )?(?:the )?(?:vote count|votes) (?:for|of|per) (?:each|every) candidate|(?:show |list )?(?:the )?candidate leaderboard",
+     _LEADERBOARD),
+    (r"(?:who are |show |list )?(?:the )?top (?:(\d+) )?candidates(?: by (?:votes|vote count))?",
+     _LEADERBOARD + "    LIMIT {0}\n"),
+    (r"(?:which|list|show)(?: the)? (?:users|voters) (?:who )?(?:have not|haven't|did not|didn't) voted?(?: yet)?",
+     """
+    SELECT u.id, u.username, u.email
+    FROM users u
+    LEFT JOIN votes v ON u.id = v.user_id
+    WHERE v.id IS NULL
+"""),
+    (r"which party has (?:the )?(?:most|highest) votes|(?:how many )?votes (?:per|by|for each) party|(?:the )?winning party",
+     """
+    SELECT c.party_affiliation AS party, COUNT(v.id) as vote_count
+    FROM candidates c
+    LEFT JOIN votes v ON c.id = v.candidate_id
+    GROUP BY c.party_affiliation
+    ORDER BY vote_count DESC
+"""),
+    (r"who voted for whom|(?:list|show)(?: me)?(?: all)?(?: the)? votes|all votes",
+     """
+    SELECT u.id, u.username, c.name as voted_for, c.party_affiliation AS party
+    FROM users u
+    JOIN votes v ON u.id = v.user_id
+    JOIN candidates c ON v.candidate_id = c.id
+    ORDER BY u.id
+"""),
+]
+
+
+def full_text_search(column, terms):
+    """Candidates whose tsvector `column` matches `terms`, best matches first"""
+    query = f"websearch_to_tsquery('english', '{terms}')"
+    return f"""
+        SELECT c.id, c.name, c.party_affiliation, c.constituency
+        FROM candidates c
+        WHERE c.{column} @@ {query}
+        ORDER BY ts_rank(c.{column}, {query}) DESC
+        LIMIT 20
+    """
+
 class MockVannaAI:
     """
     Mock implementation of Vanna AI for testing purposes
@@ -35,105 +117,65 @@ class MockVannaAI:
         Mock implementation of generate_sql
         """
         logger.info(f"MockVannaAI: Generating SQL for question: {question}")
-        
-        # Convert question to lowercase for easier matching
-        q = question.lower()
-        
-        # Comprehensive pattern matching for common voting questions
-        if any(term in q for term in ["all candidates", "list candidates", "show candidates"]):
-            return "SELECT id, name, party FROM candidates ORDER BY id"
-            
-        elif any(term in q for term in ["all users", "list users", "show users"]):
-            return "SELECT id, name, email FROM users ORDER BY id"
-            
-        elif any(term in q for term in ["how many users", "number of users", "count users", "total users", "how many voters", "number of voters", "count voters", "total voters"]):
-            return "SELECT COUNT(*) as total_users FROM users"
-            
-        elif any(term in q for term in ["all votes", "list votes", "show votes"]):
-            return "SELECT v.id, u.name as user, c.name as candidate, c.party FROM votes v JOIN users u ON v.user_id = u.id JOIN candidates c ON v.candidate_id = c.id"
-            
-        elif "votes" in q and "candidate" in q:
-            if "each" in q or "all" in q or "count" in q:
-                return """
-                    SELECT c.id, c.name, c.party, COUNT(v.id) as vote_count 
-                    FROM candidates c
-                    LEFT JOIN votes v ON c.id = v.candidate_id
-                    GROUP BY c.id, c.name, c.party
-                    ORDER BY vote_count DESC
-                """
-            else:
-                # Try to find a specific candidate name in the question
-                return """
-                    SELECT c.id, c.name, c.party, COUNT(v.id) as vote_count 
-                    FROM candidates c
-                    LEFT JOIN votes v ON c.id = v.candidate_id
-                    GROUP BY c.id, c.name, c.party
-                    ORDER BY vote_count DESC
-                """
-                
-        elif "top" in q and "candidate" in q:
-            limit = 5  # Default limit
-            for word in q.split():
-                if word.isdigit():
-                    limit = int(word)
-                    break
-            
+        sql = self.match_sql(question)
+        if sql is None:
+            # Default query that returns useful information
+            return DEFAULT_SQL
+        return sql
+
+    def match_sql(self, question):
+        """
+        Match the question against the known question patterns
+
+        Returns:
+            str: SQL for the matched pattern, or None if no pattern applies
+        """
+        # Only exact phrasings are answered, anything qualified is left to Vanna
+        normalized = " ".join(re.findall(r"[a-z0-9']+", question.lower()))
+        for pattern, sql in QUESTION_RULES:
+            match = re.fullmatch(pattern, normalized)
+            if match:
+                return sql.format(*match.groups(default="5"))
+
+        # Profile searches use the full-text and JSONB indexes of init_db.py
+        return self.match_search(normalized)
+    
+    def match_search(self, normalized):
+        """
+        Match candidate profile searches, phrased exactly as one of SEARCH_RULES
+
+        Returns:
+            str: SQL using a `@@` full-text or JSONB containment predicate,
+            or None if the question is not an unscoped profile search
+        """
+        for kind, pattern in SEARCH_RULES:
+            match = re.fullmatch(pattern, normalized)
+            if match:
+                break
+        else:
+            return None
+        terms = match.group(1)
+        if set(terms.split()) & SEARCH_QUALIFIERS:
+            return None
+
+        if kind == "social":
+            keys = ", ".join(f"'{platform}'" for platform in SOCIAL_PLATFORMS if platform in terms.split())
             return f"""
-                SELECT c.id, c.name, c.party, COUNT(v.id) as vote_count 
+                SELECT c.id, c.name, c.party_affiliation, c.social_media_handles
                 FROM candidates c
-                LEFT JOIN votes v ON c.id = v.candidate_id
-                GROUP BY c.id, c.name, c.party
-                ORDER BY vote_count DESC
-                LIMIT {limit}
+                WHERE c.social_media_handles ?| array[{keys}]
             """
-            
-        elif any(term in q for term in ["not voted", "haven't voted", "without vote", "no vote"]):
-            return """
-                SELECT u.id, u.name, u.email
-                FROM users u
-                LEFT JOIN votes v ON u.id = v.user_id
-                WHERE v.id IS NULL
-            """
-            
-        elif "party" in q and ("most" in q or "highest" in q or "winning" in q):
-            return """
-                SELECT c.party, COUNT(v.id) as vote_count 
+        if kind == "target":
+            groups = json.dumps({"groups": terms.split()})
+            return f"""
+                SELECT c.id, c.name, c.party_affiliation, c.constituency
                 FROM candidates c
-                LEFT JOIN votes v ON c.id = v.candidate_id
-                GROUP BY c.party
-                ORDER BY vote_count DESC
-            """
-            
-        elif "who" in q and "voted" in q:
-            return """
-                SELECT u.id, u.name, u.email, c.name as voted_for, c.party
-                FROM users u
-                JOIN votes v ON u.id = v.user_id
-                JOIN candidates c ON v.candidate_id = c.id
-                ORDER BY u.id
+                WHERE c.target_voter_demographics @> '{groups}'
             """
-            
-        else:
-            # Check if the question is asking for a count of something
-            if any(term in q for term in ["how many", "count", "total number", "number of"]):
-                if any(term in q for term in ["user", "voter", "people"]):
-                    return "SELECT COUNT(*) as total_users FROM users"
-                elif any(term in q for term in ["candidate", "contestants"]):
-                    return "SELECT COUNT(*) as total_candidates FROM candidates"
-                elif any(term in q for term in ["vote", "ballot"]):
-                    return "SELECT COUNT(*) as total_votes FROM votes"
-                else:
-                    # Generic count query that shows counts of all main tables
-                    return """
-                        SELECT 
-                            (SELECT COUNT(*) FROM users) as total_users,
-                            (SELECT COUNT(*) FROM candidates) as total_candidates,
-                            (SELECT COUNT(*) FROM votes) as total_votes
-                    """
-            else:
-                # Default query that returns useful information
-                return "SELECT * FROM users ORDER BY id LIMIT 10"
-    
+        column = {"promises": "campaign_promises_search", "education": "education_search",
+                  "profile": "profile_search"}[kind]
+        return full_text_search(column, terms)
+
     def explain_sql(self, sql):
         """
         Mock implementation of explain_sql
@@ -177,7 +219,7 @@ def train_with_schema(vn):
     schema = """
         CREATE TABLE users (
             id SERIAL PRIMARY KEY,
-            name VARCHAR(100) NOT NULL,
+            username VARCHAR(50) UNIQUE NOT NULL,
             email VARCHAR(100) UNIQUE NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
@@ -185,7 +227,9 @@ def train_with_schema(vn):
         CREATE TABLE candidates (
             id SERIAL PRIMARY KEY,
             name VARCHAR(100) NOT NULL,
-            party VARCHAR(100) NOT NULL,
+            constituency VARCHAR(100) NOT NULL,
+            state VARCHAR(100) NOT NULL,
+            party_affiliation VARCHAR(100),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
 
@@ -202,6 +246,57 @@ def train_with_schema(vn):
     vn.add_ddl(schema)
     return vn
 
+# Example question-SQL pairs, also the catalog of precomputed questions
+TRAINING_EXAMPLES = [
+    {
+        "question": "How many votes does each candidate have?",
+        "sql": """
+            SELECT c.name, c.party_affiliation AS party, COUNT(v.id) as vote_count 
+            FROM candidates c
+            LEFT JOIN votes v ON c.id = v.candidate_id
+            GROUP BY c.id, c.name, c.party_affiliation
+            ORDER BY vote_count DESC
+        """
+    },
+    {
+        "question": "Who are the top 5 candidates by vote count?",
+        "sql": """
+            SELECT c.name, c.party_affiliation AS party, COUNT(v.id) as vote_count 
+            FROM candidates c
+            LEFT JOIN votes v ON c.id = v.candidate_id
+            GROUP BY c.id, c.name, c.party_affiliation
+            ORDER BY vote_count DESC
+            LIMIT 5
+        """
+    },
+    {
+        "question": "Which users have not voted yet?",
+        "sql": """
+            SELECT u.id, u.username, u.email
+            FROM users u
+            LEFT JOIN votes v ON u.id = v.user_id
+            WHERE v.id IS NULL
+        """
+    },
+    {
+        "question": "Which candidates promised free healthcare?",
+        "sql": """
+            SELECT c.id, c.name, c.party_affiliation, c.constituency
+            FROM candidates c
+            WHERE c.campaign_promises_search @@ websearch_to_tsquery('english', 'free healthcare')
+            ORDER BY ts_rank(c.campaign_promises_search, websearch_to_tsquery('english', 'free healthcare')) DESC
+        """
+    },
+    {
+        "question": "Which candidates are on Twitter?",
+        "sql": """
+            SELECT c.id, c.name, c.party_affiliation, c.social_media_handles
+            FROM candidates c
+            WHERE c.social_media_handles ? 'twitter'
+        """
+    }
+]
+
 def train_with_examples(vn):
     """
     Train mock Vanna AI with examples
@@ -212,41 +307,8 @@ def train_with_examples(vn):
     Returns:
         MockVannaAI: Mock Vanna AI instance
     """
-    examples = [
-        {
-            "question": "How many votes does each candidate have?",
-            "sql": """
-                SELECT c.name, c.party, COUNT(v.id) as vote_count 
-                FROM candidates c
-                LEFT JOIN votes v ON c.id = v.candidate_id
-                GROUP BY c.id, c.name, c.party
-                ORDER BY vote_count DESC
-            """
-        },
-        {
-            "question": "Who are the top 5 candidates by vote count?",
-            "sql": """
-                SELECT c.name, c.party, COUNT(v.id) as vote_count 
-                FROM candidates c
-                LEFT JOIN votes v ON c.id = v.candidate_id
-                GROUP BY c.id, c.name, c.party
-                ORDER BY vote_count DESC
-                LIMIT 5
-            """
-        },
-        {
-            "question": "Which users have not voted yet?",
-            "sql": """
-                SELECT u.id, u.name, u.email
-                FROM users u
-                LEFT JOIN votes v ON u.id = v.user_id
-                WHERE v.id IS NULL
-            """
-        }
-    ]
-    
-    logger.info(f"Training mock Vanna AI with {len(examples)} examples...")
-    for example in examples:
+    logger.info(f"Training mock Vanna AI with {len(TRAINING_EXAMPLES)} examples...")
+    for example in TRAINING_EXAMPLES:
         vn.train(example["question"], example["sql"])
     return vn
 
@@ -277,3 +339,16 @@ def generate_sql(vn, question):
         str: Generated SQL query
     """
     return vn.generate_sql(question)
+
+def match_sql(vn, question):
+    """
+    Generate SQL only if the question matches a known pattern
+
+    Args:
+        vn: MockVannaAI instance
+        question: Natural language question
+
+    Returns:
+        str: Generated SQL query, or None if no pattern matches
+    """
+    return vn.match_sql(question)
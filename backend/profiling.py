@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import cProfile
+import logging
+import threading
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Profiling is off unless enabled; the header and admin endpoints do nothing without it
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# Required in X-Admin-Token by the admin endpoints when set
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+# Where per-request profiles are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Seconds between stack samples
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+CONTINUOUS_SAMPLE_INTERVAL = float(os.getenv("PROFILE_CONTINUOUS_INTERVAL", "0.02"))
+# Distinct stacks kept by the continuous sampler, the rest are counted as [other]
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", "5000"))
+# Start the continuous sampler with the server
+PROFILE_CONTINUOUS = os.getenv("PROFILE_CONTINUOUS", "0") == "1"
+
+MODE_CPROFILE = "cprofile"
+MODE_SAMPLE = "sample"
+MODES = (MODE_CPROFILE, MODE_SAMPLE)
+
+# Leaf functions of threads that are parked rather than working
+IDLE_FUNCTIONS = {"wait", "select", "poll", "get", "sleep", "accept", "_worker", "_wait_for_tstate_lock"}
+
+
+def frame_label(frame) -> str:
+    """Name of one stack frame as shown in a flamegraph"""
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def folded_stack(frame) -> str:
+    """Stack of `frame` in collapsed form, root first, frames separated by ';'"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def format_folded(stacks: Counter) -> str:
+    """
+    Collapsed stack output, one "stack count" line per stack, as read by
+    flamegraph.pl, inferno and speedscope
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of running threads on a background thread
+
+    Args:
+        interval: Seconds between samples
+        thread_ids: Threads to sample, every other thread when None
+        skip_idle: Ignore threads parked in IDLE_FUNCTIONS
+        max_stacks: Distinct stacks kept before new ones count as [other]
+    """
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL,
+                 thread_ids: Optional[Iterable[int]] = None,
+                 skip_idle: bool = False, max_stacks: int = PROFILE_MAX_STACKS):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.skip_idle = skip_idle
+        self.max_stacks = max_stacks
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self):
+        """Record the current stack of every sampled thread once"""
+        own = threading.get_ident()
+        frames = sys._current_frames()
+        with self._lock:
+            self.samples += 1
+            for ident, frame in frames.items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                if self.skip_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                    continue
+                stack = folded_stack(frame)
+                if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                    stack = "[other]"
+                self.stacks[stack] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        """Start sampling"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, the collected stacks are kept"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def folded(self) -> str:
+        with self._lock:
+            return format_folded(self.stacks)
+
+    def hot_functions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Functions by share of samples, counting each stack once per function (inclusive)"""
+        with self._lock:
+            total = sum(self.stacks.values())
+            inclusive: Counter = Counter()
+            self_time: Counter = Counter()
+            for stack, count in self.stacks.items():
+                frames = stack.split(";")
+                for label in set(frames):
+                    inclusive[label] += count
+                self_time[frames[-1]] += count
+        return [
+            {"function": label, "inclusive": round(count / total, 4), "self": round(self_time[label] / total, 4)}
+            for label, count in inclusive.most_common(limit)
+        ] if total else []
+
+
+class Profiler:
+    """
+    Opt-in profiling of single requests, plus continuous sampling
+
+    A request is profiled when it carries an X-Profile header or when an
+    admin armed profiling for the next requests. Its blocking pipeline work
+    runs under cProfile (written as a .prof file for pstats or snakeviz) or
+    under a stack sampler (written as a .folded flamegraph input).
+    """
+    def __init__(self, enabled: bool = PROFILING_ENABLED, output_dir: str = PROFILE_DIR):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.continuous = StackSampler(CONTINUOUS_SAMPLE_INTERVAL, skip_idle=True)
+        self.profiled_requests = 0
+        self.recent: deque = deque(maxlen=50)
+        self._armed: List[str] = []
+        self._lock = threading.Lock()
+
+    def arm(self, mode: str, requests: int = 1):
+        """Profile the next `requests` pipeline runs, whatever their headers"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}', use one of: {', '.join(MODES)}")
+        with self._lock:
+            self._armed = [mode] * requests
+
+    def request_mode(self, header: Optional[str]) -> Optional[str]:
+        """Profiling mode of an incoming request, consuming an armed slot if any"""
+        if not self.enabled:
+            return None
+        if header:
+            mode = header.strip().lower()
+            if mode in MODES:
+                return mode
+            logger.warning(f"Ignoring unknown X-Profile mode: {header}")
+        with self._lock:
+            return self._armed.pop() if self._armed else None
+
+    def _path(self, label: str, extension: str) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.output_dir, f"{stamp}-{label}.{extension}")
+
+    def run(self, mode: str, label: str, fn: Callable, *args, **kwargs) -> Tuple[Any, str]:
+        """
+        Call `fn` under the given profiling mode on the current thread
+
+        Returns:
+            tuple: The result of `fn` and the path of the written profile
+        """
+        if mode == MODE_CPROFILE:
+            profile = cProfile.Profile()
+            path = self._path(label, "prof")
+            profile.enable()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                profile.dump_stats(path)
+        else:
+            sampler = StackSampler(PROFILE_SAMPLE_INTERVAL, thread_ids=[threading.get_ident()])
+            path = self._path(label, "folded")
+            sampler.start()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                sampler.stop()
+                with open(path, "w") as f:
+                    f.write(sampler.folded())
+        with self._lock:
+            self.profiled_requests += 1
+            self.recent.append(path)
+        logger.info(f"Wrote {mode} profile of {label} to {path}")
+        return result, path
+
+    def start_continuous(self):
+        if self.enabled and not self.continuous.running:
+            self.continuous.start()
+            logger.info("Continuous stack sampling started")
+
+    def stop_continuous(self):
+        if self.continuous.running:
+            self.continuous.stop()
+            logger.info("Continuous stack sampling stopped")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Profiler counters, for the metrics endpoint"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "armed": len(self._armed),
+                "profiled_requests": self.profiled_requests,
+                "continuous": self.continuous.running,
+                "continuous_samples": self.continuous.samples,
+                "recent": list(self.recent)[-5:],
+            }
+
+
+# Shared by the HTTP handlers and the pipeline threads
+profiler = Profiler()
@@ -1,24 +1,28 @@
 import os
 import logging
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from tenacity import retry, stop_after_attempt, wait_exponential
-from openai import OpenAI
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv
+from resilience import (
+    retry_call, db_breaker, get_breaker, DB_RETRY_POLICY, DB_CONNECT_TIMEOUT
+)
+from cache import TTLCache, normalize_question
+from answer_templates import (
+    templated_answer, summarize_results, answer_tier, compact_table, TIER_TEMPLATE, TIER_SHORT, TIER_FULL
+)
+from hedging import Hedger
+from structured_logging import log_event
+from targets import DEFAULT_TARGET
+from db_utils import get_db_schema, FALLBACK_SCHEMA_DDL
+from schema_pruning import SchemaGraph
+from sql_rewrite import rewrite_sql, SQL_REWRITE
 import asyncio
 import time
-
-# Import the Vanna integration module
-try:
-    # First try to import the real Vanna integration
-    from vanna_integration import setup_vanna, generate_sql
-    USING_MOCK = False
-except Exception as e:
-    # Fall back to mock implementation if real Vanna fails
-    logging.warning(f"Failed to import real Vanna integration: {str(e)}")
-    from mock_vanna_integration import setup_vanna, generate_sql
-    USING_MOCK = True
+from admission import (
+    admission, STAGE_QUERY, STAGE_SQL, STAGE_DB, STAGE_LLM, PRIORITY_FAST,
+    PRIORITY_INTERACTIVE
+)
 
 # Load environment variables
 load_dotenv()
@@ -27,25 +31,15 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Vanna AI using the integration module
-try:
-    # Set up Vanna AI with proper configuration and training
-    vn = setup_vanna()
-    logger.info("Vanna AI initialized and trained successfully")
-except Exception as e:
-    logger.error(f"Error initializing Vanna AI: {str(e)}")
-    # Fall back to mock implementation
-    from mock_vanna_integration import setup_vanna
-    vn = setup_vanna()
-    logger.info("Falling back to mock Vanna AI implementation")
-
-# Initialize OpenAI client
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
-
-# Create OpenAI client
-openai_client = OpenAI(api_key=openai_api_key)
+# Vanna and OpenAI clients are created on first use (or by warm_up) so that
+# importing this module stays cheap and the server binds its port right away
+vn = None
+generate_sql = None
+training_examples = []
+USING_MOCK = False
+openai_client = None
+_vanna_lock = threading.Lock()
+_openai_lock = threading.Lock()
 
 # Database connection parameters
 DB_PARAMS = {
@@ -56,28 +50,346 @@ DB_PARAMS = {
     'port': os.getenv('DB_PORT', '5432')
 }
 
+# Delay between streamed words, purely cosmetic
+STREAM_TOKEN_DELAY = float(os.getenv("STREAM_TOKEN_DELAY", "0.02"))
+
+# Latency SLOs; upstreams repeatedly slower than this are bypassed by their breaker
+VANNA_SLO_SECONDS = float(os.getenv("VANNA_SLO_SECONDS", "5"))
+OPENAI_SLO_SECONDS = float(os.getenv("OPENAI_SLO_SECONDS", "8"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
+
+# Match questions against the local rules before asking Vanna
+LOCAL_SQL_RULES = os.getenv("LOCAL_SQL_RULES", "1") == "1"
+# Generate SQL from locally retrieved context before asking Vanna, see vector_index.py
+LOCAL_SQL_GENERATION = os.getenv("LOCAL_SQL_GENERATION", "1") == "1"
+# Put only the tables and columns relevant to a question in the prompt, see schema_pruning.py
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "1") == "1"
+# Completion budgets of medium and large results, see answer_tier
+ANSWER_SHORT_MAX_TOKENS = int(os.getenv("ANSWER_SHORT_MAX_TOKENS", "150"))
+ANSWER_FULL_MAX_TOKENS = int(os.getenv("ANSWER_FULL_MAX_TOKENS", "500"))
+
+# Fast paths of SQL generation and answer explanation
+sql_cache = TTLCache(
+    max_entries=int(os.getenv("SQL_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SQL_CACHE_TTL", "3600"))
+)
+answer_cache = TTLCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "300"))
+)
+_rule_matcher = None
+
+# How answers were produced: cache, template, short or full completion
+answer_tiers = Counter()
+_answer_tiers_lock = threading.Lock()
+
+# Retrieval index over the schema and training examples, and the foreign key
+# graph of the schema, built on first use
+local_index = None
+schema_graph = None
+_index_lock = threading.Lock()
+
+# Duplicate slow OpenAI completions, see HEDGE_* settings; one per kind of
+# completion, their latencies are too far apart to share a hedge delay
+llm_hedgers = {
+    "sql": Hedger("openai-sql"),
+    TIER_SHORT: Hedger("openai-answer-short"),
+    TIER_FULL: Hedger("openai-answer-full"),
+}
+
+
+def get_vanna():
+    """Set up Vanna AI on first use, falling back to the mock implementation"""
+    global vn, generate_sql, training_examples, USING_MOCK
+    if vn is not None:
+        return vn
+    with _vanna_lock:
+        if vn is not None:
+            return vn
+
+        # Import the Vanna integration module
+        try:
+            # First try to import the real Vanna integration
+            from vanna_integration import setup_vanna, generate_sql as _generate_sql, TRAINING_EXAMPLES
+            using_mock = False
+        except Exception as e:
+            # Fall back to mock implementation if real Vanna fails
+            logger.warning(f"Failed to import real Vanna integration: {str(e)}")
+            from mock_vanna_integration import setup_vanna, generate_sql as _generate_sql, TRAINING_EXAMPLES
+            using_mock = True
+
+        try:
+            # Set up Vanna AI with proper configuration and training
+            instance = setup_vanna()
+            logger.info("Vanna AI initialized and trained successfully")
+        except Exception as e:
+            logger.error(f"Error initializing Vanna AI: {str(e)}")
+            # Fall back to mock implementation
+            from mock_vanna_integration import setup_vanna, generate_sql as _generate_sql, TRAINING_EXAMPLES
+            instance = setup_vanna()
+            using_mock = True
+            logger.info("Falling back to mock Vanna AI implementation")
+
+        generate_sql, USING_MOCK = _generate_sql, using_mock
+        training_examples = TRAINING_EXAMPLES
+        vn = instance
+        return vn
+
+
+def get_training_questions() -> list:
+    """Questions the active Vanna integration was trained with"""
+    get_vanna()
+    return [example["question"] for example in training_examples]
+
+
+def get_openai_client():
+    """Create the OpenAI client on first use"""
+    global openai_client
+    if openai_client is not None:
+        return openai_client
+    with _openai_lock:
+        if openai_client is None:
+            openai_api_key = os.getenv("OPENAI_API_KEY")
+            if not openai_api_key:
+                raise ValueError("OPENAI_API_KEY environment variable is not set")
+            from openai import OpenAI
+            openai_client = OpenAI(
+                api_key=openai_api_key,
+                timeout=OPENAI_TIMEOUT,
+                max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "1"))
+            )
+        return openai_client
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Initialize the Vanna and OpenAI clients ahead of the first request
+
+    Returns:
+        dict: Readiness details of each dependency
+    """
+    status = {}
+    get_vanna()
+    status["vanna"] = "mock" if USING_MOCK else "remote"
+    if LOCAL_SQL_GENERATION:
+        status["local_index"] = len(get_local_index())
+    try:
+        get_openai_client()
+        status["openai"] = "ready"
+    except Exception as e:
+        logger.error(f"OpenAI client unavailable, answers will use the fallback: {str(e)}")
+        status["openai"] = "unavailable"
+    return status
+
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 def get_db_connection():
-    """Get a database connection with retry logic"""
-    return psycopg2.connect(**DB_PARAMS, cursor_factory=RealDictCursor)
+    """Get a database connection, retrying briefly and failing fast while Postgres is down"""
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    return retry_call(
+        psycopg2.connect, DB_RETRY_POLICY, db_breaker(),
+        **DB_PARAMS, cursor_factory=RealDictCursor, connect_timeout=DB_CONNECT_TIMEOUT
+    )
+
+
+def is_default_target(target) -> bool:
+    """Whether a request runs against the database configured by DB_* settings"""
+    return target is None or target.id == DEFAULT_TARGET
+
+
+def setup_target_vanna(target):
+    """Vanna model of a registered database target, trained on its schema"""
+    get_vanna()
+    if USING_MOCK:
+        from mock_vanna_integration import setup_vanna as setup_mock_vanna
+        return setup_mock_vanna()
+    from vanna_integration import initialize_vanna, train_with_schema
+    instance = initialize_vanna(target.connection_string(), model=f"votebank-{target.id}")
+    train_with_schema(instance, target.schema_ddl())
+    logger.info(f"Trained Vanna AI for database target {target.id}")
+    return instance
+
+
+def get_rule_matcher():
+    """Local pattern matcher used as the first SQL generator"""
+    global _rule_matcher
+    if _rule_matcher is None:
+        from mock_vanna_integration import MockVannaAI
+        _rule_matcher = MockVannaAI()
+    return _rule_matcher
+
+
+def _sql_key(natural_query: str, target=None):
+    """SQL cache key of a question, per database target"""
+    key = normalize_question(natural_query)
+    return key if is_default_target(target) else (target.id, key)
+
+
+def get_local_index():
+    """Vector index of the default database's DDL and the training examples"""
+    global local_index, schema_graph
+    if local_index is not None:
+        return local_index
+    with _index_lock:
+        if local_index is None:
+            from vector_index import build_index
+            get_vanna()
+            schema_ddl = get_db_schema() or FALLBACK_SCHEMA_DDL
+            schema_graph = SchemaGraph(schema_ddl)
+            local_index = build_index(schema_ddl, training_examples)
+    return local_index
+
+
+def get_schema_graph() -> SchemaGraph:
+    """Foreign key graph of the default database's schema"""
+    get_local_index()
+    return schema_graph
+
+
+def _extract_sql(text: str) -> str:
+    """SQL of a completion, without the markdown fence models like to add"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text.strip()
+
+
+def generate_sql_locally(natural_query: str) -> Optional[str]:
+    """
+    Generate SQL from context retrieved by the local index
+
+    The SQL of a training example is reused as is only when the example
+    is the same question; similar ones may differ in a qualifier such as a
+    state or a limit, so they only go in the prompt. The most relevant DDL
+    chunks and examples are put in a prompt for OpenAI, so Vanna's remote
+    retrieval is not needed.
+    """
+    from vector_index import generation_context
+    context = generation_context(get_local_index(), natural_query, tables=0 if SCHEMA_PRUNING else 3)
+    key = normalize_question(natural_query)
+    for example in context["examples"]:
+        if normalize_question(example["text"]) == key:
+            logger.info("SQL served by a matching training example")
+            return example["sql"]
+
+    if SCHEMA_PRUNING:
+        ddl = get_schema_graph().prune(natural_query)
+    else:
+        ddl = "\n\n".join(chunk["text"] for chunk in context["ddl"])
+    if not ddl:
+        return None
+    examples = "\n\n".join(f"-- {example['text']}\n{example['sql']}" for example in context["examples"])
+    prompt = f"""PostgreSQL schema:
+{ddl}
+
+Example questions and queries:
+{examples}
+
+Write one PostgreSQL query answering: {natural_query}
+Reply with the SQL only."""
+    breaker = get_breaker("openai", slo_seconds=OPENAI_SLO_SECONDS)
+    response = breaker.call(
+        llm_hedgers["sql"].call,
+        get_openai_client().chat.completions.create,
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": "You translate questions into SQL for the schema you are given. "
+                                          "Search text through tsvector columns with @@ websearch_to_tsquery('english', ...) "
+                                          "and JSONB columns with @>, ? or ?| rather than ILIKE."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0,
+        max_tokens=300
+    )
+    return _extract_sql(response.choices[0].message.content) or None
+
+
+def lookup_sql(natural_query: str, target=None) -> Optional[str]:
+    """Fast path of SQL generation: the cache, then the local rule matcher"""
+    key = _sql_key(natural_query, target)
+    sql_query = sql_cache.get(key)
+    if sql_query is not None:
+        logger.info("SQL served from cache")
+        return sql_query
+    # The rules are written for the votebank schema
+    if LOCAL_SQL_RULES and is_default_target(target):
+        sql_query = get_rule_matcher().match_sql(natural_query)
+        if sql_query is not None:
+            logger.info("SQL served by the local rule matcher")
+            sql_cache.set(key, sql_query)
+            return sql_query
+    return None
 
 
-def generate_sql_query(natural_query: str) -> str:
-    """Generate SQL query using Vanna AI"""
+def generate_sql_query(natural_query: str, target=None, fast_path: bool = True) -> str:
+    """
+    Generate SQL query: cache, then local rules, then Vanna AI behind its breaker
+
+    With `fast_path` False the cache and rules are skipped, for questions
+    whose fast path SQL failed to run.
+    """
     try:
-        sql_query = generate_sql(vn, natural_query)
-        logger.info(f"Generated SQL query: {sql_query}")
+        sql_query = lookup_sql(natural_query, target) if fast_path else None
+        if sql_query is not None:
+            return sql_query
+
+        if LOCAL_SQL_GENERATION and is_default_target(target):
+            try:
+                sql_query = generate_sql_locally(natural_query)
+            except Exception as e:
+                logger.warning(f"Local SQL generation failed, asking Vanna: {str(e)}")
+            if sql_query is not None:
+                log_event(logger, "sql", "Generated SQL query locally", sql=sql_query)
+                sql_cache.set(_sql_key(natural_query, target), sql_query)
+                return sql_query
+
+        instance = get_vanna()
+        if not is_default_target(target):
+            instance = target.vanna(setup_target_vanna)
+        if USING_MOCK:
+            sql_query = generate_sql(instance, natural_query)
+        else:
+            breaker = get_breaker("vanna", slo_seconds=VANNA_SLO_SECONDS)
+            sql_query = breaker.call(generate_sql, instance, natural_query)
+        log_event(logger, "sql", "Generated SQL query", sql=sql_query)
+        sql_cache.set(_sql_key(natural_query, target), sql_query)
         return sql_query
     except Exception as e:
         logger.error(f"Error generating SQL query: {str(e)}")
         raise
 
 
-def execute_sql_query(sql_query: str) -> list:
-    """Execute SQL query and return results"""
+def sql_for_question(natural_query: str, priority: int = PRIORITY_INTERACTIVE,
+                     deadline: Optional[float] = None, target=None) -> str:
+    """SQL of a question outside the full pipeline, such as for an export"""
+    sql_query = lookup_sql(natural_query, target)
+    if sql_query is not None:
+        return sql_query
+    with admission.admit(STAGE_SQL, priority, deadline):
+        return generate_sql_query(natural_query, target)
+
+
+def rewrite_for_execution(sql_query: str, natural_query: str, target=None) -> str:
+    """Generated SQL as it is run: stars expanded to relevant columns, long text cut"""
+    if not SQL_REWRITE:
+        return sql_query
     try:
-        with get_db_connection() as conn:
+        graph = get_schema_graph() if is_default_target(target) else SchemaGraph(target.schema_ddl())
+        rewritten = rewrite_sql(sql_query, natural_query, graph)
+    except Exception as e:
+        logger.warning(f"Could not rewrite SQL, running it as generated: {str(e)}")
+        return sql_query
+    if rewritten != sql_query:
+        log_event(logger, "sql", "Rewrote SQL for execution", sql=rewritten)
+    return rewritten
+
+
+def execute_sql_query(sql_query: str, target=None) -> list:
+    """Execute SQL query and return results, on the default database or a registered target"""
+    connect = get_db_connection if is_default_target(target) else target.connection
+    try:
+        with connect() as conn:
             with conn.cursor() as cur:
                 cur.execute(sql_query)
                 results = cur.fetchall()
@@ -87,77 +399,211 @@ def execute_sql_query(sql_query: str) -> list:
         raise
 
 
+def _answer_key(query: str, sql_query: str, results: list) -> tuple:
+    """Cache key of an explanation, tied to the exact results it explains"""
+    return (normalize_question(query), sql_query.strip(), hash(repr(results)))
+
+
+def _count_tier(tier: str):
+    with _answer_tiers_lock:
+        answer_tiers[tier] += 1
+
+
+def answer_tiers_snapshot() -> Dict[str, int]:
+    """Answers by the way they were produced, for the metrics endpoint"""
+    with _answer_tiers_lock:
+        return dict(answer_tiers)
+
+
+def lookup_answer(query: str, sql_query: str, results: list) -> Optional[str]:
+    """Fast path of answer generation: the cache, then a templated answer"""
+    answer = answer_cache.get(_answer_key(query, sql_query, results))
+    if answer is not None:
+        logger.info("Answer served from cache")
+        _count_tier("cache")
+        return answer
+    answer = templated_answer(query, results)
+    if answer is not None:
+        _count_tier(TIER_TEMPLATE)
+    return answer
+
+
+def _short_completion(query: str, results: list) -> Dict[str, Any]:
+    """Arguments of a brief completion for a medium sized result"""
+    return {
+        "messages": [
+            {"role": "system", "content": "You answer questions about election data in one to three sentences, using the exact names and numbers given."},
+            {"role": "user", "content": f"Question: {query}\nResults ({len(results)} rows):\n{compact_table(results)}"}
+        ],
+        "temperature": 0.3,
+        "max_tokens": ANSWER_SHORT_MAX_TOKENS,
+    }
+
+
+def _full_completion(query: str, sql_query: str, results: list) -> Dict[str, Any]:
+    """Arguments of the full completion, for large or wide results"""
+    # Format the results for better readability
+    formatted_results = []
+    for row in results:
+        # Convert RealDictRow to regular dict for better serialization
+        row_dict = dict(row)
+        formatted_results.append(row_dict)
+    
+    # Prepare the prompt for OpenAI with better formatting
+    prompt = f"""Given the following:
+    - User's question: "{query}"
+    - SQL query used: "{sql_query.strip()}"
+    - Query results: {formatted_results}
+
+    Please provide a natural language response that explains the results in a clear and concise way. 
+    Be specific about the numbers and data shown in the results. 
+    If the results are empty, explain that no data was found matching the criteria.
+    Use the actual names, numbers, and values from the results in your explanation."""
+
+    return {
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant that explains database query results in natural language. Always refer to the specific data in the results when answering."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.7,
+        "max_tokens": ANSWER_FULL_MAX_TOKENS,
+    }
+
+
 def generate_natural_response(query: str, sql_query: str, results: list) -> str:
-    """Generate natural language response using OpenAI"""
-    try:
-        # Format the results for better readability
-        formatted_results = []
-        for row in results:
-            # Convert RealDictRow to regular dict for better serialization
-            row_dict = dict(row)
-            formatted_results.append(row_dict)
-        
-        # Prepare the prompt for OpenAI with better formatting
-        prompt = f"""Given the following:
-        - User's question: "{query}"
-        - SQL query used: "{sql_query.strip()}"
-        - Query results: {formatted_results}
+    """
+    Generate natural language response: cache, then a template, then OpenAI behind its breaker
 
-        Please provide a natural language response that explains the results in a clear and concise way. 
-        Be specific about the numbers and data shown in the results. 
-        If the results are empty, explain that no data was found matching the criteria.
-        Use the actual names, numbers, and values from the results in your explanation."""
+    Scalar and tiny results are templated, medium results get a short
+    completion with a small token budget, and only large or wide results
+    the full completion, see answer_tier.
+    """
+    answer = lookup_answer(query, sql_query, results)
+    if answer is not None:
+        return answer
+    try:
+        tier = answer_tier(results)
+        if tier == TIER_SHORT:
+            completion = _short_completion(query, results)
+        else:
+            completion = _full_completion(query, sql_query, results)
 
-        # Log the prompt for debugging
-        logger.info(f"OpenAI prompt: {prompt}")
+        # Sampled and capped, the prompt carries every result row
+        log_event(logger, "llm.prompt", "OpenAI prompt", logging.DEBUG,
+                  prompt=completion["messages"][-1]["content"], tier=tier)
 
         # Use the new OpenAI API format
-        response = openai_client.chat.completions.create(
+        breaker = get_breaker("openai", slo_seconds=OPENAI_SLO_SECONDS)
+        response = breaker.call(
+            llm_hedgers[TIER_SHORT if tier == TIER_SHORT else TIER_FULL].call,
+            get_openai_client().chat.completions.create,
             model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that explains database query results in natural language. Always refer to the specific data in the results when answering."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
+            **completion
         )
 
         # Get the response content
         response_text = response.choices[0].message.content
         
-        # Log the response for debugging
-        logger.info(f"OpenAI response: {response_text}")
+        log_event(logger, "llm.response", "OpenAI response", logging.DEBUG, response=response_text)
         
+        _count_tier(tier)
+        answer_cache.set(_answer_key(query, sql_query, results), response_text)
         return response_text
     except Exception as e:
         logger.error(f"Error generating natural response: {str(e)}")
-        # Provide a fallback response with the raw results
-        return f"Based on your question '{query}', I found the following results: {results}"
+        # Provide a fallback response listing the results
+        return summarize_results(query, results)
+
+
 
+def process_query(query: str, priority: int = PRIORITY_INTERACTIVE,
+                  deadline: Optional[float] = None, target=None) -> Dict[str, Any]:
+    """
+    Process the user query and return results
 
-def process_query(query: str) -> Dict[str, Any]:
-    """Process the user query and return results"""
+    Each stage runs under admission control; `priority` orders waiters and
+    `deadline` (a time.monotonic() value) bounds how long they may wait.
+    `target` is a registered DatabaseTarget, the default database when None.
+    """
     try:
-        # Generate SQL query using Vanna AI
-        sql_query = generate_sql_query(query)
-        
-        # Execute the SQL query
-        results = execute_sql_query(sql_query)
-        
-        # Generate natural language response using OpenAI
-        natural_response = generate_natural_response(query, sql_query, results)
+        timings = {}
+
+        # Cached and rule matched questions are admitted ahead of cold work
+        started = time.perf_counter()
+        fast_sql = lookup_sql(query, target)
+        if fast_sql is not None:
+            priority = min(priority, PRIORITY_FAST)
+
+        with admission.admit(STAGE_QUERY, priority, deadline):
+            # Generate SQL query using Vanna AI
+            if fast_sql is not None:
+                sql_query = fast_sql
+            else:
+                with admission.admit(STAGE_SQL, priority, deadline):
+                    sql_query = generate_sql_query(query, target)
+            timings["sql_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            
+            # Execute the SQL query, rewritten to read only what the answer needs
+            started = time.perf_counter()
+            executed_sql = rewrite_for_execution(sql_query, query, target)
+            with admission.admit(STAGE_DB, priority, deadline):
+                try:
+                    results = execute_sql_query(executed_sql, target)
+                except Exception as e:
+                    # Only statements Postgres rejected are retried, not connection failures
+                    if fast_sql is None or getattr(e, "pgcode", None) is None:
+                        raise
+                    logger.warning(f"Cached or rule matched SQL failed, generating it again: {str(e)}")
+                    sql_cache.pop(_sql_key(query, target))
+                    results = None
+            if results is None:
+                with admission.admit(STAGE_SQL, priority, deadline):
+                    sql_query = generate_sql_query(query, target, fast_path=False)
+                executed_sql = rewrite_for_execution(sql_query, query, target)
+                with admission.admit(STAGE_DB, priority, deadline):
+                    results = execute_sql_query(executed_sql, target)
+            timings["db_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            
+            # Generate natural language response using OpenAI
+            started = time.perf_counter()
+            natural_response = lookup_answer(query, sql_query, results)
+            if natural_response is None:
+                with admission.admit(STAGE_LLM, priority, deadline):
+                    natural_response = generate_natural_response(query, sql_query, results)
+            timings["llm_ms"] = round((time.perf_counter() - started) * 1000, 2)
         
         return {
             "sql_query": sql_query,
             "results": results,
-            "natural_response": natural_response
+            "natural_response": natural_response,
+            "timings": timings
         }
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise
 
 
-async def stream_response(response: Dict[str, Any]):
+def explain_results(query: str, sql_query: str, results: list,
+                    priority: int = PRIORITY_INTERACTIVE,
+                    deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Answer a question whose results were obtained without running SQL,
+    such as rows served from the in-memory vote tally
+    """
+    started = time.perf_counter()
+    natural_response = lookup_answer(query, sql_query, results)
+    if natural_response is None:
+        with admission.admit(STAGE_LLM, priority, deadline):
+            natural_response = generate_natural_response(query, sql_query, results)
+    return {
+        "sql_query": sql_query,
+        "results": results,
+        "natural_response": natural_response,
+        "timings": {"llm_ms": round((time.perf_counter() - started) * 1000, 2)}
+    }
+
+
+async def stream_response(response: Dict[str, Any], delay: float = STREAM_TOKEN_DELAY):
     """
     Stream the response from the model
     """
@@ -172,7 +618,8 @@ async def stream_response(response: Dict[str, Any]):
         words = response_text.split()
         for word in words:
             yield word + " "
-            await asyncio.sleep(0.1)  # Add a small delay between words
+            if delay:
+                await asyncio.sleep(delay)  # Add a small delay between words
     except Exception as e:
         logger.error(f"Error streaming response: {str(e)}")
         raise Exception(f"Error streaming response: {str(e)}")
@@ -0,0 +1,228 @@
+import os
+import math
+import time
+import random
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Defaults, overridable per dependency
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "10"))
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the dependency while its breaker is open"""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open, failing fast")
+        self.name = name
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class LocalLimitError(Exception):
+    """
+    Raised when a call is refused by a local limit, such as an exhausted
+    connection pool; it says nothing about the dependency, so it is neither
+    retried nor counted as a failure
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by every caller of one dependency
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    calls fail immediately. Once `reset_timeout` has passed a single probe
+    call is let through (half open); its outcome closes or reopens the
+    breaker. With a latency SLO, calls slower than `slo_seconds` count as
+    failures even though their result is still used.
+    """
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT,
+                 slo_seconds: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slo_seconds = slo_seconds
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.slow_calls = 0
+        self.opened_at = 0.0
+        self.transitions: Dict[str, int] = {}
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        """Move to `state`, counting and logging the transition"""
+        if state == self.state:
+            return
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        logger.warning(f"Circuit '{self.name}' {key}")
+        self.state = state
+        if state == STATE_OPEN:
+            self.opened_at = time.monotonic()
+
+    def before_call(self):
+        """
+        Check whether a call may proceed
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half open with a probe running
+        """
+        with self._lock:
+            if self.state == STATE_OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(STATE_HALF_OPEN)
+            if self.state == STATE_HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._probe_in_flight = True
+
+    def record_success(self, duration: Optional[float] = None):
+        """Record a successful call, a failure if it took longer than the SLO"""
+        if self.slo_seconds is not None and duration is not None and duration > self.slo_seconds:
+            logger.warning(f"Circuit '{self.name}' call took {duration:.2f}s, over its {self.slo_seconds}s SLO")
+            with self._lock:
+                self.slow_calls += 1
+            self.record_failure()
+            return
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._transition(STATE_CLOSED)
+
+    def record_failure(self):
+        """Record a failed call"""
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                self._transition(STATE_OPEN)
+
+    def cancel_call(self):
+        """Forget a call that never reached the dependency"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Call `fn` through the breaker"""
+        self.before_call()
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except LocalLimitError:
+            self.cancel_call()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current state and transition counters, for the metrics endpoint"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "slow_calls": self.slow_calls,
+                "transitions": dict(self.transitions),
+            }
+
+
+class RetryPolicy:
+    """
+    Short exponential backoff with full jitter
+
+    Args:
+        attempts: Total number of attempts, including the first one
+        base_delay: Backoff before the second attempt, doubled per attempt
+        max_delay: Upper bound of a single backoff
+    """
+    def __init__(self, attempts: int = 3, base_delay: float = 0.1, max_delay: float = 1.0,
+                 retry_on: Tuple[Type[BaseException], ...] = (Exception,)):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def backoff(self, attempt: int) -> float:
+        """Jittered delay after the given (zero based) failed attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def retry_call(fn: Callable, policy: RetryPolicy, breaker: Optional[CircuitBreaker] = None,
+               *args, **kwargs) -> Any:
+    """
+    Call `fn` with retries, failing fast while `breaker` is open
+
+    Raises:
+        CircuitOpenError: If the breaker is open
+        LocalLimitError: Right away, without counting it against the breaker
+        Exception: The last error once all attempts are used up
+    """
+    for attempt in range(policy.attempts):
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except LocalLimitError:
+            if breaker is not None:
+                breaker.cancel_call()
+            raise
+        except policy.retry_on as e:
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt + 1 >= policy.attempts:
+                raise
+            delay = policy.backoff(attempt)
+            logger.warning(f"Attempt {attempt + 1} of {policy.attempts} failed: {str(e)}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Get the process-wide breaker for a dependency, creating it on first use"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **kwargs)
+        return _breakers[name]
+
+
+def breakers_snapshot() -> Dict[str, Dict[str, Any]]:
+    """State of every breaker"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+# Database connects: a few quick attempts, then fail fast while Postgres is down
+DB_RETRY_POLICY = RetryPolicy(
+    attempts=int(os.getenv("DB_RETRY_ATTEMPTS", "3")),
+    base_delay=float(os.getenv("DB_RETRY_BASE_DELAY", "0.05")),
+    max_delay=float(os.getenv("DB_RETRY_MAX_DELAY", "0.5")),
+)
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+
+
+def db_breaker() -> CircuitBreaker:
+    """Breaker shared by every Postgres connect in the process"""
+    return get_breaker("postgres")
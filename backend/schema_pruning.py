@@ -0,0 +1,282 @@
+import os
+import re
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns kept per table in a pruned schema, keys and question matches included
+SCHEMA_MAX_COLUMNS = int(os.getenv("SCHEMA_MAX_COLUMNS", "12"))
+# Share of a column name's words the question must mention to keep a large column
+SCHEMA_LARGE_MATCH = float(os.getenv("SCHEMA_LARGE_MATCH", "0.5"))
+# Share of a non-key column name's words the question must mention to bring in its table;
+# one word of a column of up to three words is enough
+SCHEMA_TABLE_MATCH = float(os.getenv("SCHEMA_TABLE_MATCH", "0.3"))
+
+# Column types whose values are long documents rather than attributes
+LARGE_TYPES = ("text", "json", "xml", "bytea", "tsvector")
+# Columns that name a row, kept so answers can refer to rows by name
+LABEL_COLUMNS = ("name", "title", "username", "label")
+
+# Words that never identify a table or column
+STOP_WORDS = {
+    "the", "and", "for", "with", "what", "which", "who", "whom", "how", "many", "much",
+    "are", "is", "was", "were", "has", "have", "had", "does", "did", "do", "show", "list",
+    "give", "tell", "all", "each", "every", "any", "from", "that", "this", "there", "their",
+    "by", "of", "in", "on", "to", "me", "top", "most", "least", "than", "more", "less", "per",
+    "id", "at", "not", "yet", "get", "got", "search",
+}
+# Question words that refer to a table or column under another name
+SYNONYMS = {
+    "voter": "user", "voters": "user", "people": "user", "member": "user", "members": "user",
+    "politician": "candidate", "politicians": "candidate", "contestant": "candidate",
+    "money": "budget", "spend": "budget", "spending": "budget", "funds": "fundraising",
+    "twitter": "social", "instagram": "social", "facebook": "social",
+    "born": "birth", "age": "birth", "crime": "criminal", "crimes": "criminal",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CREATE = re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\(", re.IGNORECASE)
+_REFERENCES = re.compile(r"REFERENCES\s+(\w+)\s*\(\s*(\w+)\s*\)", re.IGNORECASE)
+
+
+def stem(word: str) -> str:
+    """Crude stem shared by question words and identifiers: 'votes', 'voted' and 'voter' become 'vote'"""
+    return word[:4] if len(word) > 4 else word.rstrip("s")
+
+
+def question_stems(question: str) -> Set[str]:
+    """Stems of the meaningful words of a question, synonyms resolved"""
+    words = _WORD.findall(question.lower())
+    return {stem(SYNONYMS.get(word, word)) for word in words if word not in STOP_WORDS and len(word) > 2}
+
+
+def identifier_stems(name: str) -> List[str]:
+    """Stems of the parts of a snake_case identifier, without generic parts like 'id'"""
+    return [stem(part) for part in name.lower().split("_") if part and part not in STOP_WORDS]
+
+
+def _split_items(body: str) -> List[str]:
+    """Comma separated items of a CREATE TABLE body, ignoring commas inside parentheses"""
+    items, depth, current = [], 0, []
+    for char in body:
+        if char == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+            continue
+        depth += (char == "(") - (char == ")")
+        current.append(char)
+    items.append("".join(current).strip())
+    return [item for item in items if item]
+
+
+def _columns_in(item: str) -> List[str]:
+    """Column names listed in the first parentheses of a constraint"""
+    match = re.search(r"\(([^()]*)", item)
+    return [name.strip().split()[0] for name in match.group(1).split(",") if name.strip()] if match else []
+
+
+def table_statements(schema_ddl: str) -> List[Tuple[str, str]]:
+    """(table name, CREATE TABLE statement) pairs of a schema DDL"""
+    statements = []
+    for match in _CREATE.finditer(schema_ddl):
+        depth, end = 1, match.end()
+        while end < len(schema_ddl) and depth:
+            depth += (schema_ddl[end] == "(") - (schema_ddl[end] == ")")
+            end += 1
+        statements.append((match.group(1), schema_ddl[match.start():end].strip() + ";"))
+    return statements
+
+
+class Table:
+    """Columns and keys of one table, parsed from its CREATE TABLE statement"""
+    def __init__(self, name: str, statement: str):
+        self.name = name
+        self.columns: Dict[str, str] = {}
+        self.primary_key: List[str] = []
+        self.foreign_keys: List[Tuple[str, str, str]] = []
+        body = statement[statement.index("(") + 1:statement.rindex(")")]
+        for item in _split_items(body):
+            keyword = re.match(r"\w*", item).group(0).upper()
+            if keyword == "PRIMARY":
+                self.primary_key.extend(_columns_in(item))
+            elif keyword == "FOREIGN":
+                # Both 'FOREIGN KEY (a) REFERENCES t(b)' and the 'FOREIGN KEY (a REFERENCES t(b))' of get_db_schema
+                reference = _REFERENCES.search(item)
+                if reference:
+                    self.foreign_keys.append((_columns_in(item)[0], reference.group(1), reference.group(2)))
+            elif keyword not in ("UNIQUE", "CONSTRAINT", "CHECK", "EXCLUDE"):
+                column = item.split()[0]
+                self.columns[column] = item
+                if "PRIMARY KEY" in item.upper():
+                    self.primary_key.append(column)
+                reference = _REFERENCES.search(item)
+                if reference:
+                    self.foreign_keys.append((column, reference.group(1), reference.group(2)))
+
+    def column_type(self, column: str) -> str:
+        """Lowercase type of a column, followed by its constraints"""
+        return self.columns[column][len(column):].strip().lower()
+
+    def is_large(self, column: str) -> bool:
+        """Whether a column holds documents, such as TEXT or JSONB, rather than attributes"""
+        return self.column_type(column).startswith(LARGE_TYPES)
+
+    @property
+    def key_columns(self) -> List[str]:
+        return self.primary_key + [column for column, _, _ in self.foreign_keys]
+
+
+class SchemaGraph:
+    """
+    Tables of a schema linked by their foreign keys
+
+    prune() renders only the part of the schema a question needs: the
+    tables it mentions, the tables joining them, and in each table the key,
+    label and mentioned columns, so a wide table with many TEXT and JSONB
+    documents no longer fills the generation prompt.
+    """
+    def __init__(self, schema_ddl: str):
+        self.tables: Dict[str, Table] = {}
+        for name, statement in table_statements(schema_ddl):
+            self.tables[name] = Table(name, statement)
+        self.neighbours: Dict[str, Set[str]] = {name: set() for name in self.tables}
+        for table in self.tables.values():
+            for _, referenced, _ in table.foreign_keys:
+                if referenced in self.tables and referenced != table.name:
+                    self.neighbours[table.name].add(referenced)
+                    self.neighbours[referenced].add(table.name)
+        self.prunes = 0
+        self.columns_kept = 0
+        self.columns_total = 0
+        self._lock = threading.Lock()
+
+    def column_score(self, column: str, stems: Set[str]) -> float:
+        """Share of a column name's words mentioned by the question"""
+        parts = identifier_stems(column)
+        return sum(part in stems for part in parts) / len(parts) if parts else 0.0
+
+    def rank_columns(self, table_name: str, question: str) -> List[Tuple[float, str]]:
+        """
+        Columns of a table by relevance to a question, best first
+
+        Keys and label columns always score above zero, and large columns
+        score zero unless the question names them.
+        """
+        return self._rank_columns(self.tables[table_name], question_stems(question))
+
+    def _rank_columns(self, table: Table, stems: Set[str]) -> List[Tuple[float, str]]:
+        keys = set(table.key_columns)
+        ranked = []
+        for position, column in enumerate(table.columns):
+            score = self.column_score(column, stems)
+            if table.is_large(column):
+                score = score if score >= SCHEMA_LARGE_MATCH else 0.0
+            elif column in keys or column in LABEL_COLUMNS:
+                score = max(score, 0.5)
+            else:
+                # Small attributes rank by position, after everything mentioned
+                score = max(score, 0.1 / (1 + position))
+            ranked.append((score, column))
+        ranked.sort(key=lambda pair: -pair[0])
+        return ranked
+
+    def mentioned_tables(self, stems: Set[str]) -> List[str]:
+        """Tables named by the question, directly or through one of their non-key columns"""
+        seeds = [name for name in self.tables if set(identifier_stems(name)) & stems]
+        # Words naming a table do not also pull in other tables through columns like voter_id
+        remaining = stems.difference(*(identifier_stems(name) for name in seeds))
+        for name, table in self.tables.items():
+            keys = set(table.key_columns)
+            if name not in seeds and any(
+                self.column_score(column, remaining) >= SCHEMA_TABLE_MATCH
+                for column in table.columns if column not in keys
+            ):
+                seeds.append(name)
+        return seeds
+
+    def relevant_tables(self, question: str) -> List[str]:
+        """
+        Tables a question mentions, plus the tables on the foreign key paths
+        joining them
+        """
+        return self._join(self.mentioned_tables(question_stems(question)))
+
+    def _join(self, seeds: List[str]) -> List[str]:
+        if not seeds:
+            return []
+        selected = [seeds[0]]
+        for seed in seeds[1:]:
+            for name in self._path(seed, set(selected)):
+                if name not in selected:
+                    selected.append(name)
+        return selected
+
+    def _path(self, start: str, goals: Set[str]) -> List[str]:
+        """Shortest foreign key path from `start` to any of `goals`, just `start` if none"""
+        previous: Dict[str, Optional[str]] = {start: None}
+        queue = deque([start])
+        while queue:
+            name = queue.popleft()
+            if name in goals:
+                path = []
+                while name is not None:
+                    path.append(name)
+                    name = previous[name]
+                return path
+            for neighbour in self.neighbours[name]:
+                if neighbour not in previous:
+                    previous[neighbour] = name
+                    queue.append(neighbour)
+        return [start]
+
+    def prune(self, question: str, max_columns: int = SCHEMA_MAX_COLUMNS) -> str:
+        """
+        DDL of the tables and columns relevant to a question
+
+        Falls back to every table when the question mentions none of them.
+        """
+        stems = question_stems(question)
+        seeds = self.mentioned_tables(stems) or list(self.tables)
+        selected = self._join(seeds)
+        statements, kept_total = [], 0
+        for name in selected:
+            table = self.tables[name]
+            joins = [(column, referenced, referenced_column) for column, referenced, referenced_column
+                     in table.foreign_keys if referenced in selected]
+            required = set(table.primary_key) | {column for column, _, _ in joins}
+            # Tables only there for a join keep their keys, labels and mentioned columns
+            threshold = 0.0 if name in seeds else 0.5
+            ranked = [column for score, column in self._rank_columns(table, stems)
+                      if column not in required and score > threshold]
+            kept = required | set(ranked[:max(0, max_columns - len(required))])
+            lines = [f"    {table.columns[column]}" for column in table.columns if column in kept]
+            if table.primary_key and not any("PRIMARY KEY" in table.columns[c].upper() for c in table.primary_key):
+                lines.append(f"    PRIMARY KEY ({', '.join(table.primary_key)})")
+            for column, referenced, referenced_column in joins:
+                if "REFERENCES" not in table.columns[column].upper():
+                    lines.append(f"    FOREIGN KEY ({column}) REFERENCES {referenced}({referenced_column})")
+            statement = f"CREATE TABLE {name} (\n" + ",\n".join(lines) + "\n);"
+            omitted = len(table.columns) - len(kept)
+            if omitted:
+                statement += f"\n-- {omitted} other columns of {name} omitted"
+            statements.append(statement)
+            kept_total += len(kept)
+        with self._lock:
+            self.prunes += 1
+            self.columns_kept += kept_total
+            self.columns_total += sum(len(table.columns) for table in self.tables.values())
+        return "\n\n".join(statements)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Pruning counters, for the metrics endpoint"""
+        with self._lock:
+            return {
+                "tables": len(self.tables),
+                "prunes": self.prunes,
+                "kept_column_ratio": round(self.columns_kept / self.columns_total, 4) if self.columns_total else None,
+            }
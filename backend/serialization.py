@@ -0,0 +1,185 @@
+import os
+import json
+import uuid
+import logging
+import datetime
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence, Type
+
+from fastapi.responses import JSONResponse
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "orjson" or "json"; defaults to the fastest one installed
+JSON_SERIALIZER = os.getenv("JSON_SERIALIZER", "")
+# Distinct column lists whose encoded header is kept
+COLUMN_HEADER_CACHE_SIZE = int(os.getenv("COLUMN_HEADER_CACHE_SIZE", "256"))
+
+
+def encode_decimal(value: Decimal) -> Any:
+    """
+    JSON form of a Decimal
+
+    Integral values become ints and values that survive a round trip
+    through float become floats; anything else, such as a budget with
+    more significant digits than a double holds, is sent as a string
+    rather than silently rounded.
+    """
+    if not value.is_finite():
+        return str(value)
+    if value == value.to_integral_value() and abs(value) < 2 ** 63:
+        return int(value)
+    as_float = float(value)
+    if Decimal(repr(as_float)) == value:
+        return as_float
+    return str(value)
+
+
+def default(value: Any) -> Any:
+    """Fallback for the types found in result rows that JSON lacks"""
+    if isinstance(value, Decimal):
+        return encode_decimal(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "tolist"):
+        # NumPy scalars and arrays
+        return value.tolist()
+    return str(value)
+
+
+class Serializer(ABC):
+    """Encodes payloads to UTF-8 JSON bytes"""
+    name = "base"
+
+    @abstractmethod
+    def dumps(self, data: Any) -> bytes:
+        """UTF-8 JSON encoding of `data`"""
+
+    def dumps_str(self, data: Any) -> str:
+        return self.dumps(data).decode("utf-8")
+
+
+class StdlibSerializer(Serializer):
+    """The standard library encoder, always available"""
+    name = "json"
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, default=default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def dumps_str(self, data: Any) -> str:
+        return json.dumps(data, default=default, separators=(",", ":"), ensure_ascii=False)
+
+
+class OrjsonSerializer(Serializer):
+    """orjson, several times faster; datetimes and UUIDs are encoded natively"""
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._dumps = orjson.dumps
+        self._option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(self, data: Any) -> bytes:
+        return self._dumps(data, default=default, option=self._option)
+
+
+SERIALIZERS: Dict[str, Type[Serializer]] = {
+    "orjson": OrjsonSerializer,
+    "json": StdlibSerializer,
+}
+
+
+def register_serializer(name: str, serializer: Type[Serializer]):
+    """Make another encoder selectable through JSON_SERIALIZER"""
+    SERIALIZERS[name] = serializer
+
+
+def create_serializer(name: str = JSON_SERIALIZER) -> Serializer:
+    """
+    Instantiate the named serializer, or the fastest installed one
+
+    Raises:
+        ValueError: If `name` is not a registered serializer
+    """
+    if name:
+        if name not in SERIALIZERS:
+            raise ValueError(f"Unknown JSON serializer '{name}', use one of: {', '.join(SERIALIZERS)}")
+        return SERIALIZERS[name]()
+    for candidate in SERIALIZERS.values():
+        try:
+            return candidate()
+        except ImportError:
+            continue
+    return StdlibSerializer()
+
+
+serializer = create_serializer()
+logger.info(f"Using the {serializer.name} JSON serializer")
+
+
+def dumps(data: Any) -> bytes:
+    """Encode with the configured serializer"""
+    return serializer.dumps(data)
+
+
+def dumps_str(data: Any) -> str:
+    """Encode with the configured serializer, as text"""
+    return serializer.dumps_str(data)
+
+
+class RawJSON(str):
+    """Text that is already encoded JSON and is written out as is"""
+
+
+_column_headers: "OrderedDict[tuple, str]" = OrderedDict()
+_column_headers_lock = threading.Lock()
+
+
+def column_header(columns: Sequence[str]) -> str:
+    """Encoded `"columns":[...]` member, cached per distinct column list"""
+    key = tuple(columns)
+    with _column_headers_lock:
+        header = _column_headers.get(key)
+        if header is not None:
+            _column_headers.move_to_end(key)
+            return header
+    header = '"columns":' + dumps_str(list(key))
+    with _column_headers_lock:
+        _column_headers[key] = header
+        if len(_column_headers) > COLUMN_HEADER_CACHE_SIZE:
+            _column_headers.popitem(last=False)
+    return header
+
+
+def encode_rows(results: List[Any]) -> RawJSON:
+    """
+    Encode result rows in the column-oriented payload of the rows event,
+    {"count": n, "columns": [...], "rows": [[...], ...]}
+
+    Rows are encoded as value lists only, so column names are written once
+    and their encoded form is reused across queries with the same shape.
+    """
+    columns = list(results[0].keys()) if results else []
+    rows = [list(row.values()) for row in results]
+    return RawJSON(f'{{"count":{len(results)},{column_header(columns)},"rows":{dumps_str(rows)}}}')
+
+
+class SerializedJSONResponse(JSONResponse):
+    """JSON response rendered by the configured serializer"""
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, RawJSON):
+            return content.encode("utf-8")
+        return dumps(content)
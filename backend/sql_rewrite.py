@@ -0,0 +1,236 @@
+import os
+import re
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from schema_pruning import SchemaGraph, Table, SCHEMA_MAX_COLUMNS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rewrite generated SQL before it runs; the SQL shown and exported is left as generated
+SQL_REWRITE = os.getenv("SQL_REWRITE", "1") == "1"
+# Characters of a TEXT value returned by a rewritten query, the rest is cut in Postgres
+REWRITE_TEXT_MAX_CHARS = int(os.getenv("REWRITE_TEXT_MAX_CHARS", "1000"))
+
+# Clauses ending the FROM clause of a SELECT
+_FROM_END = re.compile(r"\b(WHERE|GROUP\s+BY|HAVING|WINDOW|ORDER\s+BY|LIMIT|OFFSET|FETCH|FOR)\b", re.IGNORECASE)
+# Tables of a FROM clause with their optional alias
+_FROM_TABLE = re.compile(
+    r"(?:\bFROM|\bJOIN|,)\s+(?:\w+\.)?(\w+)"
+    r"(?:\s+(?:AS\s+)?(?!(?:ON|USING|JOIN|LEFT|RIGHT|INNER|OUTER|FULL|CROSS|NATURAL|LATERAL)\b)(\w+))?",
+    re.IGNORECASE,
+)
+_COLUMN_REF = re.compile(r"^(?:(\w+)\.)?(\w+)$")
+# End of the ORDER BY clause of a SELECT
+_ORDER_END = re.compile(r"\b(LIMIT|OFFSET|FETCH|FOR)\b", re.IGNORECASE)
+# ORDER BY item starting with a bare name or position, such as "name DESC" or "2"
+_ORDER_NAME = re.compile(r"^(\s*)(\w+)(?![\w.(])", re.IGNORECASE)
+
+_stats = {"rewritten": 0, "stars_expanded": 0, "columns_truncated": 0}
+_stats_lock = threading.Lock()
+
+
+def mask(sql: str) -> str:
+    """
+    Copy of `sql` with comments, string literals, quoted identifiers and
+    everything inside parentheses blanked, so keywords found in it are top
+    level; line breaks are kept
+    """
+    out, depth, quote, comment = [], 0, None, 0
+    position = 0
+    while position < len(sql):
+        char, pair = sql[position], sql[position:position + 2]
+        if comment == -1:
+            # Line comment, up to the end of the line
+            if char == "\n":
+                comment = 0
+                out.append(char)
+            else:
+                out.append(" ")
+        elif comment or (not quote and pair == "/*"):
+            # Block comments nest in Postgres
+            if pair == "/*":
+                comment += 1
+            elif pair == "*/":
+                comment -= 1
+            else:
+                out.append("\n" if char == "\n" else " ")
+                position += 1
+                continue
+            out.append("  ")
+            position += 2
+            continue
+        elif quote:
+            out.append(" ")
+            if char == quote:
+                quote = None
+        elif pair == "--":
+            comment = -1
+            out.append(" ")
+        elif char in "'\"":
+            quote = char
+            out.append(" ")
+        elif char == "(":
+            depth += 1
+            out.append(" ")
+        elif char == ")":
+            depth -= 1
+            out.append(" ")
+        else:
+            out.append(" " if depth else char)
+        position += 1
+    return "".join(out)
+
+
+def _split_select_list(sql: str, masked: str) -> List[str]:
+    """Items of a select list, split on its top level commas"""
+    items, start = [], 0
+    for position, char in enumerate(masked):
+        if char == ",":
+            items.append(sql[start:position].strip())
+            start = position + 1
+    items.append(sql[start:].strip())
+    return items
+
+
+def truncated(reference: str, name: str, limit: int) -> str:
+    """Select item returning at most `limit` characters of a TEXT column, marked when cut"""
+    return f"CASE WHEN length({reference}) > {limit} THEN left({reference}, {limit}) || '...' ELSE {reference} END AS {name}"
+
+
+def rewrite_sql(sql: str, question: str, graph: SchemaGraph,
+                text_max_chars: int = REWRITE_TEXT_MAX_CHARS,
+                max_columns: int = SCHEMA_MAX_COLUMNS) -> str:
+    """
+    Rewrite a generated SELECT to read less
+
+    `*` and `alias.*` are expanded to the columns of the table most relevant
+    to the question (see SchemaGraph.rank_columns), so large TEXT and JSONB
+    columns the question does not mention are never read, and selected TEXT
+    columns are cut to `text_max_chars` characters in Postgres. ORDER BY
+    items naming a cut column are pointed at the table's column, so rows
+    still sort by the full value. Statements the rewriter does not fully
+    understand, such as CTEs, set operations, DISTINCT, ORDER BY positions
+    or queries on unknown tables, are returned unchanged.
+    """
+    statement = sql.strip().rstrip(";").strip()
+    masked = mask(statement)
+    select = re.match(r"\s*SELECT\s+(?:ALL\s+)?", masked, re.IGNORECASE)
+    # DISTINCT needs its ORDER BY expressions in the select list, which truncation would change
+    if select is None or re.search(r"\b(UNION|INTERSECT|EXCEPT|INTO|DISTINCT)\b|;", masked, re.IGNORECASE):
+        return sql
+    from_match = re.search(r"\bFROM\b", masked[select.end():], re.IGNORECASE)
+    if from_match is None:
+        return sql
+    list_start, list_end = select.end(), select.end() + from_match.start()
+    end_match = _FROM_END.search(masked, list_end)
+    from_clause = masked[list_end:end_match.start() if end_match else len(masked)]
+
+    # Alias (or table name) -> table, None for subqueries and unknown tables
+    aliases: Dict[str, Optional[str]] = {}
+    order: List[str] = []
+    for table, alias in _FROM_TABLE.findall(from_clause):
+        known = table if table in graph.tables else None
+        aliases[(alias or table).lower()] = known
+        aliases.setdefault(table.lower(), known)
+        order.append((alias or table).lower())
+    if not order:
+        return sql
+    qualify = len(order) > 1
+
+    items, changed = [], False
+    # Output name of each cut column -> the qualified column it cuts
+    cut: Dict[str, str] = {}
+    for item in _split_select_list(statement[list_start:list_end], masked[list_start:list_end]):
+        expanded = _rewrite_item(item, question, graph, aliases, order, qualify, text_max_chars, max_columns, cut)
+        changed = changed or expanded != [item]
+        items.extend(expanded)
+    if not changed:
+        return sql
+    rest = _rewrite_order_by(statement[list_end:], masked[list_end:], cut)
+    if rest is None:
+        return sql
+    with _stats_lock:
+        _stats["rewritten"] += 1
+        _stats["columns_truncated"] += len(cut)
+    return f"{statement[:list_start]}{', '.join(items)}\n{rest.lstrip()}"
+
+
+def _rewrite_order_by(rest: str, masked: str, cut: Dict[str, str]) -> Optional[str]:
+    """
+    Statement after the select list with ORDER BY items naming a cut column
+    qualified, so they refer to the column rather than the cut output; None
+    when ORDER BY uses positions, which expanding `*` would shift
+    """
+    order_by = re.search(r"\bORDER\s+BY\b", masked, re.IGNORECASE)
+    if order_by is None:
+        return rest
+    end_match = _ORDER_END.search(masked, order_by.end())
+    end = end_match.start() if end_match else len(masked)
+    items, start = [], order_by.end()
+    for position in range(order_by.end(), end + 1):
+        if position == end or masked[position] == ",":
+            item = rest[start:position]
+            name = _ORDER_NAME.match(item)
+            if name is not None and name.group(2).isdigit():
+                return None
+            if name is not None and name.group(2).lower() in cut:
+                item = f"{name.group(1)}{cut[name.group(2).lower()]}{item[name.end():]}"
+            items.append(item)
+            start = position + 1
+    return f"{rest[:order_by.end()]}{','.join(items)}{rest[end:]}"
+
+
+def _rewrite_item(item: str, question: str, graph: SchemaGraph, aliases: Dict[str, Optional[str]],
+                  order: List[str], qualify: bool, text_max_chars: int, max_columns: int,
+                  cut: Dict[str, str]) -> List[str]:
+    """Select items replacing one item of the select list, recording cut columns in `cut`"""
+    if item == "*" or item.endswith(".*"):
+        sources = order if item == "*" else [item[:-2].lower()]
+        if any(aliases.get(alias) is None for alias in sources):
+            return [item]
+        columns = []
+        for alias in sources:
+            table = graph.tables[aliases[alias]]
+            ranked = [column for score, column in graph.rank_columns(table.name, question) if score > 0]
+            chosen = set(ranked[:max_columns])
+            for column in table.columns:
+                # Search vectors are for WHERE clauses, never worth returning
+                if column in chosen and not table.column_type(column).startswith("tsvector"):
+                    reference = f"{alias}.{column}" if qualify or item != "*" else column
+                    columns.append(_select_column(table, column, reference, f"{alias}.{column}", text_max_chars, cut))
+        with _stats_lock:
+            _stats["stars_expanded"] += 1
+        return columns
+
+    match = _COLUMN_REF.match(item)
+    if match is None:
+        return [item]
+    alias, column = (match.group(1) or "").lower(), match.group(2)
+    if not alias and any(aliases[name] is None for name in order):
+        # Could be a column of the subquery
+        return [item]
+    sources = [name for name in ([alias] if alias else order)
+               if aliases.get(name) is not None and column in graph.tables[aliases[name]].columns]
+    if len(sources) != 1:
+        return [item]
+    table = graph.tables[aliases[sources[0]]]
+    return [_select_column(table, column, item, f"{sources[0]}.{column}", text_max_chars, cut)]
+
+
+def _select_column(table: Table, column: str, reference: str, qualified: str,
+                   text_max_chars: int, cut: Dict[str, str]) -> str:
+    """Select item of one column, truncated when it is TEXT"""
+    if text_max_chars and table.column_type(column).startswith("text"):
+        cut[column.lower()] = qualified
+        return truncated(reference, column, text_max_chars)
+    return reference
+
+
+def rewrite_snapshot() -> Dict[str, Any]:
+    """Rewrite counters, for the metrics endpoint"""
+    with _stats_lock:
+        return {"enabled": SQL_REWRITE, "text_max_chars": REWRITE_TEXT_MAX_CHARS, **_stats}
@@ -0,0 +1,174 @@
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, NamedTuple, Optional
+
+from serialization import dumps_str
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Event names of the /api/query stream protocol
+EVENT_SQL = "sql"          # {"sql": "..."} - the generated query
+EVENT_ROWS = "rows"        # {"count": n, "columns": [...], "rows": [...]}
+EVENT_TOKEN = "token"      # raw text of the natural language answer
+EVENT_METRICS = "metrics"  # {"timings": {...}} - per stage durations in ms
+EVENT_DONE = "done"        # {} - the stream finished successfully
+EVENT_ERROR = "error"      # {"message": "...", "error_type": "..."}
+
+TERMINAL_EVENTS = (EVENT_DONE, EVENT_ERROR)
+
+# Event names of the /api/tally/stream protocol
+EVENT_TALLY_SNAPSHOT = "snapshot"  # {"candidates": [...], "parties": [...], "total_votes": n}
+EVENT_TALLY = "tally"              # same shape, changed rows only, each with a "delta"
+
+# Stream tuning
+HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+FLUSH_INTERVAL = float(os.getenv("SSE_FLUSH_INTERVAL", "0.1"))
+MAX_FRAME_BYTES = int(os.getenv("SSE_MAX_FRAME_BYTES", "16384"))
+
+
+class Event(NamedTuple):
+    """A single logical event of a stream"""
+    id: str
+    event: str
+    data: Any
+
+
+def encode_data(data: Any) -> str:
+    """Encode an event payload; token text and RawJSON are sent as-is, everything else as JSON"""
+    if isinstance(data, str):
+        return data
+    return dumps_str(data)
+
+
+def format_event(event: str, data: Any, event_id: Optional[str] = None) -> str:
+    """
+    Format one SSE frame
+
+    Args:
+        event: Event name
+        data: Event payload
+        event_id: Optional id the client echoes back in Last-Event-ID
+
+    Returns:
+        str: The encoded frame, terminated by a blank line
+    """
+    frame = []
+    if event_id is not None:
+        frame.append(f"id: {event_id}\n")
+    frame.append(f"event: {event}\n")
+    for line in encode_data(data).split("\n"):
+        frame.append(f"data: {line}\n")
+    frame.append("\n")
+    return "".join(frame)
+
+
+def format_comment(text: str = "keep-alive") -> str:
+    """Format an SSE comment, ignored by clients but keeps proxies from timing out"""
+    return f": {text}\n\n"
+
+
+class SSEStream:
+    """
+    Turns a stream of events into SSE frames
+
+    Consecutive token events are merged into a single frame, and all frames
+    produced within FLUSH_INTERVAL are written to the socket together. When
+    the source is idle for HEARTBEAT_INTERVAL a comment is sent instead.
+    """
+    def __init__(self, heartbeat_interval: float = HEARTBEAT_INTERVAL,
+                 flush_interval: float = FLUSH_INTERVAL,
+                 max_frame_bytes: int = MAX_FRAME_BYTES):
+        self.heartbeat_interval = heartbeat_interval
+        self.flush_interval = flush_interval
+        self.max_frame_bytes = max_frame_bytes
+        self.frames_written = 0
+        self.events_written = 0
+
+    async def frames(self, events: AsyncIterator[Event]) -> AsyncIterator[str]:
+        """
+        Consume events and yield coalesced writes
+
+        Args:
+            events: Async iterator of Event tuples
+
+        Yields:
+            str: One or more encoded SSE frames per write
+        """
+        loop = asyncio.get_running_loop()
+        iterator = events.__aiter__()
+        pending = []          # encoded frames not yet written
+        pending_bytes = 0
+        tokens = []           # token text not yet framed
+        token_bytes = 0
+        token_id = None
+        deadline = None       # when the buffered data must be written
+        next_event = None
+
+        def close_tokens():
+            nonlocal tokens, token_bytes, token_id, pending_bytes
+            if tokens:
+                frame = format_event(EVENT_TOKEN, "".join(tokens), token_id)
+                pending.append(frame)
+                pending_bytes += len(frame)
+                self.frames_written += 1
+                tokens, token_bytes, token_id = [], 0, None
+
+        def drain():
+            nonlocal pending, pending_bytes, deadline
+            close_tokens()
+            chunk = "".join(pending)
+            pending, pending_bytes, deadline = [], 0, None
+            return chunk
+
+        try:
+            while True:
+                if next_event is None:
+                    next_event = asyncio.ensure_future(iterator.__anext__())
+
+                if deadline is None:
+                    timeout = self.heartbeat_interval
+                else:
+                    timeout = max(0.0, deadline - loop.time())
+
+                done, _ = await asyncio.wait({next_event}, timeout=timeout)
+                if not done:
+                    if deadline is None:
+                        yield format_comment()
+                    else:
+                        yield drain()
+                    continue
+
+                task, next_event = next_event, None
+                try:
+                    item = task.result()
+                except StopAsyncIteration:
+                    break
+
+                self.events_written += 1
+                if deadline is None:
+                    deadline = loop.time() + self.flush_interval
+
+                if item.event == EVENT_TOKEN:
+                    tokens.append(item.data)
+                    token_bytes += len(item.data)
+                    token_id = item.id
+                else:
+                    close_tokens()
+                    frame = format_event(item.event, item.data, item.id)
+                    pending.append(frame)
+                    pending_bytes += len(frame)
+                    self.frames_written += 1
+
+                if (item.event in TERMINAL_EVENTS
+                        or pending_bytes + token_bytes >= self.max_frame_bytes
+                        or loop.time() >= deadline):
+                    yield drain()
+
+            if pending or tokens:
+                yield drain()
+        finally:
+            if next_event is not None:
+                next_event.cancel()
@@ -0,0 +1,191 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sse import Event, TERMINAL_EVENTS, EVENT_SQL, EVENT_ROWS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Buffer sizing
+STREAM_BUFFER_CAPACITY = int(os.getenv("STREAM_BUFFER_CAPACITY", "1024"))
+STREAM_BUFFER_TTL = float(os.getenv("STREAM_BUFFER_TTL", "300"))
+STREAM_BUFFER_MAX_STREAMS = int(os.getenv("STREAM_BUFFER_MAX_STREAMS", "1000"))
+# Seconds after which even a stream that never finished is expired, such as the stream of a lost job
+STREAM_BUFFER_MAX_AGE = float(os.getenv("STREAM_BUFFER_MAX_AGE", "3600"))
+
+# Events kept outside the ring for the life of the stream, exports need them however long the answer is
+PINNED_EVENTS = (EVENT_SQL, EVENT_ROWS)
+
+
+class StreamGapError(Exception):
+    """Raised when a client resumes from an event that was already evicted"""
+
+
+def parse_event_id(event_id: str) -> Tuple[str, int]:
+    """
+    Split an event id of the form "<stream_id>:<seq>"
+
+    Raises:
+        ValueError: If the id is malformed
+    """
+    stream_id, _, seq = event_id.strip().rpartition(":")
+    if not stream_id:
+        raise ValueError(f"Malformed event id: {event_id}")
+    return stream_id, int(seq)
+
+
+class StreamBuffer:
+    """
+    Bounded ring buffer holding the events of one answer
+
+    The pipeline appends events as they are produced; any number of
+    subscribers can replay them from a given sequence number and then
+    follow the live tail until the stream finishes. The events named in
+    PINNED_EVENTS are also kept aside, so a long answer only pushes out
+    its own tokens.
+    """
+    def __init__(self, stream_id: str, capacity: int = STREAM_BUFFER_CAPACITY):
+        self.stream_id = stream_id
+        self.capacity = capacity
+        # Event `seq` is in slot seq % capacity until capacity more events follow it
+        self._ring: List[Optional[Event]] = [None] * capacity
+        self.pinned: Dict[int, Event] = {}
+        self.last_event: Optional[Event] = None
+        # Last sequence number pushed out of the ring and not pinned
+        self.evicted_seq = 0
+        self.next_seq = 1
+        self.finished = False
+        self.created_at = time.monotonic()
+        self.updated_at = self.created_at
+        self.task: Optional[asyncio.Task] = None
+        # Database target the answer was computed on, None for the default one
+        self.target_id: Optional[str] = None
+        # Conversation the question belongs to, its result answers follow-ups
+        self.session_id: Optional[str] = None
+        self._signal = asyncio.Event()
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number from which on every event is still buffered"""
+        return self.evicted_seq + 1
+
+    def can_resume(self, after_seq: int) -> bool:
+        """Whether every event after `after_seq` is still buffered"""
+        return self.first_seq <= after_seq + 1 <= self.next_seq
+
+    def append(self, event: str, data: Any) -> Event:
+        """Append an event and wake up all subscribers"""
+        if self.finished:
+            raise RuntimeError(f"Stream {self.stream_id} is already finished")
+        seq = self.next_seq
+        item = Event(f"{self.stream_id}:{seq}", event, data)
+        if event in PINNED_EVENTS:
+            self.pinned[seq] = item
+        overwritten = seq - self.capacity
+        if overwritten > 0 and overwritten not in self.pinned:
+            self.evicted_seq = overwritten
+        self._ring[seq % self.capacity] = item
+        self.last_event = item
+        self.next_seq += 1
+        self.updated_at = time.monotonic()
+        if event in TERMINAL_EVENTS:
+            self.finished = True
+        signal, self._signal = self._signal, asyncio.Event()
+        signal.set()
+        return item
+
+    def pinned_event(self, event: str) -> Optional[Event]:
+        """The pinned event named `event`, None if it was not sent yet"""
+        return next((item for item in self.pinned.values() if item.event == event), None)
+
+    def _event(self, seq: int) -> Event:
+        """Buffered event with sequence number `seq`"""
+        if seq in self.pinned:
+            return self.pinned[seq]
+        if seq <= self.next_seq - 1 - self.capacity:
+            raise StreamGapError(f"Subscriber of {self.stream_id} fell behind")
+        return self._ring[seq % self.capacity]
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncIterator[Event]:
+        """
+        Replay buffered events after `after_seq`, then follow the live tail
+
+        Args:
+            after_seq: Sequence number of the last event the client has seen
+
+        Raises:
+            StreamGapError: If events after `after_seq` were already evicted
+        """
+        if not self.can_resume(after_seq):
+            raise StreamGapError(
+                f"Stream {self.stream_id} no longer holds events after {after_seq}"
+            )
+        seq = after_seq + 1
+        while True:
+            signal = self._signal
+            while seq < self.next_seq:
+                yield self._event(seq)
+                seq += 1
+            if self.finished:
+                return
+            await signal.wait()
+
+
+class StreamRegistry:
+    """
+    Registry of live and recently finished answer streams, expired by TTL
+
+    A stream that is not finished is kept however long it is idle, such as
+    the stream of a job still waiting in the queue, unless its task ended
+    without finishing it or it is older than `max_age`.
+    """
+    def __init__(self, ttl: float = STREAM_BUFFER_TTL,
+                 max_streams: int = STREAM_BUFFER_MAX_STREAMS,
+                 capacity: int = STREAM_BUFFER_CAPACITY,
+                 max_age: float = STREAM_BUFFER_MAX_AGE):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_streams = max_streams
+        self.capacity = capacity
+        self._streams = OrderedDict()
+
+    def create(self, stream_id: Optional[str] = None) -> StreamBuffer:
+        """Create and register a new stream buffer"""
+        self.evict_expired()
+        while len(self._streams) >= self.max_streams:
+            # The oldest finished stream goes first, a live one only when there is none
+            evicted_id = next((stream_id for stream_id, buffer in self._streams.items() if buffer.finished),
+                              next(iter(self._streams)))
+            evicted = self._streams.pop(evicted_id)
+            logger.warning(f"Evicting stream {evicted_id} early, registry is full")
+            if evicted.task is not None and not evicted.task.done():
+                evicted.task.cancel()
+        buffer = StreamBuffer(stream_id or uuid.uuid4().hex, self.capacity)
+        self._streams[buffer.stream_id] = buffer
+        return buffer
+
+    def get(self, stream_id: str) -> Optional[StreamBuffer]:
+        """Look up a stream that has not expired yet"""
+        self.evict_expired()
+        return self._streams.get(stream_id)
+
+    def evict_expired(self):
+        """Drop finished or abandoned streams idle for the TTL, and any stream older than max_age"""
+        now = time.monotonic()
+        expired = [stream_id for stream_id, buffer in self._streams.items()
+                   if now - buffer.created_at > self.max_age
+                   or (now - buffer.updated_at > self.ttl
+                       and (buffer.finished or (buffer.task is not None and buffer.task.done())))]
+        for stream_id in expired:
+            buffer = self._streams.pop(stream_id)
+            if buffer.task is not None and not buffer.task.done():
+                buffer.task.cancel()
+
+    def __len__(self):
+        return len(self._streams)
@@ -0,0 +1,155 @@
+import os
+import sys
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from serialization import dumps_str
+
+# "text" or "json" (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Characters kept of each payload field, such as a prompt or an SQL query
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "500"))
+# Fraction of log_event records kept per stage, as "stage=rate,..."; unlisted stages keep all
+LOG_SAMPLE_RATES = {
+    stage.strip(): float(rate)
+    for stage, _, rate in (
+        item.partition("=") for item in os.getenv(
+            "LOG_SAMPLE_RATES", "question=0.1,sql=0.1,llm.prompt=0.01,llm.response=0.01"
+        ).split(",") if item.strip()
+    )
+}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Counters reported by logging_snapshot()
+_stats = {"dropped": 0, "sampled_out": 0}
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue: Optional[queue.Queue] = None
+
+
+def cap(value: Any, limit: int = LOG_FIELD_MAX_CHARS) -> str:
+    """Text of a payload field, cut to `limit` characters"""
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(+{len(text) - limit} chars)"
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records with their log_event stage and fields
+
+    Runs on the writer thread, so the message arguments and payload fields
+    of a record are only turned into text there, and only if it is written.
+    """
+    def __init__(self, json_lines: bool = False, field_limit: int = LOG_FIELD_MAX_CHARS):
+        super().__init__(TEXT_FORMAT)
+        self.json_lines = json_lines
+        self.field_limit = field_limit
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {name: cap(value, self.field_limit) for name, value in getattr(record, "fields", {}).items()}
+        stage = getattr(record, "stage", None)
+        if not self.json_lines:
+            line = super().format(record)
+            if stage:
+                line += f" [{stage}]"
+            if fields:
+                line += " " + " ".join(f"{name}={value!r}" for name, value in fields.items())
+            return line
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if stage:
+            entry["stage"] = stage
+        if fields:
+            entry["fields"] = fields
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return dumps_str(entry)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without formatting them
+
+    The stock QueueHandler formats the message on the calling thread; this
+    one defers that to the writer. Records are dropped, and counted, when
+    the writer falls LOG_QUEUE_SIZE records behind.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """
+    Route every log record through a queue to a single writer thread
+
+    Replaces the handlers of the root logger, including the ones installed
+    by the logging.basicConfig calls of the individual modules.
+    """
+    global _listener, _queue
+    if _listener is not None:
+        return
+    _queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(StructuredFormatter(json_lines=fmt == "json"))
+    root = logging.getLogger()
+    root.handlers = [NonBlockingQueueHandler(_queue)]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(_queue, writer, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Write out the queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_event(logger: logging.Logger, stage: str, message: str,
+              level: int = logging.INFO, **fields: Any):
+    """
+    Log a pipeline event with payload fields, subject to per-stage sampling
+
+    Fields are passed through untouched and only stringified and capped
+    to LOG_FIELD_MAX_CHARS by the writer, so callers can hand over large
+    values such as prompts without formatting them first.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = LOG_SAMPLE_RATES.get(stage, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        _stats["sampled_out"] += 1
+        return
+    logger.log(level, message, extra={"stage": stage, "fields": fields})
+
+
+def logging_snapshot() -> Dict[str, Any]:
+    """Logging counters, for the metrics endpoint"""
+    return {
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "dropped": _stats["dropped"],
+        "sampled_out": _stats["sampled_out"],
+        "sample_rates": LOG_SAMPLE_RATES,
+    }
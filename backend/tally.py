@@ -0,0 +1,328 @@
+import os
+import re
+import json
+import time
+import select
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from db_utils import DB_PARAMS, get_db_connection
+from resilience import RetryPolicy, DB_CONNECT_TIMEOUT
+from vote_partitions import PartitionedCounter
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TALLY_ENABLED = os.getenv("TALLY_ENABLED", "1") == "1"
+TALLY_CHANNEL = os.getenv("TALLY_CHANNEL", "votes_changed")
+# Seconds between full recounts that correct any drift
+TALLY_RECONCILE_INTERVAL = float(os.getenv("TALLY_RECONCILE_INTERVAL", "60"))
+
+# SQL equivalent of each in-memory answer, reported in the sql event
+LEADERBOARD_SQL = """
+    SELECT c.id, c.name, c.party_affiliation AS party, COUNT(v.id) AS vote_count
+    FROM candidates c
+    LEFT JOIN votes v ON c.id = v.candidate_id
+    GROUP BY c.id, c.name, c.party_affiliation
+    ORDER BY vote_count DESC
+"""
+PARTY_TOTALS_SQL = """
+    SELECT c.party_affiliation AS party, COUNT(v.id) AS vote_count
+    FROM candidates c
+    LEFT JOIN votes v ON c.id = v.candidate_id
+    GROUP BY c.party_affiliation
+    ORDER BY vote_count DESC
+"""
+TURNOUT_SQL = """
+    SELECT (SELECT COUNT(*) FROM votes) AS total_votes,
+           (SELECT COUNT(*) FROM users) AS total_users
+"""
+
+# Words any tally question may use without changing its meaning
+TALLY_FILLER = {
+    "the", "a", "what", "which", "who", "is", "are", "show", "list", "me", "tell",
+    "give", "current", "currently", "right", "now", "so", "far", "overall", "s",
+}
+# Tally questions by answer: groups of which each needs a word present, and
+# the only other words allowed. Anything else, such as a state, a
+# constituency, a party or candidate name, or "in", means the question is
+# scoped and is left to the pipeline.
+TALLY_TEMPLATES = [
+    ("party", [{"party", "parties"}, {"most", "highest", "winning", "leading", "each", "per", "by", "totals"}],
+     {"party", "parties", "most", "highest", "winning", "leading", "each", "per", "by", "votes", "vote",
+      "has", "have", "got", "count", "counts", "totals", "total", "how", "many"}),
+    ("turnout", [{"turnout", "votes"}, {"turnout", "total", "number", "many"}],
+     {"turnout", "voter", "votes", "total", "number", "of", "how", "many", "cast", "been", "have", "were", "there"}),
+    ("top", [{"top"}, {"candidates", "candidate"}],
+     {"top", "candidates", "candidate", "by", "votes", "vote", "count", "with", "most"}),
+    ("leaderboard", [{"leaderboard", "winning", "leading", "votes"}],
+     {"leaderboard", "winning", "leading", "votes", "vote", "count", "counts", "candidate", "candidates",
+      "each", "every", "per", "does", "do", "have", "has", "got", "for", "of", "by", "how", "many"}),
+]
+
+
+def match_tally_template(question: str) -> Optional[Tuple[str, Optional[int]]]:
+    """
+    Tally template a question fully matches, with its top-N limit
+
+    Returns:
+        tuple: Template name and the number in the question, or None when
+        no template accounts for every word of the question
+    """
+    words = re.findall(r"[a-z0-9]+", question.lower())
+    numbers = [int(word) for word in words if word.isdigit()]
+    words = [word for word in words if not word.isdigit() and word not in TALLY_FILLER]
+    for name, required, allowed in TALLY_TEMPLATES:
+        if numbers and name != "top":
+            continue
+        if all(set(words) & group for group in required) and all(word in allowed for word in words):
+            # "votes per candidate" is the leaderboard, "votes" alone is turnout
+            if name == "leaderboard" and "votes" in words and not set(words) & {
+                    "candidate", "candidates", "leaderboard", "winning", "leading"}:
+                continue
+            return name, (numbers[0] if numbers else None)
+    return None
+
+
+class TallyEngine:
+    """
+    In-memory vote counts per candidate and party
+
+    Counts are loaded once from the database, then kept current by a
+    listener thread consuming the notifications of the votes_notify trigger
+    (see init_db.py). A periodic recount against the database corrects any
+    drift, for example from notifications missed while reconnecting. Counts
+    are taken per partition of the votes table, in parallel. Changes that
+    arrive while a recount runs are kept aside and applied again on top of
+    its result, which may not include them yet.
+    """
+    def __init__(self, reconcile_interval: float = TALLY_RECONCILE_INTERVAL,
+                 channel: str = TALLY_CHANNEL, counter: Optional[PartitionedCounter] = None):
+        self.reconcile_interval = reconcile_interval
+        self.channel = channel
+        self.counter = counter or PartitionedCounter()
+        self.ready = False
+        self.candidates: Dict[int, Dict[str, Any]] = {}
+        self.counts: Dict[int, int] = defaultdict(int)
+        self.party_counts: Dict[str, int] = defaultdict(int)
+        self.total_votes = 0
+        self.total_users = 0
+        self.notifications = 0
+        self.reconciliations = 0
+        self.last_drift = 0
+        self._listeners: List[Callable[[int, int], None]] = []
+        # Changes applied during each recount in flight, replayed onto its result
+        self._pending: List[List[Tuple[int, int]]] = []
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # -- state -------------------------------------------------------------
+
+    def _load(self) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, int], int]:
+        """Read candidates, per candidate counts and the user count"""
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, name, party_affiliation AS party FROM candidates")
+                candidates = {row["id"]: {"name": row["name"], "party": row["party"]} for row in cur.fetchall()}
+                cur.execute("SELECT COUNT(*) AS users FROM users")
+                users = cur.fetchone()["users"]
+        counts = self.counter.count_by_candidate()
+        return candidates, counts, users
+
+    def bootstrap(self):
+        """Replace the in-memory state with a fresh count from the database"""
+        pending: List[Tuple[int, int]] = []
+        with self._lock:
+            self._pending.append(pending)
+        try:
+            candidates, counts, users = self._load()
+        except Exception:
+            with self._lock:
+                self._pending.remove(pending)
+            raise
+        with self._lock:
+            self._pending.remove(pending)
+            counts = defaultdict(int, counts)
+            for candidate_id, delta in pending:
+                counts[candidate_id] += delta
+                candidates.setdefault(candidate_id, {"name": None, "party": None})
+            drift = sum(abs(counts.get(cid, 0) - self.counts.get(cid, 0))
+                        for cid in set(counts) | set(self.counts))
+            self.candidates = candidates
+            self.counts = counts
+            self.party_counts = defaultdict(int)
+            for candidate_id, votes in counts.items():
+                party = candidates.get(candidate_id, {}).get("party")
+                self.party_counts[party] += votes
+            self.total_votes = sum(counts.values())
+            self.total_users = users
+            if self.ready:
+                self.last_drift = drift
+                if drift:
+                    logger.warning(f"Tally reconciliation corrected a drift of {drift} votes")
+            self.ready = True
+        logger.info(f"Tally loaded: {self.total_votes} votes for {len(candidates)} candidates")
+
+    def _apply(self, candidate_id: Optional[int], delta: int):
+        """Apply a single vote change"""
+        if candidate_id is None:
+            return
+        with self._lock:
+            if candidate_id not in self.candidates:
+                # A candidate created after the last load; the name comes with the next recount
+                self.candidates[candidate_id] = {"name": None, "party": None}
+            self.counts[candidate_id] += delta
+            self.party_counts[self.candidates[candidate_id]["party"]] += delta
+            self.total_votes += delta
+            for pending in self._pending:
+                pending.append((candidate_id, delta))
+        for listener in list(self._listeners):
+            try:
+                listener(candidate_id, delta)
+            except Exception as e:
+                logger.error(f"Tally listener failed: {str(e)}")
+
+    def handle_notification(self, payload: str):
+        """Apply the change described by one votes_changed notification"""
+        self.notifications += 1
+        change = json.loads(payload)
+        op = change.get("op")
+        if op == "insert":
+            self._apply(change.get("candidate_id"), 1)
+        elif op == "delete":
+            self._apply(change.get("candidate_id"), -1)
+        elif op == "update":
+            self._apply(change.get("old_candidate_id"), -1)
+            self._apply(change.get("candidate_id"), 1)
+        elif op == "truncate":
+            self.bootstrap()
+        else:
+            logger.warning(f"Ignoring unknown vote notification: {payload}")
+
+    def add_listener(self, callback: Callable[[int, int], None]):
+        """Call `callback(candidate_id, delta)` from the listener thread on every change"""
+        self._listeners.append(callback)
+
+    # -- answers -----------------------------------------------------------
+
+    def leaderboard(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Candidates by vote count, shaped like the rows of LEADERBOARD_SQL"""
+        with self._lock:
+            rows = [
+                {"id": candidate_id, "name": info["name"], "party": info["party"],
+                 "vote_count": self.counts.get(candidate_id, 0)}
+                for candidate_id, info in self.candidates.items()
+            ]
+        rows.sort(key=lambda row: row["vote_count"], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def party_totals(self) -> List[Dict[str, Any]]:
+        """Parties by vote count, shaped like the rows of PARTY_TOTALS_SQL"""
+        with self._lock:
+            parties = {info["party"] for info in self.candidates.values()}
+            rows = [{"party": party, "vote_count": self.party_counts.get(party, 0)} for party in parties]
+        rows.sort(key=lambda row: row["vote_count"], reverse=True)
+        return rows
+
+    def turnout(self) -> List[Dict[str, Any]]:
+        """Vote and user totals, shaped like the rows of TURNOUT_SQL"""
+        with self._lock:
+            return [{"total_votes": self.total_votes, "total_users": self.total_users}]
+
+    def try_answer(self, question: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Answer tally questions from memory
+
+        Only global questions are answered; any qualifier the matched
+        template does not account for sends the question to the pipeline.
+
+        Returns:
+            tuple: Equivalent SQL and result rows, or None if the question is
+            not a tally question or the engine is not loaded
+        """
+        if not self.ready:
+            return None
+        matched = match_tally_template(question)
+        if matched is None:
+            return None
+        name, number = matched
+        if name == "party":
+            return PARTY_TOTALS_SQL, self.party_totals()
+        if name == "turnout":
+            return TURNOUT_SQL, self.turnout()
+        if name == "top":
+            limit = number or 5
+            return LEADERBOARD_SQL + f"    LIMIT {limit}\n", self.leaderboard(limit)
+        return LEADERBOARD_SQL, self.leaderboard()
+
+    # -- background threads ------------------------------------------------
+
+    def _listen(self):
+        """Consume notifications until stopped, reconnecting on failure"""
+        import psycopg2
+
+        policy = RetryPolicy(attempts=1, base_delay=0.5, max_delay=30)
+        failures = 0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**DB_PARAMS, connect_timeout=DB_CONNECT_TIMEOUT)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                # Changes made before LISTEN took effect are picked up here
+                self.bootstrap()
+                failures = 0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.handle_notification(conn.notifies.pop(0).payload)
+            except Exception as e:
+                failures += 1
+                delay = policy.backoff(failures)
+                logger.error(f"Tally listener error, reconnecting in {delay:.1f}s: {str(e)}")
+                self._stop.wait(delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _reconcile(self):
+        """Recount from the database every reconcile_interval seconds"""
+        while not self._stop.wait(self.reconcile_interval):
+            try:
+                self.bootstrap()
+                self.reconciliations += 1
+            except Exception as e:
+                logger.error(f"Tally reconciliation failed: {str(e)}")
+
+    def start(self):
+        """Start the listener and reconciliation threads"""
+        for target in (self._listen, self._reconcile):
+            thread = threading.Thread(target=target, name=f"tally-{target.__name__.strip('_')}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop the background threads"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Engine counters, for the metrics endpoint"""
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "candidates": len(self.candidates),
+                "total_votes": self.total_votes,
+                "notifications": self.notifications,
+                "reconciliations": self.reconciliations,
+                "last_drift": self.last_drift,
+                "vote_counts": self.counter.snapshot(),
+            }
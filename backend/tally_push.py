@@ -0,0 +1,137 @@
+import os
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from sse import format_event, format_comment, HEARTBEAT_INTERVAL, EVENT_TALLY_SNAPSHOT, EVENT_TALLY
+from tally import TallyEngine
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds over which vote changes are batched into one push
+TALLY_PUSH_WINDOW = float(os.getenv("TALLY_PUSH_WINDOW", "1.0"))
+# Frames a watcher may fall behind before it is disconnected
+TALLY_PUSH_MAX_BACKLOG = int(os.getenv("TALLY_PUSH_MAX_BACKLOG", "100"))
+
+
+class TallyBroadcaster:
+    """
+    Pushes batched tally deltas to every watcher
+
+    Vote changes are accumulated per candidate; once per window the batch
+    is turned into a single encoded frame that is shared by all watchers,
+    so the cost of a push does not grow with the number of watchers.
+    Watchers that cannot keep up are disconnected.
+    """
+    def __init__(self, engine: TallyEngine, window: float = TALLY_PUSH_WINDOW,
+                 max_backlog: int = TALLY_PUSH_MAX_BACKLOG):
+        self.engine = engine
+        self.window = window
+        self.max_backlog = max_backlog
+        self.pushes = 0
+        self.dropped_watchers = 0
+        self._seq = 0
+        self._pending: Dict[int, int] = defaultdict(int)
+        self._pending_lock = threading.Lock()
+        self._watchers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        engine.add_listener(self.on_change)
+
+    def on_change(self, candidate_id: int, delta: int):
+        """Engine listener, called from the tally listener thread"""
+        with self._pending_lock:
+            self._pending[candidate_id] += delta
+
+    def _batch(self) -> Optional[Dict[str, Any]]:
+        """Collect the pending deltas into one payload"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        pending = {candidate_id: delta for candidate_id, delta in pending.items() if delta}
+        if not pending:
+            return None
+
+        leaderboard = {row["id"]: row for row in self.engine.leaderboard()}
+        party_deltas = defaultdict(int)
+        candidates = []
+        for candidate_id, delta in pending.items():
+            row = leaderboard.get(candidate_id, {"id": candidate_id, "name": None, "party": None, "vote_count": 0})
+            party_deltas[row["party"]] += delta
+            candidates.append({**row, "delta": delta})
+        party_totals = {row["party"]: row["vote_count"] for row in self.engine.party_totals()}
+        parties = [{"party": party, "delta": delta, "vote_count": party_totals.get(party, 0)}
+                   for party, delta in party_deltas.items()]
+        return {
+            "candidates": candidates,
+            "parties": parties,
+            "total_votes": self.engine.turnout()[0]["total_votes"],
+        }
+
+    def _snapshot_frame(self) -> str:
+        """Full current state, sent to a watcher when it connects"""
+        payload = {
+            "candidates": self.engine.leaderboard(),
+            "parties": self.engine.party_totals(),
+            "total_votes": self.engine.turnout()[0]["total_votes"],
+        }
+        return format_event(EVENT_TALLY_SNAPSHOT, payload, f"tally:{self._seq}")
+
+    async def _run(self):
+        """Publish one batch per window until cancelled"""
+        while True:
+            await asyncio.sleep(self.window)
+            if not self._watchers:
+                # Nobody is watching, only keep the batch from growing
+                self._batch()
+                continue
+            payload = self._batch()
+            if payload is None:
+                continue
+            self._seq += 1
+            frame = format_event(EVENT_TALLY, payload, f"tally:{self._seq}")
+            self.pushes += 1
+            for queue in list(self._watchers):
+                try:
+                    queue.put_nowait(frame)
+                except asyncio.QueueFull:
+                    # The watcher drains its backlog, then its stream ends
+                    self._watchers.discard(queue)
+                    self.dropped_watchers += 1
+                    logger.warning("Disconnecting a tally watcher that fell behind")
+
+    async def watch(self, heartbeat_interval: float = HEARTBEAT_INTERVAL) -> AsyncIterator[str]:
+        """Frames for one watcher: a snapshot, then a delta frame per batch"""
+        queue = asyncio.Queue(maxsize=self.max_backlog)
+        self._watchers.add(queue)
+        try:
+            yield self._snapshot_frame()
+            while queue in self._watchers or not queue.empty():
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield format_comment()
+                    continue
+                yield frame
+        finally:
+            self._watchers.discard(queue)
+
+    def start(self):
+        """Start the publishing task, must be called from the running event loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the publishing task"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Broadcaster counters, for the metrics endpoint"""
+        return {
+            "watchers": len(self._watchers),
+            "pushes": self.pushes,
+            "dropped_watchers": self.dropped_watchers,
+        }
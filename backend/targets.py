@@ -0,0 +1,350 @@
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from db_utils import DB_PARAMS, get_db_schema
+from admission import OverloadedError, STAGE_DB
+from resilience import CircuitBreaker, LocalLimitError, retry_call, get_breaker, STATE_CLOSED, DB_RETRY_POLICY, DB_CONNECT_TIMEOUT
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Connections per target pool
+TARGET_POOL_SIZE = int(os.getenv("TARGET_POOL_SIZE", "8"))
+# Seconds a borrower waits for a connection of a fully used pool before it is refused
+TARGET_POOL_WAIT = float(os.getenv("TARGET_POOL_WAIT", "10"))
+# Targets holding a pool, schema and trained model at the same time
+TARGET_MAX_ACTIVE = int(os.getenv("TARGET_MAX_ACTIVE", "8"))
+# Registered targets kept, least recently used ones are forgotten beyond this
+TARGET_MAX_REGISTERED = int(os.getenv("TARGET_MAX_REGISTERED", "256"))
+# Seconds without use after which a target's resources are released
+TARGET_IDLE_TTL = float(os.getenv("TARGET_IDLE_TTL", "900"))
+# Seconds a schema DDL is cached before it is read again
+TARGET_SCHEMA_TTL = float(os.getenv("TARGET_SCHEMA_TTL", "600"))
+# Token clients send as X-Targets-Token to register, list and remove targets; the API is off when unset
+TARGET_API_TOKEN = os.getenv("TARGET_API_TOKEN", "")
+# Key of the target ids; random per process unless set, so ids cannot be derived offline
+TARGET_ID_SECRET = os.getenv("TARGET_ID_SECRET", "").encode("utf-8") or secrets.token_bytes(32)
+
+DEFAULT_TARGET = "default"
+
+# Database types the backend can connect to; the Flutter app offers more
+SUPPORTED_TYPES = ("postgresql",)
+
+
+class UnknownTargetError(KeyError):
+    """Raised for a target id that is not (or no longer) registered"""
+
+
+class PoolExhaustedError(OverloadedError, LocalLimitError):
+    """Raised when no pooled connection frees up in time; load, not a database fault"""
+
+
+def target_id_for(params: Dict[str, Any]) -> str:
+    """
+    Unguessable id of a database and its credentials
+
+    Registering the same credentials twice yields the same target, while
+    other credentials for the same database, such as another password,
+    yield a different target rather than replacing the existing one.
+    """
+    key = "|".join(str(params.get(name, "")) for name in ("host", "port", "dbname", "user", "password"))
+    return hmac.new(TARGET_ID_SECRET, key.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def target_breaker(target_id: str) -> CircuitBreaker:
+    """
+    Circuit breaker of a target's database
+
+    The default target's breaker is shared through get_breaker and shows in
+    the metrics. Other targets get a private breaker, named by a hash of the
+    id since the id is the client's credential, that lives and goes with
+    the target.
+    """
+    if target_id == DEFAULT_TARGET:
+        return get_breaker(f"postgres:{DEFAULT_TARGET}")
+    return CircuitBreaker(f"postgres:{hashlib.sha256(target_id.encode('utf-8')).hexdigest()[:12]}")
+
+
+class PoolLease:
+    """
+    A connection pool and the number of connections borrowed from it
+
+    A released pool is retired rather than closed while connections are
+    out, and closed when the last of them is returned.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.borrowers = 0
+        self.retired = False
+
+
+def parse_address(url: str, default_port: str = "5432") -> Dict[str, str]:
+    """Split a 'host:port' address as entered in the DatabaseConfigScreen"""
+    url = url.strip()
+    for prefix in ("postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            url = url[len(prefix):]
+    url = url.split("/", 1)[0]
+    host, _, port = url.rpartition(":") if ":" in url else (url, "", default_port)
+    return {"host": host or "localhost", "port": port or default_port}
+
+
+class DatabaseTarget:
+    """
+    One database served by the backend
+
+    The connection pool, schema DDL and trained Vanna model are created on
+    first use and dropped again by release(), so an idle target costs only
+    its connection parameters. Borrowers beyond the pool size wait for a
+    connection to be returned instead of failing.
+    """
+    def __init__(self, target_id: str, params: Dict[str, Any], db_type: str = "postgresql"):
+        if db_type not in SUPPORTED_TYPES:
+            raise ValueError(f"Unsupported database type '{db_type}', use one of: {', '.join(SUPPORTED_TYPES)}")
+        self.id = target_id
+        self.db_type = db_type
+        self.params = params
+        self.breaker = target_breaker(target_id)
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self._lease: Optional[PoolLease] = None
+        self._schema: Optional[str] = None
+        self._schema_loaded_at = 0.0
+        self._vanna = None
+        self._lock = threading.Lock()
+        # Shared by the current and retired pools, so together they stay within the size
+        self._slots = threading.BoundedSemaphore(TARGET_POOL_SIZE)
+
+    @property
+    def active(self) -> bool:
+        return self._lease is not None or self._vanna is not None
+
+    def touch(self):
+        self.last_used = time.monotonic()
+        self.requests += 1
+
+    def connection_string(self) -> str:
+        p = self.params
+        return f"postgresql://{p['user']}:{p['password']}@{p['host']}:{p['port']}/{p['dbname']}"
+
+    def _borrow(self) -> PoolLease:
+        """Current pool, created on first use, with one more borrower; call under _lock"""
+        if self._lease is None:
+            from psycopg2.pool import ThreadedConnectionPool
+            from psycopg2.extras import RealDictCursor
+            # No connection is opened until the first getconn
+            self._lease = PoolLease(ThreadedConnectionPool(
+                0, TARGET_POOL_SIZE, **self.params,
+                cursor_factory=RealDictCursor, connect_timeout=DB_CONNECT_TIMEOUT
+            ))
+            logger.info(f"Created connection pool for target {self.id}")
+        self._lease.borrowers += 1
+        return self._lease
+
+    @staticmethod
+    def _getconn(pool):
+        from psycopg2.pool import PoolError
+        try:
+            return pool.getconn()
+        except PoolError as e:
+            raise PoolExhaustedError(STAGE_DB, TARGET_POOL_WAIT, str(e))
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a pooled connection for one transaction
+
+        Raises:
+            PoolExhaustedError: If no connection is returned within TARGET_POOL_WAIT
+        """
+        if not self._slots.acquire(timeout=TARGET_POOL_WAIT):
+            raise PoolExhaustedError(STAGE_DB, TARGET_POOL_WAIT, "connection pool is exhausted")
+        try:
+            with self._lock:
+                lease = self._borrow()
+            try:
+                conn = retry_call(self._getconn, DB_RETRY_POLICY, self.breaker, lease.pool)
+                try:
+                    with conn:
+                        yield conn
+                finally:
+                    lease.pool.putconn(conn, close=bool(conn.closed))
+            finally:
+                with self._lock:
+                    lease.borrowers -= 1
+                    close = lease.retired and lease.borrowers == 0
+                if close:
+                    lease.pool.closeall()
+                    logger.info(f"Closed retired connection pool of target {self.id}")
+        finally:
+            self._slots.release()
+
+    def schema_ddl(self) -> str:
+        """Schema of the target as CREATE TABLE statements, cached for TARGET_SCHEMA_TTL"""
+        if self._schema is None or time.monotonic() - self._schema_loaded_at > TARGET_SCHEMA_TTL:
+            schema = get_db_schema(self.connection)
+            with self._lock:
+                if self._schema is not None and schema != self._schema:
+                    # The model was trained on the old schema
+                    logger.info(f"Schema of target {self.id} changed, retraining on next use")
+                    self._vanna = None
+                self._schema = schema
+                self._schema_loaded_at = time.monotonic()
+        return self._schema
+
+    def vanna(self, factory: Callable[["DatabaseTarget"], Any]):
+        """Vanna model trained on this target, created by `factory(target)` on first use"""
+        if self._vanna is None:
+            instance = factory(self)
+            with self._lock:
+                if self._vanna is None:
+                    self._vanna = instance
+        return self._vanna
+
+    def release(self):
+        """
+        Drop the pool, cached schema and model; a pool with borrowed
+        connections is closed when the last of them is returned
+        """
+        with self._lock:
+            lease, self._lease = self._lease, None
+            self._schema = None
+            self._vanna = None
+            if lease is not None:
+                lease.retired = True
+            close = lease is not None and lease.borrowers == 0
+        if close:
+            lease.pool.closeall()
+            logger.info(f"Released connection pool of target {self.id}")
+        elif lease is not None:
+            logger.info(f"Released target {self.id}, its pool closes once {lease.borrowers} borrowed connections return")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public representation, without the password"""
+        return {
+            "target_id": self.id,
+            "type": self.db_type,
+            "host": self.params["host"],
+            "port": self.params["port"],
+            "database": self.params["dbname"],
+            "user": self.params["user"],
+            "active": self.active,
+            "requests": self.requests,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+        }
+
+
+class TargetRegistry:
+    """
+    Registered database targets, least recently used first
+
+    At most `max_active` targets hold resources at a time; using another one
+    releases the least recently used active target. Targets idle for
+    `idle_ttl` seconds are released by evict_idle(). The default target,
+    configured through DB_* settings, is always registered, never evicted
+    and never listed.
+    """
+    def __init__(self, max_active: int = TARGET_MAX_ACTIVE, max_registered: int = TARGET_MAX_REGISTERED,
+                 idle_ttl: float = TARGET_IDLE_TTL):
+        self.max_active = max_active
+        self.max_registered = max_registered
+        self.idle_ttl = idle_ttl
+        self.evictions = 0
+        self._targets: "OrderedDict[str, DatabaseTarget]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._targets[DEFAULT_TARGET] = DatabaseTarget(DEFAULT_TARGET, dict(DB_PARAMS))
+
+    def register(self, db_type: str, url: str, user: str, password: str, dbname: str) -> DatabaseTarget:
+        """Register a database, or return the existing target of the same credentials"""
+        params = {**parse_address(url), "user": user, "password": password, "dbname": dbname}
+        target_id = target_id_for(params)
+        candidate = DatabaseTarget(target_id, params, db_type)
+        with self._lock:
+            target = self._targets.get(target_id)
+            if target is not None:
+                self._targets.move_to_end(target_id)
+                return target
+            self._targets[target_id] = candidate
+            self._targets.move_to_end(target_id)
+            forgotten = [t for t in list(self._targets.values())[:-1] if t.id != DEFAULT_TARGET]
+            forgotten = forgotten[:max(0, len(self._targets) - self.max_registered)]
+            for old in forgotten:
+                del self._targets[old.id]
+        # Pushed out by newer registrations
+        for old in forgotten:
+            old.release()
+        logger.info(f"Registered a database target for {params['host']}:{params['port']}/{dbname}")
+        return candidate
+
+    def get(self, target_id: Optional[str] = None) -> DatabaseTarget:
+        """
+        Look up a target for a request, marking it used
+
+        Raises:
+            UnknownTargetError: If the target is not registered
+        """
+        target_id = target_id or DEFAULT_TARGET
+        self.evict_idle()
+        with self._lock:
+            target = self._targets.get(target_id)
+            if target is None:
+                raise UnknownTargetError(target_id)
+            self._targets.move_to_end(target_id)
+            target.touch()
+            # Make room among the active targets, least recently used first
+            active = [t for t in self._targets.values()
+                      if t.active and t is not target and t.id != DEFAULT_TARGET]
+            excess = active[:max(0, len(active) + 1 - self.max_active)]
+        for old in excess:
+            old.release()
+            self.evictions += 1
+        return target
+
+    def remove(self, target_id: str):
+        """Forget a target and release its resources"""
+        if target_id == DEFAULT_TARGET:
+            raise ValueError("The default target cannot be removed")
+        with self._lock:
+            target = self._targets.pop(target_id, None)
+        if target is None:
+            raise UnknownTargetError(target_id)
+        target.release()
+
+    def evict_idle(self):
+        """Release the resources of targets unused for idle_ttl seconds"""
+        now = time.monotonic()
+        with self._lock:
+            idle = [t for t in self._targets.values()
+                    if t.active and t.id != DEFAULT_TARGET and now - t.last_used > self.idle_ttl]
+        for target in idle:
+            target.release()
+            self.evictions += 1
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Registered targets other than the default one"""
+        with self._lock:
+            return [target.to_dict() for target in self._targets.values() if target.id != DEFAULT_TARGET]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Registry counters, for the metrics endpoint"""
+        with self._lock:
+            return {
+                "registered": len(self._targets),
+                "active": sum(1 for target in self._targets.values() if target.active),
+                "open_breakers": sum(1 for target in self._targets.values() if target.breaker.state != STATE_CLOSED),
+                "evictions": self.evictions,
+            }
+
+
+# Shared by the HTTP handlers and the pipeline threads
+targets = TargetRegistry()
@@ -0,0 +1,61 @@
+"""
+Cold start budget of the backend modules
+
+Each module is imported in a fresh interpreter, so the measurement covers
+everything the import pulls in. Run from the backend directory with
+`python -m unittest discover tests` or `python -m pytest tests`.
+"""
+import os
+import sys
+import json
+import subprocess
+import unittest
+import importlib.util
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds an import may take, FastAPI and NumPy included; the port is bound right after it
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.0"))
+# Clients that must only be loaded on first use, never by the import itself
+DEFERRED_MODULES = ("vanna", "openai", "psycopg2", "tenacity")
+
+MEASURE = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+
+def installed(*modules):
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+def measure_import(module):
+    """Seconds `module` takes to import in a fresh interpreter, and the deferred clients it loaded"""
+    # Warm the bytecode cache first, pods start from compiled files
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=BACKEND_DIR, check=True, capture_output=True)
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE.format(module=module, deferred=DEFERRED_MODULES)],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class ImportTimeTest(unittest.TestCase):
+    @unittest.skipUnless(installed("dotenv", "numpy", "fastapi"), "backend requirements are not installed")
+    def test_query_processor_imports_within_budget(self):
+        result = measure_import("query_processor")
+        self.assertEqual(result["loaded"], [])
+        self.assertLess(result["seconds"], IMPORT_TIME_BUDGET)
+
+    @unittest.skipUnless(installed("dotenv", "numpy", "fastapi"), "backend requirements are not installed")
+    def test_main_imports_within_budget(self):
+        result = measure_import("main")
+        self.assertEqual(result["loaded"], [])
+        self.assertLess(result["seconds"], IMPORT_TIME_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+Pruning of the schema put in the generation prompt to what a question needs
+
+SchemaGraph only parses DDL, so no Postgres is needed. Run from the backend
+directory with `python -m unittest discover tests` or `python -m pytest tests`.
+"""
+import re
+import unittest
+
+from schema_pruning import SchemaGraph
+
+SCHEMA_DDL = """
+CREATE TABLE users (
+    id integer PRIMARY KEY,
+    username character varying,
+    email character varying
+);
+CREATE TABLE candidates (
+    id integer PRIMARY KEY,
+    name character varying,
+    voter_id character varying,
+    constituency character varying,
+    state character varying,
+    party_affiliation character varying,
+    campaign_promises text,
+    campaign_promises_search tsvector,
+    education text,
+    criminal_record boolean,
+    social_media_handles jsonb,
+    campaign_budget numeric,
+    fundraising_plan text
+);
+CREATE TABLE votes (
+    id integer PRIMARY KEY,
+    user_id integer REFERENCES users(id),
+    candidate_id integer REFERENCES candidates(id),
+    created_at timestamp
+);
+"""
+
+LARGE_COLUMNS = {"campaign_promises", "campaign_promises_search", "education", "social_media_handles",
+                 "fundraising_plan"}
+
+# (question, relevant tables, columns that must be kept, columns that must be omitted)
+CASES = [
+    ("How many votes does each party have?", ["votes", "candidates"],
+     {"votes": {"candidate_id"}, "candidates": {"id", "name", "party_affiliation"}},
+     {"candidates": LARGE_COLUMNS}),
+    ("Which candidates promised free healthcare?", ["candidates"],
+     {"candidates": {"id", "name", "campaign_promises", "campaign_promises_search"}},
+     {"candidates": {"education", "social_media_handles", "fundraising_plan"}}),
+    ("Show the twitter handles of candidates", ["candidates"],
+     {"candidates": {"social_media_handles"}},
+     {"candidates": {"campaign_promises", "education"}}),
+    ("Which politicians have a criminal record?", ["candidates"],
+     {"candidates": {"criminal_record"}}, {"candidates": LARGE_COLUMNS}),
+    ("Which candidates have the most votes?", ["candidates", "votes"],
+     {"candidates": {"id", "name"}, "votes": {"candidate_id"}}, {"candidates": LARGE_COLUMNS}),
+    ("Which voters voted for candidates in Kerala?", ["users", "votes", "candidates"],
+     {"users": {"id", "username"}, "votes": {"user_id", "candidate_id"}, "candidates": {"state"}}, {}),
+    ("How many users are there?", ["users"], {"users": {"id", "username"}}, {}),
+]
+
+
+def kept_columns(pruned):
+    """Columns of each table in pruned DDL"""
+    return {name: set(re.findall(r"^    (\w+)", body, re.MULTILINE))
+            for name, body in re.findall(r"CREATE TABLE (\w+) \((.*?)\n\);", pruned, re.DOTALL)}
+
+
+class SchemaPruningTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = SchemaGraph(SCHEMA_DDL)
+
+    def test_cases(self):
+        for question, tables, kept, omitted in CASES:
+            with self.subTest(question):
+                self.assertEqual(self.graph.relevant_tables(question), tables)
+                columns = kept_columns(self.graph.prune(question))
+                self.assertEqual(set(columns), set(tables))
+                for table, names in kept.items():
+                    self.assertLessEqual(names, columns[table])
+                for table, names in omitted.items():
+                    self.assertFalse(names & columns[table])
+
+    def test_unmatched_question_keeps_every_table(self):
+        columns = kept_columns(self.graph.prune("What is the weather like?"))
+        self.assertEqual(set(columns), {"users", "candidates", "votes"})
+        self.assertFalse(LARGE_COLUMNS & columns["candidates"])
+
+    def test_max_columns_keeps_keys_and_mentions(self):
+        columns = kept_columns(self.graph.prune("How many votes does each party have?", max_columns=1))
+        # Keys needed for the join are kept past the limit
+        self.assertEqual(columns["votes"], {"id", "candidate_id"})
+        columns = kept_columns(self.graph.prune("How many candidates does each party have?", max_columns=3))
+        self.assertEqual(columns["candidates"], {"id", "name", "party_affiliation"})
+
+    def test_omitted_columns_are_counted(self):
+        pruned = self.graph.prune("How many users are there?")
+        self.assertNotIn("omitted", pruned)
+        pruned = self.graph.prune("Which politicians have a criminal record?")
+        self.assertIn("-- 5 other columns of candidates omitted", pruned)
+
+    def test_rank_columns(self):
+        scores = {column: score for score, column in self.graph.rank_columns("candidates", "What did they promise?")}
+        self.assertGreater(scores["campaign_promises"], scores["party_affiliation"])
+        self.assertGreater(scores["campaign_promises_search"], scores["state"])
+        self.assertEqual(scores["education"], 0.0)
+        self.assertEqual(scores["social_media_handles"], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Rewriting of generated SELECTs before they run
+
+The rewriter is a pure function of the SQL, the question and the schema, so
+no Postgres is needed. Run from the backend directory with
+`python -m unittest discover tests` or `python -m pytest tests`.
+"""
+import unittest
+
+from schema_pruning import SchemaGraph
+from sql_rewrite import mask, rewrite_sql
+
+SCHEMA_DDL = """
+CREATE TABLE users (
+    id integer PRIMARY KEY,
+    username character varying
+);
+CREATE TABLE candidates (
+    id integer PRIMARY KEY,
+    name character varying,
+    party_affiliation character varying,
+    campaign_promises text,
+    campaign_promises_search tsvector,
+    social_media_handles jsonb
+);
+CREATE TABLE votes (
+    id integer PRIMARY KEY,
+    user_id integer REFERENCES users(id),
+    candidate_id integer REFERENCES candidates(id)
+);
+"""
+
+PROMISES = "CASE WHEN length({0}) > 100 THEN left({0}, 100) || '...' ELSE {0} END AS campaign_promises"
+PROMISE_QUESTION = "What did candidates promise?"
+
+# (name, sql, question, rewritten SQL or None when it must be left unchanged)
+CASES = [
+    ("star expanded to mentioned columns", "SELECT * FROM candidates;", PROMISE_QUESTION,
+     f"SELECT id, name, party_affiliation, {PROMISES.format('campaign_promises')}\nFROM candidates"),
+    ("star without mentions keeps small columns", "SELECT * FROM candidates", "Who is standing?",
+     "SELECT id, name, party_affiliation\nFROM candidates"),
+    ("alias star qualified", "SELECT c.* FROM candidates c WHERE c.id = 1", "Who is candidate 1?",
+     "SELECT c.id, c.name, c.party_affiliation\nFROM candidates c WHERE c.id = 1"),
+    ("text column truncated", "SELECT name, campaign_promises FROM candidates", "x",
+     f"SELECT name, {PROMISES.format('campaign_promises')}\nFROM candidates"),
+    ("join qualifies expanded columns",
+     "SELECT c.*, v.id FROM candidates c JOIN votes v ON v.candidate_id = c.id", PROMISE_QUESTION,
+     f"SELECT c.id, c.name, c.party_affiliation, {PROMISES.format('c.campaign_promises')}, v.id\n"
+     "FROM candidates c JOIN votes v ON v.candidate_id = c.id"),
+    ("order by a truncated column sorts by the column",
+     "SELECT * FROM candidates ORDER BY campaign_promises DESC LIMIT 5", PROMISE_QUESTION,
+     f"SELECT id, name, party_affiliation, {PROMISES.format('campaign_promises')}\n"
+     "FROM candidates ORDER BY candidates.campaign_promises DESC LIMIT 5"),
+    ("order by through an alias keeps other items",
+     "SELECT c.name, c.campaign_promises FROM candidates c ORDER BY campaign_promises, name", "x",
+     f"SELECT c.name, {PROMISES.format('c.campaign_promises')}\n"
+     "FROM candidates c ORDER BY c.campaign_promises, name"),
+    ("order by inside a window is left alone",
+     "SELECT campaign_promises, rank() OVER (ORDER BY campaign_promises) FROM candidates", "x",
+     f"SELECT {PROMISES.format('campaign_promises')}, rank() OVER (ORDER BY campaign_promises)\n"
+     "FROM candidates"),
+    ("order by position unchanged", "SELECT * FROM candidates ORDER BY 2", PROMISE_QUESTION, None),
+    ("distinct unchanged", "SELECT DISTINCT campaign_promises FROM candidates ORDER BY campaign_promises",
+     "x", None),
+    ("union unchanged", "SELECT * FROM candidates UNION SELECT * FROM candidates", "x", None),
+    ("cte unchanged", "WITH c AS (SELECT * FROM candidates) SELECT * FROM c", "x", None),
+    ("unknown table unchanged", "SELECT * FROM parties", "x", None),
+    ("subquery star unchanged", "SELECT * FROM (SELECT id FROM candidates) s", "x", None),
+    ("ambiguous column unchanged",
+     "SELECT id FROM candidates c JOIN votes v ON v.candidate_id = c.id", "x", None),
+    ("no star or text unchanged", "SELECT name, party_affiliation FROM candidates", "x", None),
+    ("star in a block comment", "SELECT name /* , * */ FROM candidates", "x", None),
+    ("keywords in a line comment", "-- SELECT * FROM users UNION\nSELECT name FROM candidates", "x", None),
+    ("comment inside the select list unchanged", "SELECT * /* all */ FROM candidates", "x", None),
+    ("comment hides a distinct", "SELECT * FROM candidates /* not DISTINCT */", "Who is standing?",
+     "SELECT id, name, party_affiliation\nFROM candidates /* not DISTINCT */"),
+    ("comment between clauses kept",
+     "SELECT campaign_promises FROM candidates -- ORDER BY 1\nORDER BY campaign_promises", "x",
+     f"SELECT {PROMISES.format('campaign_promises')}\n"
+     "FROM candidates -- ORDER BY 1\nORDER BY candidates.campaign_promises"),
+    ("comment markers in a string", "SELECT * FROM candidates WHERE name = 'a -- b /* c'", "Who is standing?",
+     "SELECT id, name, party_affiliation\nFROM candidates WHERE name = 'a -- b /* c'"),
+]
+
+
+class RewriteSqlTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = SchemaGraph(SCHEMA_DDL)
+
+    def test_cases(self):
+        for name, sql, question, expected in CASES:
+            with self.subTest(name):
+                rewritten = rewrite_sql(sql, question, self.graph, text_max_chars=100)
+                self.assertEqual(rewritten, sql if expected is None else expected)
+
+    def test_no_truncation_when_disabled(self):
+        sql = "SELECT name, campaign_promises FROM candidates"
+        self.assertEqual(rewrite_sql(sql, "x", self.graph, text_max_chars=0), sql)
+
+
+class MaskTest(unittest.TestCase):
+    def test_cases(self):
+        # Lines of the masked SQL with their runs of blanks collapsed
+        cases = [
+            ("SELECT 'a, b' FROM t", ["SELECT FROM t"]),
+            ("SELECT count(*) FROM t", ["SELECT count FROM t"]),
+            ("SELECT a -- b, c\nFROM t", ["SELECT a", "FROM t"]),
+            ("SELECT a /* b, /* c */ d */ FROM t", ["SELECT a FROM t"]),
+            ("SELECT a /* b\nc */ FROM t", ["SELECT a", "FROM t"]),
+            ("SELECT '--' || \"/*\" FROM t", ["SELECT || FROM t"]),
+        ]
+        for sql, expected in cases:
+            with self.subTest(sql):
+                masked = mask(sql)
+                self.assertEqual(len(masked), len(sql))
+                self.assertEqual([" ".join(line.split()) for line in masked.split("\n")], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
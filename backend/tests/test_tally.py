@@ -0,0 +1,75 @@
+"""
+Reconciliation of the in-memory vote tally with changes arriving meanwhile
+
+The database reads of a recount are stubbed, so no Postgres is needed. Run
+from the backend directory with `python -m unittest discover tests` or
+`python -m pytest tests`.
+"""
+import json
+import unittest
+
+from tally import TallyEngine
+
+CANDIDATES = {1: {"name": "A", "party": "X"}, 2: {"name": "B", "party": "Y"}}
+
+
+def notification(op, candidate_id, old_candidate_id=None):
+    return json.dumps({"op": op, "candidate_id": candidate_id, "old_candidate_id": old_candidate_id})
+
+
+class StubbedTally(TallyEngine):
+    """Engine whose recount returns `counts`, running `during_recount` while it is in flight"""
+    def __init__(self, counts):
+        super().__init__()
+        self.recount = dict(counts)
+        self.during_recount = []
+
+    def _load(self):
+        counts = dict(self.recount)
+        for payload in self.during_recount:
+            self.handle_notification(payload)
+        self.during_recount = []
+        return {cid: dict(info) for cid, info in CANDIDATES.items()}, counts, 10
+
+
+class TallyReconcileTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = StubbedTally({1: 5, 2: 3})
+        self.engine.bootstrap()
+
+    def test_changes_during_recount_are_kept(self):
+        # The recount read the table before these votes were committed
+        self.engine.during_recount = [notification("insert", 1), notification("insert", 2),
+                                      notification("update", 1, old_candidate_id=2)]
+        self.engine.bootstrap()
+        self.assertEqual(dict(self.engine.counts), {1: 7, 2: 3})
+        self.assertEqual(self.engine.total_votes, 10)
+        self.assertEqual(self.engine.party_counts["X"], 7)
+        self.assertEqual(self.engine.last_drift, 0)
+
+    def test_drift_outside_recount_is_corrected(self):
+        # A vote whose notification was missed
+        self.engine.recount = {1: 6, 2: 3}
+        self.engine.bootstrap()
+        self.assertEqual(dict(self.engine.counts), {1: 6, 2: 3})
+        self.assertEqual(self.engine.last_drift, 1)
+
+    def test_changes_after_recount_are_applied_once(self):
+        self.engine.bootstrap()
+        self.engine.handle_notification(notification("delete", 2))
+        self.assertEqual(dict(self.engine.counts), {1: 5, 2: 2})
+        self.assertEqual(self.engine._pending, [])
+
+    def test_failed_recount_keeps_counts(self):
+        def fail():
+            raise RuntimeError("database is down")
+        self.engine._load = fail
+        with self.assertRaises(RuntimeError):
+            self.engine.bootstrap()
+        self.engine.handle_notification(notification("insert", 1))
+        self.assertEqual(dict(self.engine.counts), {1: 6, 2: 3})
+        self.assertEqual(self.engine._pending, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,8 @@ import os
 import logging
 from vanna.remote import VannaDefault
 from dotenv import load_dotenv
-from db_utils import get_connection_string, get_db_schema
+from db_utils import get_connection_string, get_db_schema, FALLBACK_SCHEMA_DDL
+from schema_pruning import table_statements
 
 # Load environment variables
 load_dotenv()
@@ -11,10 +12,14 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def initialize_vanna():
+def initialize_vanna(connection_string=None, model="votebank"):
     """
     Initialize Vanna AI with proper configuration
     
+    Args:
+        connection_string: PostgreSQL URL, the default database when omitted
+        model: Vanna model name, one per database
+        
     Returns:
         VannaDefault: Configured Vanna AI instance
     """
@@ -30,10 +35,10 @@ def initialize_vanna():
     # Initialize Vanna with API key, model, and connection string
     logger.info("Initializing Vanna AI...")
     vn = VannaDefault(
-        model="votebank",  # Model name for your VoteBank database
+        model=model,
         api_key=api_key,
         config={
-            "postgres_connection_string": get_connection_string(),
+            "postgres_connection_string": connection_string or get_connection_string(),
             "user_email": email  # Try using user_email instead of email
         }
     )
@@ -55,48 +60,30 @@ def connect_to_database(vn):
     logger.info("PostgreSQL connection already established in initialization")
     return vn
 
-def train_with_schema(vn):
+def train_with_schema(vn, schema_ddl=None):
     """
     Train Vanna AI with database schema
     
     Args:
         vn (VannaDefault): Vanna AI instance
+        schema_ddl (str): Schema to train on, read from the default database when omitted
     """
     try:
         logger.info("Training Vanna AI with database schema...")
         
         # Get schema DDL from the database
-        schema_ddl = get_db_schema()
+        if schema_ddl is None:
+            schema_ddl = get_db_schema()
         
         # If we couldn't get the schema from the database, use a fallback schema
         if not schema_ddl:
-            # Fallback schema
-            schema_ddl = """
-                CREATE TABLE users (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-
-                CREATE TABLE candidates (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) NOT NULL,
-                    party VARCHAR(100) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-
-                CREATE TABLE votes (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    candidate_id INTEGER REFERENCES candidates(id),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id)
-                );
-            """
+            schema_ddl = FALLBACK_SCHEMA_DDL
         
-        # Add schema DDL to Vanna AI
-        vn.add_ddl(schema_ddl)
+        # Add schema DDL to Vanna AI one table at a time, so its retrieval
+        # puts only the related tables in the prompt instead of the whole schema
+        statements = [statement for _, statement in table_statements(schema_ddl)] or [schema_ddl]
+        for statement in statements:
+            vn.add_ddl(statement)
         logger.info("Successfully trained Vanna AI with schema")
     except Exception as e:
         logger.error(f"Error training with schema: {str(e)}")
@@ -104,6 +91,57 @@ def train_with_schema(vn):
     
     return vn
 
+# Example question-SQL pairs, also the catalog of precomputed questions
+TRAINING_EXAMPLES = [
+    {
+        "question": "How many votes does each candidate have?",
+        "sql": """
+            SELECT c.name, c.party_affiliation AS party, COUNT(v.id) as vote_count 
+            FROM candidates c
+            LEFT JOIN votes v ON c.id = v.candidate_id
+            GROUP BY c.id, c.name, c.party_affiliation
+            ORDER BY vote_count DESC
+        """
+    },
+    {
+        "question": "Who are the top 5 candidates by vote count?",
+        "sql": """
+            SELECT c.name, c.party_affiliation AS party, COUNT(v.id) as vote_count 
+            FROM candidates c
+            LEFT JOIN votes v ON c.id = v.candidate_id
+            GROUP BY c.id, c.name, c.party_affiliation
+            ORDER BY vote_count DESC
+            LIMIT 5
+        """
+    },
+    {
+        "question": "Which users have not voted yet?",
+        "sql": """
+            SELECT u.id, u.username, u.email
+            FROM users u
+            LEFT JOIN votes v ON u.id = v.user_id
+            WHERE v.id IS NULL
+        """
+    },
+    {
+        "question": "Which candidates promised free healthcare?",
+        "sql": """
+            SELECT c.id, c.name, c.party_affiliation, c.constituency
+            FROM candidates c
+            WHERE c.campaign_promises_search @@ websearch_to_tsquery('english', 'free healthcare')
+            ORDER BY ts_rank(c.campaign_promises_search, websearch_to_tsquery('english', 'free healthcare')) DESC
+        """
+    },
+    {
+        "question": "Which candidates are on Twitter?",
+        "sql": """
+            SELECT c.id, c.name, c.party_affiliation, c.social_media_handles
+            FROM candidates c
+            WHERE c.social_media_handles ? 'twitter'
+        """
+    }
+]
+
 def train_with_examples(vn):
     """
     Train Vanna AI with example questions and SQL queries
@@ -114,46 +152,12 @@ def train_with_examples(vn):
     Returns:
         VannaDefault: Trained Vanna AI instance
     """
-    # Define example question-SQL pairs
-    examples = [
-        {
-            "question": "How many votes does each candidate have?",
-            "sql": """
-                SELECT c.name, c.party, COUNT(v.id) as vote_count 
-                FROM candidates c
-                LEFT JOIN votes v ON c.id = v.candidate_id
-                GROUP BY c.id, c.name, c.party
-                ORDER BY vote_count DESC
-            """
-        },
-        {
-            "question": "Who are the top 5 candidates by vote count?",
-            "sql": """
-                SELECT c.name, c.party, COUNT(v.id) as vote_count 
-                FROM candidates c
-                LEFT JOIN votes v ON c.id = v.candidate_id
-                GROUP BY c.id, c.name, c.party
-                ORDER BY vote_count DESC
-                LIMIT 5
-            """
-        },
-        {
-            "question": "Which users have not voted yet?",
-            "sql": """
-                SELECT u.id, u.name, u.email
-                FROM users u
-                LEFT JOIN votes v ON u.id = v.user_id
-                WHERE v.id IS NULL
-            """
-        }
-    ]
-    
     # Train with examples
     try:
         logger.info("Training Vanna AI with example questions and SQL queries...")
-        for example in examples:
+        for example in TRAINING_EXAMPLES:
             vn.train(question=example["question"], sql=example["sql"])
-        logger.info(f"Successfully trained Vanna AI with {len(examples)} examples")
+        logger.info(f"Successfully trained Vanna AI with {len(TRAINING_EXAMPLES)} examples")
     except Exception as e:
         logger.error(f"Error training with examples: {str(e)}")
         raise
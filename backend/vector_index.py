@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from schema_pruning import table_statements
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Dimensions of the hashed embedding space
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "1024"))
+# Where the index is persisted between runs
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "vector_index.npz")
+
+KIND_DDL = "ddl"
+KIND_EXAMPLE = "example"
+
+# Bumped whenever features or chunking change, so stale persisted indexes are rebuilt
+EMBEDDER_VERSION = 2
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def features(text: str) -> List[str]:
+    """
+    Features of a text: words, the parts of snake_case identifiers and
+    character trigrams, so 'vote_count' also matches 'votes' and 'count'
+    """
+    words = _WORD.findall(text.lower().replace("_", " "))
+    result = list(words)
+    for word in words:
+        padded = f"#{word}#"
+        result.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class HashingEmbedder:
+    """
+    Embeds text by hashing its features into a fixed number of dimensions
+
+    Needs no model and no network, and gives the same vector for the same
+    text in every process, which is what a persisted index requires.
+    """
+    def __init__(self, dim: int = VECTOR_DIM):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """L2-normalized float32 matrix with one row per text"""
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(h % self.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)),
+                  np.asarray(signs, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+def split_ddl(schema_ddl: str) -> List[Dict[str, Any]]:
+    """One DDL chunk per CREATE TABLE statement"""
+    return [{"kind": KIND_DDL, "table": table, "text": statement}
+            for table, statement in table_statements(schema_ddl)]
+
+
+def example_entries(examples: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Index entries of question/SQL training pairs, matched on their question"""
+    return [
+        {"kind": KIND_EXAMPLE, "text": example["question"], "sql": example["sql"].strip()}
+        for example in examples
+    ]
+
+
+class VectorIndex:
+    """
+    Dense matrix of entry embeddings with top-k cosine search
+
+    Rows are unit vectors, so one matrix-vector product scores every entry.
+    """
+    def __init__(self, embedder: Optional[HashingEmbedder] = None):
+        self.embedder = embedder or HashingEmbedder()
+        self.entries: List[Dict[str, Any]] = []
+        self.matrix = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self.kinds = np.zeros(0, dtype="<U16")
+        self.fingerprint = ""
+        self.searches = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, entries: List[Dict[str, Any]]):
+        """Embed and append entries, each with at least a 'text' key"""
+        if not entries:
+            return
+        vectors = self.embedder.embed([entry["text"] for entry in entries])
+        self.matrix = np.vstack([self.matrix, vectors])
+        self.kinds = np.concatenate([self.kinds, [entry["kind"] for entry in entries]])
+        self.entries.extend(entries)
+
+    def search(self, query: str, k: int = 5, kind: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        The `k` entries most similar to `query`
+
+        Returns:
+            list: (cosine similarity, entry) pairs, best first
+        """
+        self.searches += 1
+        if not self.entries or k <= 0:
+            return []
+        scores = self.matrix @ self.embedder.embed([query])[0]
+        if kind is not None:
+            scores = np.where(self.kinds == kind, scores, -np.inf)
+        k = min(k, len(self.entries))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.entries[i]) for i in top if np.isfinite(scores[i])]
+
+    def save(self, path: str):
+        """Persist to a single .npz file, replaced atomically"""
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp, matrix=self.matrix,
+            entries=np.array(json.dumps(self.entries)),
+            meta=np.array(json.dumps({
+                "version": EMBEDDER_VERSION, "dim": self.embedder.dim, "fingerprint": self.fingerprint
+            })),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, embedder: Optional[HashingEmbedder] = None) -> Optional["VectorIndex"]:
+        """Load a persisted index, None if missing or built with other settings"""
+        index = cls(embedder)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["version"] != EMBEDDER_VERSION or meta["dim"] != index.embedder.dim:
+                    return None
+                index.matrix = data["matrix"]
+                index.entries = json.loads(str(data["entries"]))
+                index.kinds = np.array([entry["kind"] for entry in index.entries], dtype="<U16")
+                index.fingerprint = meta["fingerprint"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable vector index {path}: {str(e)}")
+            return None
+        return index
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Index counters, for the metrics endpoint"""
+        kinds = [entry["kind"] for entry in self.entries]
+        return {
+            "entries": len(self.entries),
+            "ddl_chunks": kinds.count(KIND_DDL),
+            "examples": kinds.count(KIND_EXAMPLE),
+            "searches": self.searches,
+        }
+
+
+def content_fingerprint(schema_ddl: str, examples: List[Dict[str, str]]) -> str:
+    """Hash of everything an index is built from"""
+    payload = json.dumps({"ddl": schema_ddl, "examples": examples}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def build_index(schema_ddl: str, examples: List[Dict[str, str]],
+                path: Optional[str] = VECTOR_INDEX_PATH) -> VectorIndex:
+    """
+    Index of the DDL chunks and training examples, reusing the persisted
+    index at `path` when it was built from the same content
+    """
+    fingerprint = content_fingerprint(schema_ddl, examples)
+    if path:
+        index = VectorIndex.load(path)
+        if index is not None and index.fingerprint == fingerprint:
+            logger.info(f"Loaded vector index with {len(index)} entries from {path}")
+            return index
+    index = VectorIndex()
+    index.add(split_ddl(schema_ddl))
+    index.add(example_entries(examples))
+    index.fingerprint = fingerprint
+    if path:
+        try:
+            index.save(path)
+        except OSError as e:
+            logger.warning(f"Could not persist vector index to {path}: {str(e)}")
+    logger.info(f"Built vector index with {len(index)} entries")
+    return index
+
+
+def generation_context(index: VectorIndex, question: str, tables: int = 3,
+                       examples: int = 3) -> Dict[str, Any]:
+    """
+    Retrieval context for SQL generation
+
+    Returns:
+        dict: 'ddl' chunks and 'examples' most similar to the question, each
+        with its similarity score
+    """
+    return {
+        "ddl": [dict(entry, score=score) for score, entry in index.search(question, tables, KIND_DDL)],
+        "examples": [dict(entry, score=score) for score, entry in index.search(question, examples, KIND_EXAMPLE)],
+    }
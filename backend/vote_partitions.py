@@ -0,0 +1,101 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from targets import targets, DEFAULT_TARGET, TARGET_POOL_SIZE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Partitions counted at the same time, each on its own pooled connection; at most
+# half the pool, so a recount leaves connections to the queries
+VOTE_COUNT_WORKERS = max(1, min(int(os.getenv("VOTE_COUNT_WORKERS", "4")), TARGET_POOL_SIZE // 2))
+# Seconds the list of partitions is cached
+VOTE_PARTITIONS_TTL = float(os.getenv("VOTE_PARTITIONS_TTL", "300"))
+
+PARTITIONS_SQL = """
+    SELECT child.relname AS partition
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = %s
+    ORDER BY child.relname
+"""
+
+
+class PartitionedCounter:
+    """
+    Per candidate vote counts, computed partition by partition in parallel
+
+    The votes table is hash partitioned by candidate (see init_db.py), so
+    the counts of different partitions never share a candidate and merge by
+    addition. Each partition is counted on its own pooled connection, which
+    keeps a full recount as fast as the largest partition rather than the
+    whole table. An unpartitioned table is counted with a single query.
+    The partitions are read in separate transactions, so a recount taken
+    during writes may be off by the votes cast meanwhile, like any recount
+    the tally engine reconciles.
+    """
+    def __init__(self, table: str = "votes", workers: int = VOTE_COUNT_WORKERS,
+                 connection: Optional[Callable] = None):
+        self.table = table
+        self.workers = max(1, workers)
+        self.connection = connection or (lambda: targets.get(DEFAULT_TARGET).connection())
+        self.counts = 0
+        self.last_ms: Optional[float] = None
+        self._partitions: Optional[List[str]] = None
+        self._partitions_loaded_at = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vote-count")
+        self._lock = threading.Lock()
+
+    def partitions(self) -> List[str]:
+        """Partitions of the table, empty when it is not partitioned"""
+        if self._partitions is None or time.monotonic() - self._partitions_loaded_at > VOTE_PARTITIONS_TTL:
+            with self.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(PARTITIONS_SQL, (self.table,))
+                    partitions = [row["partition"] for row in cur.fetchall()]
+            with self._lock:
+                self._partitions = partitions
+                self._partitions_loaded_at = time.monotonic()
+        return self._partitions
+
+    def _count(self, table: str) -> Dict[int, int]:
+        from psycopg2 import sql
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL(
+                    "SELECT candidate_id, COUNT(*) AS votes FROM {} GROUP BY candidate_id"
+                ).format(sql.Identifier(table)))
+                return {row["candidate_id"]: row["votes"] for row in cur.fetchall()}
+
+    def count_by_candidate(self) -> Dict[int, int]:
+        """Votes per candidate id"""
+        started = time.perf_counter()
+        partitions = self.partitions()
+        if self.workers == 1 or len(partitions) < 2:
+            counts = self._count(self.table)
+        else:
+            merged: Counter = Counter()
+            for partial in self._executor.map(self._count, partitions):
+                merged.update(partial)
+            counts = dict(merged)
+        with self._lock:
+            self.counts += 1
+            self.last_ms = round((time.perf_counter() - started) * 1000, 2)
+        return counts
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counter statistics, for the metrics endpoint"""
+        with self._lock:
+            return {
+                "partitions": len(self._partitions or []),
+                "workers": self.workers,
+                "counts": self.counts,
+                "last_ms": self.last_ms,
+            }
@@ -1,3 +1,4 @@
+import os
 import psycopg2
 from psycopg2 import sql
 
@@ -10,6 +11,81 @@ db_params = {
     "port": "5432"
 }
 
+# Hash partitions of the votes table; migrate_votes.py converts an existing unpartitioned table
+VOTE_PARTITIONS = int(os.getenv("VOTE_PARTITIONS", "16"))
+
+# Publish vote changes for the backend's in-memory tally engine
+VOTE_TRIGGERS_SQL = """
+    CREATE OR REPLACE FUNCTION notify_vote_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            PERFORM pg_notify('votes_changed', json_build_object('op', 'truncate')::text);
+            RETURN NULL;
+        ELSIF TG_OP = 'INSERT' THEN
+            PERFORM pg_notify('votes_changed', json_build_object(
+                'op', 'insert', 'candidate_id', NEW.candidate_id)::text);
+            RETURN NEW;
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('votes_changed', json_build_object(
+                'op', 'delete', 'candidate_id', OLD.candidate_id)::text);
+            RETURN OLD;
+        ELSE
+            PERFORM pg_notify('votes_changed', json_build_object(
+                'op', 'update', 'old_candidate_id', OLD.candidate_id,
+                'candidate_id', NEW.candidate_id)::text);
+            RETURN NEW;
+        END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    DROP TRIGGER IF EXISTS votes_notify ON votes;
+    CREATE TRIGGER votes_notify
+        AFTER INSERT OR DELETE OR UPDATE OF candidate_id ON votes
+        FOR EACH ROW EXECUTE FUNCTION notify_vote_change();
+    
+    DROP TRIGGER IF EXISTS votes_notify_truncate ON votes;
+    CREATE TRIGGER votes_notify_truncate
+        AFTER TRUNCATE ON votes
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_vote_change();
+"""
+
+
+def create_votes_table(cur, table="votes", partitions=VOTE_PARTITIONS, id_type="SERIAL"):
+    """
+    Create the votes table hash partitioned by candidate, with its partitions
+
+    Every candidate's votes live in one partition, so per candidate counts
+    of the partitions never overlap and add up to the tally. The partition
+    key has to be part of every unique constraint, which (user_id,
+    candidate_id) already is.
+    """
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id {id_type},
+            user_id INTEGER REFERENCES users(id),
+            candidate_id INTEGER NOT NULL REFERENCES candidates(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, candidate_id),
+            UNIQUE(user_id, candidate_id)
+        ) PARTITION BY HASH (candidate_id);
+    """).format(table=sql.Identifier(table), id_type=sql.SQL(id_type)))
+    for remainder in range(partitions):
+        cur.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+                FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder});
+        """).format(
+            partition=sql.Identifier(f"{table}_p{remainder}"), table=sql.Identifier(table),
+            modulus=sql.Literal(partitions), remainder=sql.Literal(remainder)
+        ))
+
+
+def is_partitioned(cur, table="votes"):
+    """Whether `table` exists as a partitioned table"""
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p')", (table,))
+    row = cur.fetchone()
+    return row is not None and row[0] == "p"
+
+
 def init_database():
     try:
         # Connect to PostgreSQL
@@ -60,18 +136,62 @@ def init_database():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
-            
-            CREATE TABLE IF NOT EXISTS votes (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                candidate_id INTEGER REFERENCES candidates(id),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, candidate_id)
-            );
         """)
         
+        cur.execute("SELECT to_regclass('votes') IS NOT NULL")
+        if not cur.fetchone()[0] or is_partitioned(cur):
+            create_votes_table(cur)
+        else:
+            print("The votes table is not partitioned, run migrate_votes.py to convert it")
+        
         print("Database tables created successfully!")
         
+        # Indexed profile search on candidates: full-text search over the long
+        # text fields, and containment / key lookups on the JSONB documents.
+        # Adding the generated columns rewrites an existing candidates table once.
+        cur.execute("""
+            ALTER TABLE candidates
+                ADD COLUMN IF NOT EXISTS campaign_promises_search tsvector
+                    GENERATED ALWAYS AS (to_tsvector('english', coalesce(campaign_promises, ''))) STORED,
+                ADD COLUMN IF NOT EXISTS education_search tsvector
+                    GENERATED ALWAYS AS (to_tsvector('english', coalesce(education, ''))) STORED,
+                ADD COLUMN IF NOT EXISTS profile_search tsvector
+                    GENERATED ALWAYS AS (
+                        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+                        setweight(to_tsvector('english', coalesce(campaign_promises, '')), 'B') ||
+                        setweight(to_tsvector('english', coalesce(education, '')), 'B') ||
+                        setweight(to_tsvector('english', coalesce(occupation, '')), 'C') ||
+                        setweight(to_tsvector('english', coalesce(previous_political_experience, '')), 'C') ||
+                        setweight(to_tsvector('english', coalesce(campaign_strategy, '')), 'D') ||
+                        setweight(to_tsvector('english', coalesce(media_strategy, '')), 'D') ||
+                        setweight(to_tsvector('english', coalesce(voter_outreach_plan, '')), 'D')
+                    ) STORED;
+            
+            -- WHERE campaign_promises_search @@ websearch_to_tsquery('english', 'free healthcare')
+            CREATE INDEX IF NOT EXISTS candidates_campaign_promises_search_idx
+                ON candidates USING GIN (campaign_promises_search);
+            CREATE INDEX IF NOT EXISTS candidates_education_search_idx
+                ON candidates USING GIN (education_search);
+            CREATE INDEX IF NOT EXISTS candidates_profile_search_idx
+                ON candidates USING GIN (profile_search);
+            
+            -- WHERE social_media_handles ? 'twitter' (key lookups need the default jsonb_ops)
+            CREATE INDEX IF NOT EXISTS candidates_social_media_handles_idx
+                ON candidates USING GIN (social_media_handles);
+            -- WHERE target_voter_demographics @> '{"groups": ["youth"]}' (containment only)
+            CREATE INDEX IF NOT EXISTS candidates_target_voter_demographics_idx
+                ON candidates USING GIN (target_voter_demographics jsonb_path_ops);
+            CREATE INDEX IF NOT EXISTS candidates_campaign_timeline_idx
+                ON candidates USING GIN (campaign_timeline jsonb_path_ops);
+        """)
+        
+        print("Candidate search indexes created successfully!")
+        
+        # Publish vote changes for the backend's in-memory tally engine
+        cur.execute(VOTE_TRIGGERS_SQL)
+        
+        print("Vote change notifications installed successfully!")
+        
         # Close the cursor and connection
         cur.close()
         conn.close()
@@ -0,0 +1,200 @@
+"""
+Convert an existing votes table to the hash partitioned layout of init_db.py
+
+The rows are copied in batches while votes stays writable; a trigger
+mirrors the changes made meanwhile. The trigger is installed together with
+reading the highest existing id, under a lock blocking writes for that
+instant, so every vote is either below that id and copied in batches, or
+above it and mirrored. The copy position is kept in a progress table. The tables are
+then swapped under a short exclusive lock, keeping the id sequence and the
+vote change notifications. The old table is kept as votes_unpartitioned
+unless --drop-old is given. An interrupted copy resumes where it stopped.
+A vote updated in the instant its own batch is copied may keep its old
+version, so prefer a window without vote corrections.
+
+Usage:
+    python migrate_votes.py [--partitions 16] [--batch-size 50000] [--drop-old]
+    python migrate_votes.py --status
+"""
+import time
+import argparse
+import psycopg2
+from psycopg2 import sql
+
+from init_db import db_params, create_votes_table, is_partitioned, VOTE_PARTITIONS, VOTE_TRIGGERS_SQL
+
+NEW_TABLE = "votes_partitioned"
+OLD_TABLE = "votes_unpartitioned"
+# Copy position, kept apart from the mirrored table so mirrored rows cannot move it
+PROGRESS_TABLE = "votes_migration_progress"
+COLUMNS = "id, user_id, candidate_id, created_at"
+
+MIRROR_SQL = f"""
+    CREATE OR REPLACE FUNCTION mirror_vote_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            DELETE FROM {NEW_TABLE} WHERE id = OLD.id AND candidate_id = OLD.candidate_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.candidate_id IS NOT NULL THEN
+            INSERT INTO {NEW_TABLE} ({COLUMNS})
+            VALUES (NEW.id, NEW.user_id, NEW.candidate_id, NEW.created_at)
+            ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS votes_mirror ON votes;
+    CREATE TRIGGER votes_mirror
+        AFTER INSERT OR DELETE OR UPDATE ON votes
+        FOR EACH ROW EXECUTE FUNCTION mirror_vote_change();
+"""
+
+
+def status(cur):
+    """Print the layout of the votes table"""
+    if not is_partitioned(cur):
+        cur.execute("SELECT to_regclass('votes') IS NOT NULL")
+        print("votes is not partitioned" if cur.fetchone()[0] else "votes does not exist")
+        return
+    cur.execute("""
+        SELECT child.relname, child.reltuples::bigint
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'votes'::regclass
+        ORDER BY child.relname
+    """)
+    rows = cur.fetchall()
+    print(f"votes has {len(rows)} partitions (estimated rows):")
+    for name, estimate in rows:
+        print(f"  {name}: {max(estimate, 0)}")
+
+
+def start_copy(conn, partitions):
+    """
+    Create the partitioned table, the mirror trigger and the progress row,
+    unless an earlier run already did
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (PROGRESS_TABLE,))
+        if cur.fetchone()[0]:
+            print("Resuming an interrupted migration")
+            return
+        # The id column gets its default from the old sequence at the swap
+        create_votes_table(cur, NEW_TABLE, partitions, id_type="INTEGER NOT NULL")
+        # Writes wait while the trigger goes in and the last existing id is read
+        cur.execute("LOCK TABLE votes IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute(MIRROR_SQL)
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM votes")
+        max_id = cur.fetchone()[0]
+        cur.execute(sql.SQL("CREATE TABLE {} (copied_id INTEGER NOT NULL, max_id INTEGER NOT NULL)")
+                    .format(sql.Identifier(PROGRESS_TABLE)))
+        cur.execute(sql.SQL("INSERT INTO {} VALUES (0, %s)").format(sql.Identifier(PROGRESS_TABLE)), (max_id,))
+    conn.commit()
+    print(f"Created {NEW_TABLE} with {partitions} partitions, copying votes up to id {max_id}")
+
+
+def copy_batches(conn, batch_size):
+    """Copy the votes older than the mirror trigger, one committed batch at a time"""
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT copied_id, max_id FROM {}").format(sql.Identifier(PROGRESS_TABLE)))
+        last_id, max_id = cur.fetchone()
+    conn.commit()
+    copied, started = 0, time.time()
+    while last_id < max_id:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(id) FROM (SELECT id FROM votes WHERE id > %s AND id <= %s ORDER BY id LIMIT %s) batch",
+                        (last_id, max_id, batch_size))
+            upper = cur.fetchone()[0]
+            if upper is None:
+                upper = max_id
+            cur.execute(f"""
+                INSERT INTO {NEW_TABLE} ({COLUMNS})
+                SELECT {COLUMNS} FROM votes
+                WHERE id > %s AND id <= %s AND candidate_id IS NOT NULL
+                ON CONFLICT DO NOTHING
+            """, (last_id, upper))
+            copied += cur.rowcount
+            cur.execute(sql.SQL("UPDATE {} SET copied_id = %s").format(sql.Identifier(PROGRESS_TABLE)), (upper,))
+        conn.commit()
+        last_id = upper
+        rate = copied / max(time.time() - started, 1e-6)
+        print(f"Copied votes up to id {last_id} of {max_id} ({copied} rows, {rate:.0f} rows/s)")
+    return last_id
+
+
+def swap(conn, last_id, drop_old):
+    """
+    Copy any rows after `last_id` the trigger did not mirror and put the
+    partitioned table in place of votes
+    """
+    with conn.cursor() as cur:
+        cur.execute("LOCK TABLE votes IN ACCESS EXCLUSIVE MODE")
+        cur.execute(f"""
+            INSERT INTO {NEW_TABLE} ({COLUMNS})
+            SELECT {COLUMNS} FROM votes WHERE id > %s AND candidate_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """, (last_id,))
+        cur.execute("SELECT COUNT(*) FROM votes WHERE candidate_id IS NULL")
+        skipped = cur.fetchone()[0]
+        cur.execute("DROP TRIGGER votes_mirror ON votes")
+        cur.execute("DROP FUNCTION mirror_vote_change()")
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(PROGRESS_TABLE)))
+        cur.execute("DROP TRIGGER IF EXISTS votes_notify ON votes")
+        cur.execute("DROP TRIGGER IF EXISTS votes_notify_truncate ON votes")
+        cur.execute(sql.SQL("ALTER TABLE votes RENAME TO {}").format(sql.Identifier(OLD_TABLE)))
+        cur.execute(sql.SQL("ALTER TABLE {} RENAME TO votes").format(sql.Identifier(NEW_TABLE)))
+        cur.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = 'votes'::regclass
+        """)
+        for (partition,) in cur.fetchall():
+            cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                sql.Identifier(partition), sql.Identifier("votes" + partition[len(NEW_TABLE):])
+            ))
+        # New votes keep drawing ids from the sequence of the old table
+        cur.execute("ALTER TABLE votes ALTER COLUMN id SET DEFAULT nextval('votes_id_seq')")
+        cur.execute("ALTER SEQUENCE votes_id_seq OWNED BY votes.id")
+        cur.execute(VOTE_TRIGGERS_SQL)
+        if drop_old:
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(OLD_TABLE)))
+    conn.commit()
+    if skipped:
+        print(f"Skipped {skipped} votes without a candidate, which the partitioned table cannot hold")
+
+
+def migrate(partitions=VOTE_PARTITIONS, batch_size=50000, drop_old=False):
+    conn = psycopg2.connect(**db_params)
+    try:
+        with conn.cursor() as cur:
+            if is_partitioned(cur):
+                print("votes is already partitioned")
+                return
+        conn.commit()
+        start_copy(conn, partitions)
+        last_id = copy_batches(conn, batch_size)
+        swap(conn, last_id, drop_old)
+        print("votes is now partitioned" + ("" if drop_old else f", the old table is kept as {OLD_TABLE}"))
+    except Exception as e:
+        conn.rollback()
+        print(f"Error migrating votes: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition the votes table")
+    parser.add_argument("--partitions", type=int, default=VOTE_PARTITIONS)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--drop-old", action="store_true", help="Drop the unpartitioned table after the swap")
+    parser.add_argument("--status", action="store_true", help="Show the current layout and exit")
+    args = parser.parse_args()
+    if args.status:
+        connection = psycopg2.connect(**db_params)
+        with connection.cursor() as cursor:
+            status(cursor)
+        connection.close()
+    else:
+        migrate(args.partitions, args.batch_size, args.drop_old)